@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+__all__ = ['ChunkDispatcher', 'LocalLauncher', 'SshLauncher', 'dispatch_chunks', 'read_nodefile', 'run_host', 'run_worker']
+
+'''
+    Readme:
+        ChunkDispatcher run func on every chunk of a slicer with workers on all nodes of a PBS job (PBS_NODEFILE),
+        results are gathered back and yielded in order of pointers, same as chunk_reader.map_chunks on one node.
+    Scheme:
+        The driver listen on a TCP port (multiprocessing.connection, authkey is random for every run),
+        a launcher start the workers, every worker connect back, get func and chunk pointers (not data),
+        read the chunk by chunk_reader.ChunkReader from the shared file system and send the result back.
+        mode: 'dynamic' the driver is a central queue, every worker has prefetch chunks at most, an idle worker gets the next one.
+            'static' chunks are split into one contiguous part per worker up front, no message between chunks.
+        A worker which is lost (node down, killed ...) gives its unfinished chunks back to the queue, other workers do them.
+    Launcher:
+        LocalLauncher: worker processes on this machine (localhost socket), to test a job on one node.
+        SshLauncher: one ssh (or rsh, same as mpirun -launcher rsh) per node of PBS_NODEFILE, it starts slots workers on the node,
+            the package and the module of func must be importable on every node (shared file system), PYTHONPATH and
+            current folder of the driver are passed to the nodes.
+        A new transport is a class with driver_host(), slots(), start(address, authkey), alive() and stop(),
+            worker_command(address, slots) give the command line to start workers by other tools (mpirun ...),
+            the authkey is written to its stdin (hex and a newline), it is never in a command line.
+    Usage:
+        from chunk_dispatch import dispatch_chunks
+        def count_lines(c):
+            return c.tobytes().count(b'\\n')
+        total_lines = sum(dispatch_chunks(count_lines, MultiFileSlicer([fp1, fp2], 100000))) #all nodes of the PBS job
+        total_lines = sum(dispatch_chunks(count_lines, slicer, LocalLauncher(4), mode = 'static')) #4 local workers
+'''
+
+import os
+import sys
+import time
+import queue
+import socket
+import threading
+import subprocess
+import numpy as np
+import multiprocessing as mp
+
+from typing import Any, Callable, Iterator, List, Tuple, Union
+from collections import deque
+from multiprocessing.connection import Client, Listener, wait
+from .pointer_table import PointerTable
+from .chunk_reader import ChunkReader
+
+MODES = ['dynamic', 'static']
+
+def read_nodefile(file:str = '') -> List[Tuple[str, int]]:
+    '''
+        [(host, slots), ...] in order of first appearance, PBS_NODEFILE has one line for every CPU
+    '''
+    file = file or os.environ.get('PBS_NODEFILE', '')
+    if file == '' or not os.path.exists(file):
+        raise FileNotFoundError("PBS_NODEFILE %s is not found!" % file)
+    hosts = {}
+    with open(file) as input_handle:
+        for line in input_handle:
+            if line.strip():
+                hosts[line.strip()] = hosts.get(line.strip(), 0) + 1
+    return list(hosts.items())
+
+def run_worker(address:tuple, authkey:bytes, name:str = '') -> None:
+    '''
+        Worker loop: connect to the driver, run func on every chunk it gets until stop
+    '''
+    conn = Client(tuple(address), authkey = authkey)
+    try:
+        conn.send(('hello', name or '%s:%d' % (socket.gethostname(), os.getpid())))
+        _, func, args = conn.recv()
+        with ChunkReader() as reader:
+            while True:
+                message = conn.recv()
+                if message[0] == 'stop':
+                    break
+                for index, file, begin_pointer, end_pointer in message[1]:
+                    try:
+                        result = ('result', index, func(reader.read(file, begin_pointer, end_pointer), *args))
+                    except Exception as e:
+                        result = ('error', index, e)
+                    conn.send(result)
+    except EOFError:
+        #the driver is gone
+        pass
+    finally:
+        conn.close()
+
+def run_host(address:tuple, authkey:bytes, slots:int) -> None:
+    '''
+        Start slots workers on this node and wait for them, the entry of SshLauncher
+    '''
+    workers = [mp.Process(target = run_worker, args = (address, authkey, '%s:%d' % (socket.gethostname(), i))) for i in range(slots)]
+    for every_worker in workers:
+        every_worker.start()
+    for every_worker in workers:
+        every_worker.join()
+
+def worker_command(address:tuple, slots:int, python:str = '') -> str:
+    '''
+        Shell command to start slots workers on a node, the package, PYTHONPATH and folder of this process are used.
+        The authkey is read from the first line of stdin (hex), so it is not in the command line (ps, /proc/*/cmdline) of the node
+    '''
+    #the folder which has the top package (file_line_split, or unclassified for unclassified.file_line_split)
+    package_parent = os.path.dirname(os.path.abspath(__file__))
+    for _ in __package__.split('.'):
+        package_parent = os.path.dirname(package_parent)
+    python_path = os.pathsep.join(dict.fromkeys([package_parent] + [os.path.abspath(i) for i in sys.path if i and os.path.isdir(i)]))
+    code = 'import sys; from %s.chunk_dispatch import run_host; run_host((%r, %d), bytes.fromhex(sys.stdin.readline().strip()), %d)' % (
+        __package__, address[0], address[1], slots)
+    return 'cd %s && PYTHONPATH=%s %s -c "%s"' % (quote(os.getcwd()), quote(python_path), python or sys.executable, code)
+
+def quote(text:str) -> str:
+    return "'" + text.replace("'", "'\\''") + "'"
+
+class LocalLauncher:
+    '''
+        workers processes on this machine, 0 is the number of CPUs
+    '''
+    def __init__(self, workers:int = 0) -> None:
+        self.workers = workers if workers > 0 else os.cpu_count()
+        self.processes = []
+
+    def driver_host(self) -> str:
+        return '127.0.0.1'
+
+    def slots(self) -> int:
+        return self.workers
+
+    def start(self, address:tuple, authkey:bytes) -> None:
+        self.processes = [mp.Process(target = run_worker, args = (address, authkey, 'localhost:%d' % i), daemon = True) for i in range(self.workers)]
+        for every_process in self.processes:
+            every_process.start()
+
+    def alive(self) -> bool:
+        return any(i.is_alive() for i in self.processes)
+
+    def stop(self, timeout:float = 10) -> None:
+        for every_process in self.processes:
+            every_process.join(timeout)
+            if every_process.is_alive():
+                every_process.terminate()
+                every_process.join()
+        self.processes = []
+
+class SshLauncher:
+    '''
+        One rsh per node, hosts is [(host, slots), ...], read_nodefile() by default
+    '''
+    def __init__(self, hosts:Union[List[Tuple[str, int]], None] = None, rsh:str = 'ssh', python:str = '') -> None:
+        self.hosts = read_nodefile() if hosts is None else hosts
+        self.rsh = rsh
+        self.python = python
+        self.processes = []
+
+    def driver_host(self) -> str:
+        return socket.gethostname()
+
+    def slots(self) -> int:
+        return sum(i[1] for i in self.hosts)
+
+    def start(self, address:tuple, authkey:bytes) -> None:
+        for host, slots in self.hosts:
+            command = worker_command(address, slots, self.python)
+            process = subprocess.Popen([self.rsh, host, command], stdin = subprocess.PIPE)
+            #the authkey goes through stdin of ssh, the command line is seen by every user of the nodes
+            try:
+                process.stdin.write(authkey.hex().encode() + b'\n')
+                process.stdin.close()
+            except BrokenPipeError:
+                #rsh failed, alive() and the lost workers handle it
+                pass
+            self.processes.append(process)
+
+    def alive(self) -> bool:
+        return any(i.poll() is None for i in self.processes)
+
+    def stop(self, timeout:float = 10) -> None:
+        for every_process in self.processes:
+            try:
+                every_process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                every_process.terminate()
+                every_process.wait()
+        self.processes = []
+
+class ChunkDispatcher:
+    '''
+        for result in ChunkDispatcher(func, MultiFileSlicer([fp1, fp2], 100000), SshLauncher()):
+            ...
+        func: func(memoryview, *args), it must be a module level function, it is pickled to the workers.
+        source: a slicer object (with pointers attr), a PointerTable or a [(file_path, begin_pointer, end_pointer), ...] list.
+        connect_timeout: seconds to wait for the first worker.
+    '''
+    def __init__(self, func:Callable, source:Union[object, PointerTable, List[tuple]], launcher:Any = None, mode:str = 'dynamic',
+        args:tuple = (), prefetch:int = 2, connect_timeout:float = 300) -> None:
+        if mode not in MODES:
+            raise ValueError("mode is must be one of %s, but now is %s" % (MODES, mode))
+        if prefetch < 1:
+            raise ValueError("prefetch is must be ge 1, but now is %d" % prefetch)
+        if launcher is None:
+            launcher = SshLauncher() if os.environ.get('PBS_NODEFILE', '') else LocalLauncher()
+        pointers = source.pointers if hasattr(source, 'pointers') else source
+        self.tasks = [(index, str(i[0]), int(i[1]), int(i[2])) for index, i in enumerate(pointers)]
+        self.func = func
+        self.launcher = launcher
+        self.mode = mode
+        self.args = args
+        self.prefetch = prefetch
+        self.connect_timeout = connect_timeout
+        #chunks done by every worker
+        self.worker_tasks = {}
+
+    def __iter__(self) -> Iterator:
+        return self.run()
+
+    def run(self) -> Iterator:
+        if len(self.tasks) == 0:
+            #no worker is started, a worker connecting after the listener is closed would wait until it is killed
+            return None
+        authkey = os.urandom(16)
+        listener = Listener(('' if self.launcher.driver_host() != '127.0.0.1' else '127.0.0.1', 0), authkey = authkey)
+        new_conns, closed = queue.Queue(), threading.Event()
+        threading.Thread(target = accept_loop, args = (listener, new_conns, closed), daemon = True).start()
+        self.launcher.start((self.launcher.driver_host(), listener.address[1]), authkey)
+        #pending chunks of the queue, static parts wait for the workers in order of connection
+        self.pending = deque(i[0] for i in self.tasks) if self.mode == 'dynamic' else deque()
+        self.parts = deque(np.array_split(np.arange(len(self.tasks)), max(self.launcher.slots(), 1))) if self.mode == 'static' else deque()
+        self.outstanding, self.names, self.lost_workers = {}, {}, 0
+        results, next_index, begin_time = {}, 0, time.time()
+        try:
+            while next_index < len(self.tasks):
+                while not new_conns.empty():
+                    self.outstanding[new_conns.get()] = set()
+                for conn in wait(list(self.outstanding), timeout = 0.1):
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        self.lost(conn)
+                        continue
+                    if message[0] == 'hello':
+                        self.names[conn] = message[1]
+                        conn.send(('setup', self.func, self.args))
+                        self.feed()
+                    elif message[0] == 'result':
+                        results[message[1]] = message[2]
+                        self.outstanding[conn].discard(message[1])
+                        self.worker_tasks[self.names[conn]] = self.worker_tasks.get(self.names[conn], 0) + 1
+                        self.feed()
+                    else:
+                        raise message[2]
+                while next_index in results:
+                    yield results.pop(next_index)
+                    next_index += 1
+                if not self.outstanding and new_conns.empty():
+                    #names of lost workers are removed, so the lost count tell a dead job from a job never connected
+                    if self.lost_workers > 0 and not self.launcher.alive():
+                        raise RuntimeError("all workers are lost, %d of %d chunks are done!" % (next_index, len(self.tasks)))
+                    if self.lost_workers == 0 and (time.time() - begin_time > self.connect_timeout or not self.launcher.alive()):
+                        raise TimeoutError("no worker connect to the driver in %d seconds!" % self.connect_timeout)
+        finally:
+            for conn in list(self.outstanding):
+                try:
+                    conn.send(('stop',))
+                    conn.close()
+                except OSError:
+                    pass
+            #wake up the accept thread, then close the listener
+            closed.set()
+            try:
+                socket.create_connection(('127.0.0.1', listener.address[1]), timeout = 1).close()
+            except OSError:
+                pass
+            listener.close()
+            self.launcher.stop()
+
+    def send(self, conn:Any, indexes:List[int]) -> None:
+        self.outstanding[conn].update(indexes)
+        conn.send(('tasks', [self.tasks[i] for i in indexes]))
+
+    def feed(self) -> None:
+        '''
+            Give pending chunks to the workers, up to prefetch chunks per worker, a static worker only get chunks of lost workers
+        '''
+        for conn in self.outstanding:
+            if conn not in self.names:
+                continue
+            if self.mode == 'static':
+                if self.outstanding[conn]:
+                    continue
+                if self.parts:
+                    #the next part, a node may start fewer workers than slots
+                    self.send(conn, self.parts.popleft().tolist())
+                    continue
+            while self.pending and len(self.outstanding[conn]) < self.prefetch:
+                self.send(conn, [self.pending.popleft()])
+
+    def lost(self, conn:Any) -> None:
+        '''
+            A worker is gone, its chunks go back to the queue
+        '''
+        self.pending.extendleft(sorted(self.outstanding.pop(conn), reverse = True))
+        self.names.pop(conn, None)
+        self.lost_workers += 1
+        conn.close()
+        self.feed()
+
+def accept_loop(listener:Listener, new_conns:queue.Queue, closed:threading.Event) -> None:
+    while not closed.is_set():
+        try:
+            new_conns.put(listener.accept())
+        except Exception:
+            #a bad authkey or a port scan, wait for the next one, or the listener is closed
+            continue
+
+def dispatch_chunks(func:Callable, source:Union[object, PointerTable, List[tuple]], launcher:Any = None, mode:str = 'dynamic',
+    args:tuple = (), prefetch:int = 2) -> Iterator:
+    '''
+        Yield func result of every chunk in order of pointers, see ChunkDispatcher
+    '''
+    return iter(ChunkDispatcher(func, source, launcher, mode, args, prefetch))
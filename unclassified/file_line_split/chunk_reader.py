@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+__all__ = ['ChunkReader', 'map_chunks']
+
+'''
+    Readme:
+        ChunkReader mmap every file once and return memoryview of (begin_pointer, end_pointer), no copy of chunk data.
+        gzip file can not be mapped, the chunk is decompressed by gzip_split.GzipChunkReader and memoryview of the data is returned.
+        map_chunks run func on every chunk of the slicer result with a process pool, every process has its own ChunkReader.
+    Options:
+        func: func(memoryview, *args), it must be a module level function, because it is pickled to child process.
+            The memoryview is only valid in the child process, return a result which can be pickled, not the memoryview.
+        source: a slicer object (with pointers attr), a PointerTable or a [(file_path, begin_pointer, end_pointer), ...] list.
+        processes: number of child processes, 0 run func in this process.
+        ordered: True yield results in order of pointers, False yield (index, result) as soon as a chunk is done.
+        max_inflight: max number of chunks submitted but not yielded, default is processes * 4,
+            so memory of this process does not grow with file size.
+'''
+
+import mmap
+import queue
+import multiprocessing as mp
+
+from typing import Any, Callable, Iterator, List, Union
+from collections import deque
+from .pointer_table import PointerTable
+from .gzip_split import GzipChunkReader, is_gzip
+
+class ChunkReader:
+    '''
+        from chunk_reader import ChunkReader
+        with ChunkReader() as reader:
+            for every_block in FileSlicer([fp1, fp2], 100000).pointers:
+                c = reader.read(*every_block) #c is memoryview of data
+    '''
+    def __init__(self) -> None:
+        self.maps = {}
+
+    def read(self, file:str, begin_pointer:int, end_pointer:int) -> memoryview:
+        if file not in self.maps:
+            self.maps[file] = self.open(file)
+        if isinstance(self.maps[file], GzipChunkReader):
+            return memoryview(self.maps[file].read(begin_pointer, end_pointer))
+        return memoryview(self.maps[file])[begin_pointer:end_pointer]
+
+    def open(self, file:str) -> Union[mmap.mmap, bytes, GzipChunkReader]:
+        if is_gzip(file):
+            return GzipChunkReader(file)
+        with open(file, 'rb') as input_handle:
+            try:
+                return mmap.mmap(input_handle.fileno(), 0, access = mmap.ACCESS_READ)
+            except ValueError:
+                #empty file can not be mapped
+                return b''
+
+    def close(self) -> None:
+        for every_map in self.maps.values():
+            if isinstance(every_map, GzipChunkReader):
+                every_map.close()
+            elif isinstance(every_map, mmap.mmap):
+                try:
+                    every_map.close()
+                except BufferError:
+                    #a memoryview of this map is still alive, it is closed by gc
+                    pass
+        self.maps = {}
+
+    def __enter__(self) -> 'ChunkReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+#ChunkReader of child process, one for every process
+worker_reader = None
+
+def init_worker() -> None:
+    global worker_reader
+    worker_reader = ChunkReader()
+
+def call_chunk(func:Callable, args:tuple, file:str, begin_pointer:int, end_pointer:int) -> Any:
+    if worker_reader is None:
+        init_worker()
+    return func(worker_reader.read(file, begin_pointer, end_pointer), *args)
+
+def map_chunks(func:Callable, source:Union[object, PointerTable, List[tuple]], processes:int = 5, ordered:bool = True,
+    max_inflight:int = 0, args:tuple = ()) -> Iterator:
+    '''
+        from chunk_reader import map_chunks
+        def count_lines(c):
+            return c.tobytes().count(b'\\n')
+        total_lines = sum(map_chunks(count_lines, MultiFileSlicer([fp1, fp2], 100000), processes = 5))
+    '''
+    pointers = source.pointers if hasattr(source, 'pointers') else source
+    if processes <= 0:
+        with ChunkReader() as reader:
+            for index, every_block in enumerate(pointers):
+                result = func(reader.read(*every_block), *args)
+                yield result if ordered else (index, result)
+        return None
+    if max_inflight <= 0:
+        max_inflight = processes * 4
+    pool = mp.Pool(processes = processes, initializer = init_worker)
+    try:
+        if ordered:
+            pending = deque()
+            for every_block in pointers:
+                if len(pending) >= max_inflight:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(call_chunk, [func, args, *every_block]))
+            while pending:
+                yield pending.popleft().get()
+        else:
+            done_queue = queue.Queue()
+            inflight = 0
+            for index, every_block in enumerate(pointers):
+                if inflight >= max_inflight:
+                    inflight -= 1
+                    yield get_done(done_queue)
+                pool.apply_async(call_chunk, [func, args, *every_block],
+                    callback = lambda result, index = index: done_queue.put((True, index, result)),
+                    error_callback = lambda error, index = index: done_queue.put((False, index, error)))
+                inflight += 1
+            while inflight > 0:
+                inflight -= 1
+                yield get_done(done_queue)
+    except BaseException:
+        #include GeneratorExit, the consumer stopped early
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+def get_done(done_queue:queue.Queue) -> tuple:
+    status, index, result = done_queue.get()
+    if not status:
+        raise result
+    return index, result
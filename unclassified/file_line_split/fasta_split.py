@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+__all__ = ['FastaSlicer', 'MultiFastaSlicer', 'FastaIndex', 'FastaBoundary', 'find_fasta_start']
+
+'''
+    Readme:
+        FastaSlicer split multi-line FASTA (genome, protein database ...) only at '>' record starts, a record is never cut in half.
+    Options:
+        fai: chunks are balanced by sequence bytes (bases of records, headers and line ends are not counted),
+            every chunk has about chunk_size bases, split_num is the number of chunks of the bases.
+            A fresh .fai (samtools faidx, or written before) gives the lengths, the file itself is not read;
+            without it the whole file is scanned once instead of seek and a samtools-style file.fai is written in the same pass
+            (name, length, offset, line bases, line width). FastaIndex load the .fai and fetch any record or subsequence by random access.
+        fai = False: FastaSlicer still balance the chunks by sequence bytes, the file is scanned once without .fai
+            (records of different line lengths are allowed, no file is written).
+            MultiFastaSlicer slice the file by seek like MultiFileSlicer (split_mode 'offset' slice one file in parallel),
+            so its chunks are balanced by file bytes (headers and line ends included), every chunk has about chunk_size bytes of records.
+    gzip support: .fa.gz is sliced in uncompressed space (see gzip_split.py), offsets of .fai are uncompressed offsets,
+        same as samtools faidx of a bgzip file.
+'''
+
+import os
+
+from typing import Iterator, List, Union
+from .slice_cache import SliceCache
+from .slice_engine import Boundary, SliceEngine
+from .pointer_table import PointerTable
+from .gzip_split import index_files, open_slice_file, slice_pointers
+
+def find_fasta_start(input_handle, offset:int, total_size:int, window:int = 65536) -> int:
+    '''
+        Return the first record start ('>' at a line start) ge offset, or total_size if there is no record after offset
+    '''
+    if offset >= total_size:
+        return total_size
+    if offset == 0:
+        return 0
+    #read from offset - 1, so a '>' at offset is found after its line end
+    read_begin = offset - 1
+    input_handle.seek(read_begin)
+    data = input_handle.read(window)
+    while data:
+        record_begin = data.find(b'\n>')
+        if record_begin >= 0:
+            return read_begin + record_begin + 1
+        #keep the last byte, a line end may be the end of this window
+        read_begin += len(data) - 1
+        more_data = input_handle.read(window)
+        if not more_data:
+            break
+        data = data[-1:] + more_data
+    return total_size
+
+def balance_cuts(record_bases:List[int], chunk_size:int = 100000, split_num:int = 0) -> List[int]:
+    '''
+        Indexes of the records which begin a new chunk, a chunk is cut at the first record start after chunk_size bases
+    '''
+    if split_num >= 1:
+        #recalculate chunk_size by bases
+        chunk_size = int(sum(record_bases) / split_num)
+    cuts, bases = [], 0
+    for index, every_bases in enumerate(record_bases):
+        if index > 0 and bases >= chunk_size:
+            cuts.append(index)
+            bases = 0
+        bases += every_bases
+    return cuts
+
+def balance_pointers(file:str, boundaries:List[int], total_size:int, begin:int = 0) -> PointerTable:
+    '''
+        Pointers between the boundaries from begin (the pointer after header lines) to total_size
+    '''
+    boundaries = sorted(set([begin, total_size] + [i for i in boundaries if begin < i < total_size]))
+    return slice_pointers(file, PointerTable.from_ranges(file, boundaries[:-1], boundaries[1:]))
+
+def scan_fasta(file:str, chunk_size:int = 100000, split_num:int = 0, begin:int = 0, fai:bool = True) -> tuple:
+    '''
+        Read the whole file once, return (pointers from begin, fai rows), chunks are cut at the first record start after chunk_size bases,
+        fai = False only count the bases, fai rows are empty and line lengths are not checked
+    '''
+    fai_rows, names = [], set()
+    #start and bases of every record, duplicate records which are not in fai rows too
+    record_starts, record_bases = [], []
+    input_handle, total_size = open_slice_file(file)
+    now_pointer, record = 0, None
+    with input_handle:
+        for line in input_handle:
+            if line.startswith(b'>'):
+                if record is not None:
+                    fai_rows.append(close_record(file, record))
+                record_starts.append(now_pointer)
+                record_bases.append(0)
+                name = line[1:].split(maxsplit = 1)[0].decode('utf8') if line[1:].strip() else ''
+                #samtools keep the first one of duplicate names
+                record = None if name in names or not fai else [name, 0, now_pointer + len(line), 0, 0, []]
+                names.add(name)
+            elif record_bases:
+                bases = len(line.rstrip(b'\r\n'))
+                record_bases[-1] += bases
+                if record is not None:
+                    if record[3] == 0 and bases > 0:
+                        record[3], record[4] = bases, len(line)
+                    record[1] += bases
+                    record[5].append((bases, len(line)))
+            now_pointer += len(line)
+    if record is not None:
+        fai_rows.append(close_record(file, record))
+    cuts = balance_cuts(record_bases, chunk_size, split_num)
+    return balance_pointers(file, [record_starts[i] for i in cuts], now_pointer, begin), fai_rows
+
+def find_header_start(input_handle, offset:int, window:int = 65536) -> int:
+    '''
+        Start of the header line of the record whose sequence begins at offset (offset of .fai)
+    '''
+    #offset - 1 is the line end of the header
+    end_pointer = offset - 1
+    while True:
+        read_begin = max(end_pointer - window, 0)
+        input_handle.seek(read_begin)
+        line_end = input_handle.read(end_pointer - read_begin).rfind(b'\n')
+        if line_end >= 0 or read_begin == 0:
+            return read_begin + line_end + 1
+        window *= 2
+
+def fai_pointers(file:str, chunk_size:int = 100000, split_num:int = 0, begin:int = 0) -> PointerTable:
+    '''
+        Chunks balanced by the lengths of the .fai, only the header starts at the cuts are read from the file
+    '''
+    with FastaIndex(file) as index:
+        records = list(index.records.values())
+        cuts = balance_cuts([i[0] for i in records], chunk_size, split_num)
+        input_handle, total_size = open_slice_file(file)
+        with input_handle:
+            boundaries = []
+            for every_cut in cuts:
+                boundaries.append(find_header_start(input_handle, records[every_cut][1]))
+                input_handle.seek(boundaries[-1])
+                if input_handle.read(1) != b'>':
+                    raise ValueError("fai of %s does not match the file, there is no header before offset %d!" % (file, records[every_cut][1]))
+    return balance_pointers(file, boundaries, total_size, begin)
+
+def close_record(file:str, record:list) -> tuple:
+    '''
+        Check line length of a record, every line but the last one has the same bases and width, same as samtools faidx
+    '''
+    name, length, offset, line_bases, line_width, lines = record
+    while lines and lines[-1][0] == 0:
+        #empty lines at the end of record
+        lines.pop()
+    for bases, width in lines[:-1]:
+        if bases != line_bases or width != line_width:
+            raise ValueError("%s has different line length in record %s!" % (file, name))
+    if lines and lines[-1][0] > line_bases:
+        raise ValueError("%s has different line length in record %s!" % (file, name))
+    return (name, length, offset, line_bases, line_width)
+
+def write_fai(file:str, fai_rows:List[tuple]) -> str:
+    '''
+        Write fai rows next to the file (or in the temp directory if the folder is not writable), return the fai path
+    '''
+    fai_data = ''.join('%s\t%d\t%d\t%d\t%d\n' % i for i in fai_rows)
+    for every_fai in index_files(file, FastaIndex.suffix):
+        try:
+            with open(every_fai + '.tmp', 'w') as output_handle:
+                output_handle.write(fai_data)
+            os.replace(every_fai + '.tmp', every_fai)
+            return every_fai
+        except OSError:
+            continue
+    raise OSError("can not write fai of %s!" % file)
+
+def fai_fresh(file:str) -> bool:
+    '''
+        A fai is fresh if it is not older than the file, same as samtools
+    '''
+    file_mtime = os.stat(file).st_mtime_ns
+    for every_fai in index_files(file, FastaIndex.suffix):
+        if os.path.exists(every_fai) and os.stat(every_fai).st_mtime_ns >= file_mtime:
+            return True
+    return False
+
+class FastaIndex:
+    '''
+        from fasta_split import FastaIndex
+        index = FastaIndex(fp1) #fp1.fai is made by samtools faidx or FastaSlicer(..., fai = True)
+        s = index.fetch('chr1', 10000, 10100) #0-based, end is not included
+    '''
+    suffix = '.fai'
+
+    def __init__(self, file:str, fai_file:str = '') -> None:
+        self.file = file
+        if fai_file == '':
+            fai_files = [i for i in index_files(file, self.suffix) if os.path.exists(i)]
+            if not fai_files:
+                raise FileNotFoundError("fai of %s is not found, run FastaSlicer with fai = True or samtools faidx!" % file)
+            fai_file = fai_files[0]
+        self.records = {}
+        with open(fai_file, 'r') as input_handle:
+            for line in input_handle:
+                name, length, offset, line_bases, line_width = line.rstrip('\n').split('\t')[:5]
+                self.records[name] = (int(length), int(offset), int(line_bases), int(line_width))
+        self.input_handle = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, name:str) -> bool:
+        return name in self.records
+
+    def names(self) -> List[str]:
+        return list(self.records)
+
+    def length(self, name:str) -> int:
+        return self.records[name][0]
+
+    def fetch(self, name:str, start:int = 0, end:Union[int, None] = None) -> str:
+        '''
+            Subsequence [start, end) of a record, end is the record length by default
+        '''
+        if name not in self.records:
+            raise KeyError("%s is not in %s!" % (name, self.file))
+        length, offset, line_bases, line_width = self.records[name]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return ''
+        if self.input_handle is None:
+            self.input_handle = open_slice_file(self.file)[0]
+        begin_pointer = offset + start // line_bases * line_width + start % line_bases
+        end_pointer = offset + (end - 1) // line_bases * line_width + (end - 1) % line_bases + 1
+        self.input_handle.seek(begin_pointer)
+        data = self.input_handle.read(end_pointer - begin_pointer)
+        return data.replace(b'\n', b'').replace(b'\r', b'').decode('ascii')
+
+    def close(self) -> None:
+        if self.input_handle is not None:
+            self.input_handle.close()
+            self.input_handle = None
+
+    def __enter__(self) -> 'FastaIndex':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+class FastaBoundary(Boundary):
+    '''
+        Record start of FASTA for slice_engine.SliceEngine (see find_fasta_start),
+        fai = True balance the chunks by sequence bytes from a fresh .fai, or scan the whole file and write .fai in the same pass,
+        scan = True (without fai) balance the chunks by sequence bytes of a scan pass, no .fai is read or written,
+        so the file is one task in both cases.
+    '''
+    def __init__(self, fai:bool = False, scan:bool = False) -> None:
+        self.fai = fai
+        self.scan = scan
+        self.random_access = not fai and not scan
+
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        return find_fasta_start(input_handle, offset, total_size)
+
+    def scan_file(self, file:str, chunk_size:int, split_num:int, begin:int = 0) -> Union[PointerTable, None]:
+        if not self.fai:
+            return scan_fasta(file, chunk_size, split_num, begin, fai = False)[0] if self.scan else None
+        if fai_fresh(file):
+            return fai_pointers(file, chunk_size, split_num, begin)
+        scan_result, fai_rows = scan_fasta(file, chunk_size, split_num, begin)
+        write_fai(file, fai_rows)
+        return scan_result
+
+    def fresh(self, file:str) -> bool:
+        return not self.fai or fai_fresh(file)
+
+class FastaSlicer:
+    '''
+        from fasta_split import FastaSlicer
+        for every_block in FastaSlicer([fp1, fp2], 100000).pointers:
+            b = open(every_block[0], 'rb')
+            b.seek(every_block[1])
+            c = b.read(every_block[2] - every_block[1]) #c is data for sub process
+    '''
+    def __init__(self, file_list:List[str], chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8', fai:bool = False,
+        cache_dir:str = '', cache_size:int = 1073741824) -> None:
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
+        self.encoding = encoding
+        self.fai = fai
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        #one process reads the file anyway, so the chunks are balanced by sequence bytes with or without fai
+        self.engine = SliceEngine(FastaBoundary(fai, scan = True), 'serial', 1, encoding = encoding, cache = self.cache,
+            options = {'slicer': type(self).__name__, 'fai': fai})
+        self.pointers = self.seek_file(file_list, chunk_size, split_num)
+
+    def seek_file(self, file_list:str, chunk_size:int = 100000, split_num:int = 0) -> PointerTable:
+        return self.engine.slice(file_list, chunk_size, split_num)[0]
+
+class MultiFastaSlicer:
+    '''
+        from fasta_split import MultiFastaSlicer
+        for every_block in MultiFastaSlicer([fp1, fp2], 100000).pointers:
+            b = open(every_block[0], 'rb')
+            b.seek(every_block[1])
+            c = b.read(every_block[2] - every_block[1]) #c is data for sub process.
+        #or let map_chunks (see chunk_reader.py) mmap the files and pass memoryview of every block to func in child processes:
+        #for result in map_chunks(func, slicer, processes = 5): ...
+        split_mode: 'file' give each process a whole file, 'offset' compute candidate offsets (k * chunk_size) up front
+            and let any process resolve each one to the next record start, so one huge file is also sliced in parallel.
+            fai = True scan every file in one process, split_mode is not used.
+        cache_dir: save pointers in this directory (see slice_cache.py), a repeat run on unchanged inputs loads them from disk.
+        task_size and backend: same as file_split.MultiFileSlicer, busy time of every process is in worker_stats attr.
+    '''
+    def __init__(self, file_list:List[str], threads:int = 5, chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8',
+        fai:bool = False, split_mode:str = 'file', cache_dir:str = '', cache_size:int = 1073741824, task_size:int = 0, backend:str = 'process'):
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
+        if split_mode not in ['file', 'offset']:
+            raise ValueError("split_mode is must be one of ['file', 'offset'], but now is %s" % split_mode)
+        self.encoding = encoding
+        self.fai = fai
+        self.split_mode = split_mode
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        self.engine = SliceEngine(FastaBoundary(fai), backend, threads, 'file' if fai else split_mode, task_size, encoding, cache = self.cache,
+            options = {'slicer': type(self).__name__, 'fai': fai})
+        self.pointers = self.engine.slice(file_list, chunk_size, split_num)[0]
+        self.worker_stats = self.engine.worker_stats
+
+    def resolve_offsets(self, file:str, offsets:List[int]) -> List[int]:
+        '''
+            Resolve every candidate offset to the next record start on its own
+        '''
+        return self.engine.resolve_offsets(file, offsets)
+
+    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0) -> PointerTable:
+        return self.engine.seek_file(file, chunk_size, split_num)[0]
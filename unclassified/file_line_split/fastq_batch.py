@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+__all__ = ['RecordBatch', 'iter_batches']
+
+'''
+    Readme:
+        RecordBatch is a batch of 4-line FASTQ records: one contiguous uint8 buffer and numpy begin/end arrays of name,
+        sequence, quality and the whole record, no Python object for every read.
+        iter_batches parse a chunk of the slicers (bytes, memoryview of ChunkReader ...) batch by batch,
+        only batch_size records are parsed at a time, so memory is bounded by the batch, not the chunk.
+    Usage:
+        from fastq_batch import iter_batches
+        def count_bases(c):
+            return sum(int(batch.lengths().sum()) for batch in iter_batches(c, 65536))
+        total_bases = sum(map_chunks(count_bases, MultiFastqSlicer([fp1, fp2], 10000000)))
+    Accessors:
+        lengths(): sequence length of every record.
+        quality_matrix(): uint8 matrix of Phred quality (quality char - 33), shape is (records, max length),
+            positions after the end of a read are fill.
+        sequence_matrix(): uint8 matrix of bases (ASCII code), positions after the end of a read are fill.
+        names(), sequence(i), quality(i), record(i): bytes of one field.
+        take(index): a RecordBatch of some records, the buffer is shared.
+        to_bytes(): FASTQ text of the records.
+'''
+
+import numpy as np
+
+from typing import Iterator, List, Union
+
+class RecordBatch:
+    '''
+        from fastq_batch import RecordBatch
+        batch = RecordBatch.parse(b'@r1\\nACGT\\n+\\nIIII\\n')
+        batch.lengths() #array([4])
+        batch.quality_matrix() #array([[40, 40, 40, 40]], dtype=uint8)
+    '''
+    def __init__(self, data:np.ndarray, record_begins:np.ndarray, name_ends:np.ndarray, sequence_begins:np.ndarray,
+        sequence_ends:np.ndarray, quality_begins:np.ndarray, quality_ends:np.ndarray, record_ends:np.ndarray) -> None:
+        self.data = data
+        self.record_begins = record_begins
+        self.name_ends = name_ends
+        self.sequence_begins = sequence_begins
+        self.sequence_ends = sequence_ends
+        self.quality_begins = quality_begins
+        self.quality_ends = quality_ends
+        self.record_ends = record_ends
+
+    @classmethod
+    def parse(cls, data:Union[bytes, memoryview]) -> 'RecordBatch':
+        '''
+            Parse complete 4-line records, the data is copied once into the buffer of the batch
+        '''
+        data = np.frombuffer(bytes(data), dtype = np.uint8)
+        line_ends = np.flatnonzero(data == 10)
+        if len(data) > 0 and data[-1] != 10:
+            #the last line has no line end
+            line_ends = np.append(line_ends, len(data))
+        if len(line_ends) % 4 != 0:
+            raise ValueError("FASTQ data has %d lines, it is not a 4-line record data!" % len(line_ends))
+        line_begins = np.empty(len(line_ends), dtype = np.int64)
+        line_begins[:1] = 0
+        line_begins[1:] = line_ends[:-1] + 1
+        record_ends = np.minimum(line_ends[3::4] + 1, len(data))
+        #strip '\r' of line ends
+        line_ends = line_ends - (data[np.maximum(line_ends - 1, 0)] == 13) * (line_ends > line_begins)
+        batch = cls(data, line_begins[0::4], line_ends[0::4], line_begins[1::4], line_ends[1::4], line_begins[3::4], line_ends[3::4], record_ends)
+        if len(batch) > 0:
+            if (data[line_begins[0::4]] != 64).any() or (data[np.minimum(line_begins[2::4], len(data) - 1)] != 43).any():
+                bad = np.flatnonzero((data[line_begins[0::4]] != 64) | (data[np.minimum(line_begins[2::4], len(data) - 1)] != 43))[0]
+                raise ValueError("record %d is not a FASTQ record, header is not '@' or separator is not '+'!" % bad)
+            if (batch.lengths() != batch.quality_ends - batch.quality_begins).any():
+                bad = np.flatnonzero(batch.lengths() != batch.quality_ends - batch.quality_begins)[0]
+                raise ValueError("record %d has %d bases and %d qualities!" % (bad, batch.lengths()[bad], batch.quality_ends[bad] - batch.quality_begins[bad]))
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.record_begins)
+
+    def lengths(self) -> np.ndarray:
+        return self.sequence_ends - self.sequence_begins
+
+    def names(self) -> List[bytes]:
+        return [self.data[i + 1:j].tobytes() for i, j in zip(self.record_begins.tolist(), self.name_ends.tolist())]
+
+    def sequence(self, index:int) -> bytes:
+        return self.data[self.sequence_begins[index]:self.sequence_ends[index]].tobytes()
+
+    def quality(self, index:int) -> bytes:
+        return self.data[self.quality_begins[index]:self.quality_ends[index]].tobytes()
+
+    def record(self, index:int) -> bytes:
+        return self.data[self.record_begins[index]:self.record_ends[index]].tobytes()
+
+    def field_matrix(self, begins:np.ndarray, max_length:int = 0, fill:int = 0, offset:int = 0) -> np.ndarray:
+        '''
+            uint8 matrix of a field minus offset, every row is one record, max_length is the max length of records by default
+        '''
+        lengths = self.lengths()
+        if max_length <= 0:
+            max_length = int(lengths.max()) if len(lengths) > 0 else 0
+        columns = np.arange(max_length, dtype = np.int64)
+        inside = columns[None, :] < lengths[:, None]
+        positions = np.where(inside, begins[:, None] + columns[None, :], 0)
+        return np.where(inside, self.data[positions] - np.uint8(offset), np.uint8(fill)).astype(np.uint8, copy = False)
+
+    def sequence_matrix(self, max_length:int = 0, fill:int = 0) -> np.ndarray:
+        return self.field_matrix(self.sequence_begins, max_length, fill)
+
+    def quality_matrix(self, max_length:int = 0, offset:int = 33, fill:int = 0) -> np.ndarray:
+        return self.field_matrix(self.quality_begins, max_length, fill, offset)
+
+    def take(self, index:Union[slice, np.ndarray, List[int]]) -> 'RecordBatch':
+        return RecordBatch(self.data, self.record_begins[index], self.name_ends[index], self.sequence_begins[index],
+            self.sequence_ends[index], self.quality_begins[index], self.quality_ends[index], self.record_ends[index])
+
+    def to_bytes(self) -> bytes:
+        '''
+            FASTQ text of the records, a record without line end at the end of data gets one
+        '''
+        records = [self.data[i:j].tobytes() for i, j in zip(self.record_begins.tolist(), self.record_ends.tolist())]
+        return b''.join(i if i.endswith(b'\n') else i + b'\n' for i in records)
+
+def iter_batches(data:Union[bytes, memoryview], batch_size:int = 65536) -> Iterator[RecordBatch]:
+    '''
+        Parse a chunk of complete 4-line records batch by batch, every batch has batch_size records except the last one
+    '''
+    if batch_size <= 0:
+        raise ValueError("batch_size is must be gt 0, but now is %d" % batch_size)
+    data = memoryview(data).cast('B')
+    begin_pointer, record_size = 0, 256
+    while begin_pointer < len(data):
+        window = data[begin_pointer:begin_pointer + batch_size * record_size]
+        at_end = begin_pointer + len(window) >= len(data)
+        line_ends = np.flatnonzero(np.frombuffer(window, dtype = np.uint8) == 10)
+        record_num = min(len(line_ends) // 4, batch_size)
+        if record_num < batch_size and not at_end:
+            #records are longer than the guess, read a bigger window
+            record_size *= 2
+            continue
+        if record_num < batch_size:
+            #the rest of chunk, the last line may have no line end
+            batch = RecordBatch.parse(window)
+            begin_pointer = len(data)
+        else:
+            end_pointer = int(line_ends[record_num * 4 - 1]) + 1
+            batch = RecordBatch.parse(window[:end_pointer])
+            begin_pointer += end_pointer
+        yield batch
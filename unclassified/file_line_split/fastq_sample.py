@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+__all__ = ['FastqSampler']
+
+'''
+    Readme:
+        FastqSampler pick a random subset of reads (exactly number reads, or about fraction of reads) of 4-line FASTQ files,
+        only the chunks that are chosen are read, so the runtime is proportional to the sample size, not the file size.
+    Scheme:
+        1. Files are cut into chunks of chunk_size bytes, the boundary of a chunk is the record start after k * chunk_size
+            (fastq_split.find_record_start), it is resolved only when the chunk is chosen.
+        2. Reads are allocated to chunks by a multinomial draw weighted by chunk size,
+            every chosen chunk is read and its allocated reads are sampled without replacement (reservoir-style) in the chunk.
+        3. A chunk that has fewer reads than its allocation gives all of them, the rest is allocated again over the other chunks.
+        The same files, chunk_size and seed always give the same sample.
+    Paired mode:
+        r2_list is given, chunks are cut in R1 as above and only the chosen chunks are synchronized to R2:
+        the mate of the first read of a chunk is searched by read name ('/1' and '/2' suffix are ignored) around the same relative
+        position of R2 (the window grows until it is found), then the same number of reads are read from there and their names are checked.
+        Nothing is counted up front, so the runtime is still proportional to the sample size, and the same reads of a chunk are taken.
+    Usage:
+        from fastq_sample import FastqSampler
+        FastqSampler([fp1], seed = 1).write('pilot.fq', number = 1000000)
+        FastqSampler([r1], [r2], seed = 1).write('pilot_R1.fq.gz', fraction = 0.01, r2_output = 'pilot_R2.fq.gz')
+'''
+
+import gzip
+import numpy as np
+
+from typing import Iterator, List
+from .fastq_batch import RecordBatch
+from .fastq_split import find_record_start
+from .gzip_split import open_slice_file, slice_size
+
+def pair_name(header:bytes) -> bytes:
+    '''
+        Read name of a header without '@', the comment and '/1' or '/2' suffix, same as PairedFastqSlicer.read_names
+    '''
+    fields = header.split(maxsplit = 1)
+    name = fields[0] if len(fields) > 0 else b''
+    return name[:-2] if name[-2:] in (b'/1', b'/2') else name
+
+class FastqSampler:
+    '''
+        for r1_batch, r2_batch in FastqSampler([r1], [r2], seed = 1).sample(number = 1000):
+            ... #r2_batch is None in single mode
+        threads is not used, chunks are resolved lazily in this process, it is kept for the callers of the old paired mode.
+    '''
+    def __init__(self, file_list:List[str], r2_list:List[str] = [], chunk_size:int = 1048576, seed:int = 0, threads:int = 5) -> None:
+        if not isinstance(file_list, List) or not isinstance(r2_list, List):
+            raise TypeError("file_list and r2_list are List, but now are %s and %s" % (type(file_list), type(r2_list)))
+        if chunk_size <= 0:
+            raise ValueError("chunk_size is must be gt 0, but now is %d" % chunk_size)
+        if len(r2_list) > 0 and len(r2_list) != len(file_list):
+            raise ValueError("file_list has %d files, r2_list has %d files, they are not paired!" % (len(file_list), len(r2_list)))
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.paired = len(r2_list) > 0
+        self.handles = {}
+        #R2 file and the sizes of R1 and R2 (uncompressed size of gzip) of every R1 file
+        self.mates = {}
+        #chunk i of a file is [start of i, start of i + 1), resolved lazily, the sizes are uncompressed bytes (not BGZF virtual offsets)
+        self.chunks = []
+        for index, every_file in enumerate(file_list):
+            total_size = slice_size(every_file)
+            if self.paired:
+                self.mates[every_file] = (r2_list[index], total_size, slice_size(r2_list[index]))
+            self.chunks += [(every_file, i, min(i + chunk_size, total_size), total_size) for i in range(0, total_size, chunk_size)]
+        self.weights = np.array([i[2] - i[1] for i in self.chunks], dtype = np.float64)
+
+    def open(self, file:str) -> object:
+        if file not in self.handles:
+            self.handles[file] = open_slice_file(file)[0]
+        return self.handles[file]
+
+    def read_records(self, file:str, begin_pointer:int, total_size:int, record_num:int, size_hint:int) -> RecordBatch:
+        '''
+            record_num records from begin_pointer (a record start), fewer at the end of file
+        '''
+        input_handle = self.open(file)
+        read_size = max(size_hint, 1024)
+        while True:
+            input_handle.seek(begin_pointer)
+            data = input_handle.read(min(read_size, total_size - begin_pointer))
+            line_ends = np.flatnonzero(np.frombuffer(data, dtype = np.uint8) == 10)
+            if len(line_ends) >= record_num * 4:
+                return RecordBatch.parse(data[:int(line_ends[record_num * 4 - 1]) + 1] if record_num > 0 else b'')
+            if begin_pointer + len(data) >= total_size:
+                return RecordBatch.parse(data)
+            read_size *= 2
+
+    def locate_mate(self, file:str, name:bytes, estimate:int, total_size:int) -> int:
+        '''
+            Offset of the record named name in file, searched in a window around estimate, the window grows until the whole file
+        '''
+        input_handle, window = self.open(file), self.chunk_size
+        while True:
+            begin_pointer = find_record_start(input_handle, max(estimate - window, 0), total_size)
+            end_pointer = find_record_start(input_handle, min(estimate + window, total_size), total_size)
+            input_handle.seek(begin_pointer)
+            batch = RecordBatch.parse(input_handle.read(max(end_pointer - begin_pointer, 0)))
+            names = [pair_name(i) for i in batch.names()]
+            if name in names:
+                return begin_pointer + int(batch.record_begins[names.index(name)])
+            if estimate - window <= 0 and estimate + window >= total_size:
+                raise ValueError("Read %s is not found in %s, it is not paired!" % (name.decode('utf8', 'replace'), file))
+            window *= 4
+
+    def read_chunk(self, index:int) -> tuple:
+        '''
+            Return (R1 batch, R2 batch or None) of a chunk
+        '''
+        file, begin_pointer, end_pointer, total_size = self.chunks[index]
+        input_handle = self.open(file)
+        begin_pointer = find_record_start(input_handle, begin_pointer, total_size)
+        end_pointer = find_record_start(input_handle, end_pointer, total_size)
+        input_handle.seek(begin_pointer)
+        r1_batch = RecordBatch.parse(input_handle.read(max(end_pointer - begin_pointer, 0)))
+        if not self.paired:
+            return r1_batch, None
+        #2 synchronize R2 for this chunk only, mates are at about the same relative position
+        r2_file, r1_size, r2_size = self.mates[file]
+        if len(r1_batch) == 0:
+            return r1_batch, RecordBatch.parse(b'')
+        r1_names = [pair_name(i) for i in r1_batch.names()]
+        ratio = r2_size / max(r1_size, 1)
+        r2_begin = self.locate_mate(r2_file, r1_names[0], int(begin_pointer * ratio), r2_size)
+        r2_batch = self.read_records(r2_file, r2_begin, r2_size, len(r1_batch), int((end_pointer - begin_pointer) * ratio * 1.1))
+        if len(r1_batch) != len(r2_batch) or r1_names != [pair_name(i) for i in r2_batch.names()]:
+            raise ValueError("chunk %d of %s (%d reads) does not match the reads of %s from %d, they are not paired!" % (index, file,
+                len(r1_batch), r2_file, r2_begin))
+        return r1_batch, r2_batch
+
+    def estimate_reads(self, rng:np.random.Generator) -> float:
+        '''
+            Reads of all files, bytes per read is measured on a random chunk
+        '''
+        for index in rng.permutation(len(self.weights)):
+            r1_batch = self.read_chunk(int(index))[0]
+            if len(r1_batch) > 0:
+                return self.weights.sum() * len(r1_batch) / (r1_batch.record_ends[-1] - r1_batch.record_begins[0])
+        return 0.0
+
+    def sample(self, number:int = 0, fraction:float = 0.0) -> Iterator[tuple]:
+        '''
+            Yield (R1 batch, R2 batch or None) of sampled reads chunk by chunk, the reads of a chunk are in file order
+        '''
+        rng = np.random.default_rng(self.seed)
+        if number <= 0 and fraction > 0:
+            number = int(round(fraction * self.estimate_reads(rng)))
+        taken, exhausted = {}, np.zeros(len(self.weights), dtype = bool)
+        while number > 0 and not exhausted.all():
+            weights = np.where(exhausted, 0.0, self.weights)
+            if weights.sum() == 0:
+                break
+            counts = rng.multinomial(number, weights / weights.sum())
+            for index in np.flatnonzero(counts).tolist():
+                r1_batch, r2_batch = self.read_chunk(index)
+                rest = np.setdiff1d(np.arange(len(r1_batch)), taken.get(index, []))
+                pick = np.sort(rng.choice(rest, min(int(counts[index]), len(rest)), replace = False))
+                if len(pick) == len(rest):
+                    #every read of this chunk is taken
+                    exhausted[index] = True
+                if len(pick) == 0:
+                    continue
+                taken[index] = np.union1d(taken.get(index, []), pick).astype(np.int64)
+                number -= len(pick)
+                yield r1_batch.take(pick), None if r2_batch is None else r2_batch.take(pick)
+
+    def write(self, output_file:str, number:int = 0, fraction:float = 0.0, r2_output:str = '') -> int:
+        '''
+            Write sampled reads, .gz output is compressed, return number of reads
+        '''
+        if self.paired and r2_output == '':
+            raise ValueError("r2_output is must be given in paired mode!")
+        read_num = 0
+        output_handles = [gzip.open(i, 'wb') if i.endswith('.gz') else open(i, 'wb') for i in ([output_file, r2_output] if self.paired else [output_file])]
+        try:
+            for r1_batch, r2_batch in self.sample(number, fraction):
+                output_handles[0].write(r1_batch.to_bytes())
+                if r2_batch is not None:
+                    output_handles[1].write(r2_batch.to_bytes())
+                read_num += len(r1_batch)
+        finally:
+            for every_handle in output_handles:
+                every_handle.close()
+            self.close()
+        return read_num
+
+    def close(self) -> None:
+        for every_handle in self.handles.values():
+            every_handle.close()
+        self.handles = {}
@@ -1,66 +1,136 @@
 #!/usr/bin/env python3
 
+__all__ = ['FastqSlicer', 'MultiFastqSlicer', 'PairedFastqSlicer', 'FastqBoundary', 'find_record_start']
+
 '''
-    NO gzip support !!!
+    record start: the boundary of chunks is found by find_record_start, a line start is a record start only if
+        the 4-line phase of two records from it is consistent, multi-line FASTQ is supported.
+    gzip support: .fastq.gz is sliced in uncompressed space (see gzip_split.py),
+        pointers of BGZF file are virtual offsets, pointers of plain gzip file are uncompressed offsets,
+        read the chunk by gzip_split.GzipChunkReader or chunk_reader.map_chunks.
 '''
 
-__all__ = ['FastqSlicer', 'MultiFastqSlicer']
-
 import os
+import numpy as np
 import multiprocessing as mp
 
-from typing import List
+from typing import Iterator, List
+from multiprocessing.pool import Pool
+from .slice_cache import SliceCache
+from .slice_engine import Boundary, SliceEngine
+from .pointer_table import PointerTable
+from .gzip_split import open_slice_file, slice_size, slice_pointers
+
+#characters of sequence and quality lines, translate(None, chars) of a valid line is empty
+SEQUENCE_CHARS = bytes(range(65, 91)) + bytes(range(97, 123)) + b'.-*'
+QUALITY_CHARS = bytes(range(33, 127))
+NOT_RECORD, NEED_MORE = -1, -2
+
+def next_line(data:bytes, begin:int, at_eof:bool) -> tuple:
+    '''
+        Return (line without line end, begin of next line), line is None if data is not enough
+    '''
+    if begin >= len(data):
+        return None, begin
+    end = data.find(b'\n', begin)
+    if end < 0:
+        if at_eof:
+            return data[begin:].rstrip(b'\r'), len(data)
+        return None, begin
+    return data[begin:end].rstrip(b'\r'), end + 1
+
+def record_end(data:bytes, begin:int, at_eof:bool) -> int:
+    '''
+        End of the record which starts at begin, NOT_RECORD or NEED_MORE.
+        Header is '@', sequence lines until the '+' line, quality lines until their length reach the sequence length,
+        so a quality line beginning with '@' or '+' is never taken as header or separator, multi-line FASTQ is supported.
+    '''
+    header, now_pointer = next_line(data, begin, at_eof)
+    if header is None:
+        return NOT_RECORD if at_eof else NEED_MORE
+    if not header.startswith(b'@'):
+        return NOT_RECORD
+    sequence_size = 0
+    while True:
+        line, now_pointer = next_line(data, now_pointer, at_eof)
+        if line is None:
+            return NOT_RECORD if at_eof else NEED_MORE
+        if line.startswith(b'+'):
+            break
+        if len(line.translate(None, SEQUENCE_CHARS)) > 0:
+            return NOT_RECORD
+        sequence_size += len(line)
+    if len(line) > 1 and line[1:] != header[1:]:
+        #name after '+' is optional, but it is same as header if it exists
+        return NOT_RECORD
+    quality_size = 0
+    while True:
+        line, now_pointer = next_line(data, now_pointer, at_eof)
+        if line is None:
+            return NOT_RECORD if at_eof else NEED_MORE
+        if len(line.translate(None, QUALITY_CHARS)) > 0:
+            return NOT_RECORD
+        quality_size += len(line)
+        if quality_size >= sequence_size:
+            break
+    return now_pointer if quality_size == sequence_size else NOT_RECORD
+
+def find_record_start(input_handle, offset:int, total_size:int, window:int = 65536, confirm:int = 2) -> int:
+    '''
+        Return the first record start ge offset, or total_size if there is no record after offset.
+        A line start is a record start only if the 4-line phase is consistent for confirm records from it,
+        the window is doubled until it holds them.
+    '''
+    if offset >= total_size:
+        return total_size
+    #read from offset - 1, so offset itself is a line start if the first byte is line end
+    read_begin = max(offset - 1, 0)
+    while True:
+        input_handle.seek(read_begin)
+        data = input_handle.read(window)
+        at_eof = read_begin + len(data) >= total_size
+        candidate = 0 if offset == 0 else data.find(b'\n') + 1
+        need_more = candidate == 0 and offset != 0
+        while not need_more and candidate < len(data):
+            if data[candidate:candidate + 1] == b'@':
+                record_pointer, record_num = candidate, 0
+                while record_num < confirm and record_pointer >= 0 and record_pointer < len(data):
+                    record_pointer = record_end(data, record_pointer, at_eof)
+                    record_num += 1
+                if record_pointer >= 0:
+                    #confirm records, or the last records of file
+                    return read_begin + candidate
+                if record_pointer == NEED_MORE:
+                    need_more = True
+                    break
+            line_end = data.find(b'\n', candidate)
+            if line_end < 0:
+                need_more = not at_eof
+                break
+            candidate = line_end + 1
+        if at_eof:
+            return total_size
+        window *= 2
+
+class FastqBoundary(Boundary):
+    '''
+        Record start of FASTQ for slice_engine.SliceEngine (see find_record_start)
+    '''
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        return find_record_start(input_handle, offset, total_size)
 
 class FastqSlicer:
-    def __init__(self, file_list:List[str], chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8') -> None:
-        if not isinstance(file_list, List):
-            raise TypeError("file_list is List, but now is %s" % type(file_list))
+    def __init__(self, file_list:List[str], chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8',
+        cache_dir:str = '', cache_size:int = 1073741824) -> None:
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
         self.encoding = encoding
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        self.engine = SliceEngine(FastqBoundary(), 'serial', 1, encoding = encoding, cache = self.cache, options = {'slicer': type(self).__name__})
         self.pointers = self.seek_file(file_list, chunk_size, split_num)
 
-    def seek_file(self, file_list:str, chunk_size:int = 100000, split_num:int = 0) -> List:
-        seek_result = []
-        for every_file in file_list:
-            if not os.path.exists(every_file):
-                raise FileNotFoundError("%s is not found!" % (every_file))
-            init_pointer = 0
-            total_size = os.path.getsize(every_file)
-            input_handle = open(every_file, 'rb')
-            if split_num >= 1:
-                #recalculate chunk_size
-                chunk_size = int((total_size - init_pointer) / split_num)
-            while init_pointer < total_size:
-                #seek and find line ends
-                input_handle.seek(chunk_size, 1)
-                _ = input_handle.readline()
-                now_pointer = input_handle.tell()
-                if now_pointer == init_pointer:
-                    continue
-                else:
-                    check_data:List = input_handle.readlines(3)
-                    end_pointer = input_handle.tell()
-                    if len(check_data) == 3:
-                        if check_data[0].startswith(b'@') and check_data[2].startswith(b'+'):
-                            #save result
-                            seek_result.append((every_file, init_pointer, end_pointer))
-                            init_pointer = end_pointer
-                    elif len(check_data) == 2:
-                        if check_data[0].startswith(b'+'):
-                            seek_result.append((every_file, init_pointer, end_pointer))
-                            init_pointer = end_pointer
-                    elif len(check_data) == 1:
-                        seek_result.append((every_file, init_pointer, end_pointer))
-                        init_pointer = end_pointer
-                    else:
-                        seek_result.append((every_file, init_pointer, now_pointer))
-                        init_pointer = now_pointer
-                    #because the readline method is used
-            '''
-                The problem of the last loop exceeding the file size is not dealt with,
-                because it will automatically stop if it exceeds the file size during reading
-            '''
-            input_handle.close()
-        return seek_result
+    def seek_file(self, file_list:str, chunk_size:int = 100000, split_num:int = 0) -> PointerTable:
+        return self.engine.slice(file_list, chunk_size, split_num)[0]
 
 class MultiFastqSlicer:
     '''
@@ -69,71 +139,176 @@ class MultiFastqSlicer:
             b = open(every_block[0], 'rb')
             b.seek(every_block[1])
             c = b.read(every_block[2] - every_block[1]) #c is data for sub process.
+        #or let map_chunks (see chunk_reader.py) mmap the files and pass memoryview of every block to func in child processes:
+        #for result in map_chunks(func, slicer, processes = 5): ...
+        split_mode: 'file' give each process a whole file, 'offset' compute candidate offsets (k * chunk_size) up front
+            and let any process resolve each one to the next record start, so one huge file is also sliced in parallel.
+        cache_dir: save pointers in this directory (see slice_cache.py), a repeat run on unchanged inputs loads them from disk.
+        task_size and backend: same as file_split.MultiFileSlicer, busy time of every process is in worker_stats attr.
+    '''
+    def __init__(self, file_list:List[str], threads:int = 5, chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8',
+        split_mode:str = 'file', cache_dir:str = '', cache_size:int = 1073741824, task_size:int = 0, backend:str = 'process'):
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
+        self.encoding = encoding
+        self.split_mode = split_mode
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        self.engine = SliceEngine(FastqBoundary(), backend, threads, split_mode, task_size, encoding, cache = self.cache,
+            options = {'slicer': type(self).__name__})
+        self.pointers = self.engine.slice(file_list, chunk_size, split_num)[0]
+        self.worker_stats = self.engine.worker_stats
+
+    def resolve_offsets(self, file:str, offsets:List[int]) -> List[int]:
+        '''
+            Resolve every candidate offset to the next record start on its own (see find_record_start)
+        '''
+        return self.engine.resolve_offsets(file, offsets)
+
+    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0) -> PointerTable:
+        return self.engine.seek_file(file, chunk_size, split_num)[0]
+
+class PairedFastqSlicer(MultiFastqSlicer):
     '''
-    def __init__(self, file_list:List[str], threads:int = 5, chunk_size:int = 100000, split_num:int = 0, encoding:str = 'utf8'):
-        if not isinstance(file_list, List):
-            raise TypeError("file_list is List, but now is %s" % type(file_list))
+        Slice R1 and R2 into aligned chunk pairs, every pair holds exactly the same reads (4-line FASTQ).
+        from fastq_split import PairedFastqSlicer
+        for r1_file, r1_begin, r1_end, r2_file, r2_begin, r2_end in PairedFastqSlicer([r1], [r2], 5, 100000).pointers:
+            ...
+        r1_pointers and r2_pointers attr are PointerTable of R1 and R2, the i-th chunks of them are a pair.
+        pointers attr is different from the other slicers: a list of 6-tuples (R1 pointer + R2 pointer), not a PointerTable,
+        use r1_pointers and r2_pointers where a PointerTable is needed (map_chunks, save, to_list ...).
+        Scheme:
+            1. R1 and R2 are sliced at record starts separately, and reads of every chunk are counted in parallel.
+            2. The R2 offset of the first read of every R1 chunk is located inside the R2 chunk which holds that read.
+            3. Read names of R1 and R2 at every boundary are compared, '/1' and '/2' suffix are ignored.
+    '''
+    def __init__(self, r1_list:List[str], r2_list:List[str], threads:int = 5, chunk_size:int = 100000, split_num:int = 0,
+        encoding:str = 'utf8') -> None:
+        if not isinstance(r1_list, List) or not isinstance(r2_list, List):
+            raise TypeError("r1_list and r2_list are List, but now are %s and %s" % (type(r1_list), type(r2_list)))
+        if len(r1_list) != len(r2_list):
+            raise ValueError("length of r1 list is %d, length of r2 list is %d, they are must be equal!" % (len(r1_list), len(r2_list)))
         self.encoding = encoding
-        self.pointers = self.begin(file_list, threads, chunk_size, split_num)
+        self.split_mode = 'offset'
+        self.cache = None
+        self.engine = SliceEngine(FastqBoundary(), 'process', threads, 'offset', encoding = encoding)
+        self.r1_pointers, self.r2_pointers = self.begin_paired(r1_list, r2_list, threads, chunk_size, split_num)
+        self.pointers = [r1 + r2 for r1, r2 in zip(self.r1_pointers, self.r2_pointers)]
+
+    def begin_paired(self, r1_list:list, r2_list:list, threads:int = 5, chunk_size:int = 100000, split_num:int = 0) -> tuple:
+        for every_file in r1_list + r2_list:
+            if not os.path.exists(every_file):
+                raise FileNotFoundError("%s is not found!" % (every_file))
+        #the pool is terminated on every error (missing mates, unpaired reads ...), no worker process is left
+        with mp.Pool(processes = threads) as pool:
+            total_sizes = pool.map(slice_size, r1_list + r2_list)
+            r1_result, r2_result = [], []
+            for r1_file, r2_file, r1_size, r2_size in zip(r1_list, r2_list, total_sizes[:len(r1_list)], total_sizes[len(r1_list):]):
+                #1 record starts of R1 and R2
+                r1_boundaries = self.paired_boundaries(pool, threads, r1_file, r1_size, chunk_size, split_num)
+                r2_boundaries = self.paired_boundaries(pool, threads, r2_file, r2_size, chunk_size, split_num)
+                #2 read number of every chunk
+                r1_counts = np.cumsum([0] + self.paired_map(pool, threads, self.count_records, r1_file, r1_boundaries, 1))
+                r2_counts = np.cumsum([0] + self.paired_map(pool, threads, self.count_records, r2_file, r2_boundaries, 1))
+                if r1_counts[-1] != r2_counts[-1]:
+                    raise ValueError("%s has %d reads, %s has %d reads, they are not paired!" % (r1_file, r1_counts[-1], r2_file,
+                        r2_counts[-1]))
+                if r1_counts[-1] == 0:
+                    if r1_size != 0 or r2_size != 0:
+                        raise ValueError("%s (%d bytes) and %s (%d bytes) have no reads, they are not paired!" % (r1_file, r1_size,
+                            r2_file, r2_size))
+                    #no reads in both files, neither table has a chunk of them, so the tables stay aligned
+                    continue
+                #3 R2 offset of the first read of every R1 chunk, grouped by the R2 chunk which holds it
+                targets = r1_counts[1:-1]
+                r2_chunks = np.searchsorted(r2_counts, targets, side = 'right') - 1
+                locate_tasks = []
+                for every_chunk in np.unique(r2_chunks).tolist():
+                    skips = (targets[r2_chunks == every_chunk] - r2_counts[every_chunk]).tolist()
+                    locate_tasks.append((r2_boundaries[every_chunk], r2_boundaries[every_chunk + 1], skips))
+                r2_offsets = [0] + self.paired_map(pool, threads, self.locate_records, r2_file, locate_tasks, 0) + [r2_size]
+                r1_offsets = r1_boundaries
+                #4 read names must agree at every boundary
+                r1_names = self.paired_map(pool, threads, self.read_names, r1_file, r1_offsets[:-1], 0)
+                r2_names = self.paired_map(pool, threads, self.read_names, r2_file, r2_offsets[:-1], 0)
+                for index, (r1_name, r2_name) in enumerate(zip(r1_names, r2_names)):
+                    if r1_name != r2_name:
+                        raise ValueError("Read name of chunk %d is not paired, %s:%d is %s, %s:%d is %s" % (index, r1_file,
+                            r1_offsets[index], r1_name.decode(self.encoding), r2_file, r2_offsets[index], r2_name.decode(self.encoding)))
+                r1_result.append(slice_pointers(r1_file, PointerTable.from_ranges(r1_file, r1_offsets[:-1], r1_offsets[1:])))
+                r2_result.append(slice_pointers(r2_file, PointerTable.from_ranges(r2_file, r2_offsets[:-1], r2_offsets[1:])))
+            pool.close()
+            pool.join()
+        return PointerTable.concat(r1_result), PointerTable.concat(r2_result)
+
+    def paired_boundaries(self, pool:Pool, threads:int, file:str, total_size:int, chunk_size:int, split_num:int) -> List[int]:
+        file_chunk = chunk_size
+        if split_num >= 1:
+            #recalculate chunk_size
+            file_chunk = int(total_size / split_num)
+        candidates = list(range(max(file_chunk, 1), total_size, max(file_chunk, 1)))
+        return sorted(set([0, total_size] + self.paired_map(pool, threads, self.resolve_offsets, file, candidates, 0)))
 
-    def begin(self, file_list:list, threads:int = 5, chunk_size:int = 100000, split_num:int = 0) -> List:
-        #1 build process pool
-        pool = mp.Pool(processes = threads)
-        #2 multiprocess call
+    def paired_map(self, pool:Pool, threads:int, func, file:str, items:list, overlap:int) -> list:
+        '''
+            Call func(file, batch) on a few batches per process, overlap is the number of items shared by neighbouring batches
+        '''
+        batch_size = max(1, -(-(len(items) - overlap) // (threads * 4)))
         pool_result = []
-        for every_file in file_list:
-            parameters = [every_file, chunk_size, split_num]
-            pool_result.append(pool.apply_async(self.seek_file, parameters))
-        #3 join process
-        result, final_result = [], []
+        for batch_begin in range(0, max(len(items) - overlap, 0), batch_size):
+            pool_result.append(pool.apply_async(func, [file, items[batch_begin:batch_begin + batch_size + overlap]]))
+        map_result = []
         for e in pool_result:
             e.wait()
-            result = e.get()
-            final_result += result
-        pool.close()
-        pool.join()
-        return final_result
-
-    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0) -> List:
-        seek_result = []
-        if not os.path.exists(file):
-            raise FileNotFoundError("%s is not found!" % (file))
-        init_pointer = 0
-        total_size = os.path.getsize(file)
-        input_handle = open(file, 'rb')
-        if split_num >= 1:
-            #recalculate chunk_size
-            chunk_size = int((total_size - init_pointer) / split_num)
-        while init_pointer < total_size:
-            #seek and find line ends
-            input_handle.seek(chunk_size, 1)
-            _ = input_handle.readline()
-            now_pointer = input_handle.tell()
-            if now_pointer == init_pointer:
-                continue
-            else:
-                #check fastq format!
-                check_data:List = input_handle.readlines(3)
-                end_pointer = input_handle.tell()
-                if len(check_data) == 3:
-                    if check_data[0].startswith(b'@') and check_data[2].startswith(b'+'):
-                        #save result
-                        seek_result.append((file, init_pointer, end_pointer))
-                        init_pointer = end_pointer
-                elif len(check_data) == 2:
-                    if check_data[0].startswith(b'+'):
-                        seek_result.append((file, init_pointer, end_pointer))
-                        init_pointer = end_pointer
-                elif len(check_data) == 1:
-                    seek_result.append((file, init_pointer, end_pointer))
-                    init_pointer = end_pointer
-                else:
-                    seek_result.append((file, init_pointer, now_pointer))
-                    init_pointer = now_pointer
-                #because the readline method is used
+            map_result += e.get()
+        return map_result
+
+    def count_records(self, file:str, boundaries:List[int]) -> List[int]:
+        '''
+            Read number of every chunk between neighbouring boundaries
+        '''
+        count_result = []
+        with open_slice_file(file)[0] as input_handle:
+            for begin_pointer, end_pointer in zip(boundaries[:-1], boundaries[1:]):
+                input_handle.seek(begin_pointer)
+                rest_size, line_num, last_byte = end_pointer - begin_pointer, 0, b'\n'
+                while rest_size > 0:
+                    data = input_handle.read(min(rest_size, 4194304))
+                    if not data:
+                        break
+                    line_num += data.count(b'\n')
+                    last_byte = data[-1:]
+                    rest_size -= len(data)
+                if last_byte != b'\n':
+                    #last line of file without line end
+                    line_num += 1
+                if line_num % 4 != 0:
+                    raise ValueError("%s has %d lines in %d-%d, it is not 4-line FASTQ!" % (file, line_num, begin_pointer, end_pointer))
+                count_result.append(line_num // 4)
+        return count_result
+
+    def locate_records(self, file:str, tasks:List[tuple]) -> List[int]:
+        '''
+            Offset of the skip-th read after chunk begin, task is (begin_pointer, end_pointer, [skip1, skip2, ...])
+        '''
+        locate_result = []
+        with open_slice_file(file)[0] as input_handle:
+            for begin_pointer, end_pointer, skips in tasks:
+                input_handle.seek(begin_pointer)
+                line_ends = np.flatnonzero(np.frombuffer(input_handle.read(end_pointer - begin_pointer), dtype = np.uint8) == 10)
+                locate_result += [begin_pointer if i == 0 else begin_pointer + int(line_ends[i * 4 - 1]) + 1 for i in skips]
+        return locate_result
+
+    def read_names(self, file:str, offsets:List[int]) -> List[bytes]:
         '''
-            The problem of the last loop exceeding the file size is not dealt with,
-            because it will automatically stop if it exceeds the file size during reading
+            Read name at every offset, '/1' and '/2' suffix are removed
         '''
-        input_handle.close()
-        return seek_result
+        name_result = []
+        with open_slice_file(file)[0] as input_handle:
+            for every_offset in offsets:
+                input_handle.seek(every_offset)
+                fields = input_handle.readline()[1:].split(maxsplit = 1)
+                name = fields[0] if len(fields) > 0 else b''
+                if name[-2:] in (b'/1', b'/2'):
+                    name = name[:-2]
+                name_result.append(name)
+        return name_result
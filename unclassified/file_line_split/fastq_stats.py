@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+__all__ = ['FastqStats', 'chunk_stats', 'fastq_stats']
+
+'''
+    Readme:
+        FastQC-style statistics of FASTQ files on the slicers: every chunk of MultiFastqSlicer is parsed by fastq_batch
+        in a child process (see chunk_reader.map_chunks), partial statistics of the chunk are numpy arrays,
+        the partial results are merged by FastqStats.merge, merge is associative, so the order of chunks does not matter.
+    Statistics:
+        read length histogram, per-position mean quality and base content (A, C, G, T, N),
+        GC content and per-read GC histogram, N rate, per-read mean quality histogram,
+        duplicate estimate: distinct sequences are counted by a KMV sketch (k minimum hash values) of the sequences,
+        the hash is a vectorized polynomial hash of the sequence matrix, so the estimate needs memory of k values only.
+    Usage:
+        from fastq_stats import fastq_stats
+        stats = fastq_stats([fp1, fp2], threads = 5)
+        stats.write_json('qc.json')
+        stats.write_tsv('qc.tsv')
+'''
+
+import json
+import numpy as np
+
+from typing import List
+from functools import reduce
+from .fastq_batch import RecordBatch, iter_batches
+from .fastq_split import MultiFastqSlicer
+from .chunk_reader import map_chunks
+
+BASES = b'ACGTN'
+HASH_BASE = np.uint64(0x100000001b3)
+HASH_MAX = 2.0 ** 64
+
+def mix_hash(values:np.ndarray) -> np.ndarray:
+    '''
+        splitmix64 finalizer, spread the polynomial hash over 64 bits
+    '''
+    with np.errstate(over = 'ignore'):
+        values = values ^ (values >> np.uint64(30))
+        values = values * np.uint64(0xbf58476d1ce4e5b9)
+        values = values ^ (values >> np.uint64(27))
+        values = values * np.uint64(0x94d049bb133111eb)
+        return values ^ (values >> np.uint64(31))
+
+def sequence_hash(batch:RecordBatch) -> np.ndarray:
+    '''
+        sum(base[j] * HASH_BASE ** j) + length, padding after the end of read is 0, so the hash does not depend on the batch
+    '''
+    matrix = batch.sequence_matrix()
+    values = batch.lengths().astype(np.uint64)
+    power = np.uint64(1)
+    with np.errstate(over = 'ignore'):
+        for column in range(matrix.shape[1]):
+            power = power * HASH_BASE
+            values = values + matrix[:, column].astype(np.uint64) * power
+    return mix_hash(values)
+
+def pad_add(left:np.ndarray, right:np.ndarray) -> np.ndarray:
+    '''
+        Add two arrays of different length along the first axis
+    '''
+    if len(left) < len(right):
+        left, right = right, left
+    result = left.copy()
+    result[:len(right)] += right
+    return result
+
+class FastqStats:
+    '''
+        Partial statistics of some reads, stats_a.merge(stats_b) is the statistics of the reads of both
+    '''
+    def __init__(self, sketch_size:int = 4096) -> None:
+        self.sketch_size = sketch_size
+        self.reads = 0
+        self.bases = 0
+        #index is read length
+        self.length_counts = np.zeros(0, dtype = np.int64)
+        #index is position
+        self.quality_sums = np.zeros(0, dtype = np.int64)
+        self.base_counts = np.zeros((0, len(BASES)), dtype = np.int64)
+        #index is GC percent and mean quality of read
+        self.gc_counts = np.zeros(101, dtype = np.int64)
+        self.read_quality_counts = np.zeros(94, dtype = np.int64)
+        #smallest distinct hash values of sequences
+        self.sketch = np.zeros(0, dtype = np.uint64)
+
+    def add(self, batch:RecordBatch) -> 'FastqStats':
+        if len(batch) == 0:
+            return self
+        lengths = batch.lengths()
+        sequences = batch.sequence_matrix() & np.uint8(0xdf)
+        qualities = batch.quality_matrix()
+        self.reads += len(batch)
+        self.bases += int(lengths.sum())
+        self.length_counts = pad_add(self.length_counts, np.bincount(lengths))
+        self.quality_sums = pad_add(self.quality_sums, qualities.sum(axis = 0, dtype = np.int64))
+        base_counts = np.stack([(sequences == i).sum(axis = 0) for i in BASES], axis = 1).astype(np.int64)
+        self.base_counts = pad_add(self.base_counts, base_counts)
+        #empty read has 0 GC and quality
+        read_lengths = np.maximum(lengths, 1)
+        gc_percent = np.rint(((sequences == ord('G')) | (sequences == ord('C'))).sum(axis = 1) * 100 / read_lengths).astype(np.int64)
+        self.gc_counts += np.bincount(gc_percent, minlength = 101)[:101]
+        read_quality = np.minimum(np.rint(qualities.sum(axis = 1, dtype = np.int64) / read_lengths).astype(np.int64), 93)
+        self.read_quality_counts += np.bincount(read_quality, minlength = 94)
+        self.sketch = self.keep_smallest(np.concatenate([self.sketch, sequence_hash(batch)]))
+        return self
+
+    def keep_smallest(self, values:np.ndarray) -> np.ndarray:
+        values = np.unique(values)
+        return values[:self.sketch_size]
+
+    def merge(self, other:'FastqStats') -> 'FastqStats':
+        '''
+            Merge statistics of other reads into this one, associative and commutative
+        '''
+        self.reads += other.reads
+        self.bases += other.bases
+        self.length_counts = pad_add(self.length_counts, other.length_counts)
+        self.quality_sums = pad_add(self.quality_sums, other.quality_sums)
+        self.base_counts = pad_add(self.base_counts, other.base_counts)
+        self.gc_counts += other.gc_counts
+        self.read_quality_counts += other.read_quality_counts
+        self.sketch_size = min(self.sketch_size, other.sketch_size)
+        self.sketch = self.keep_smallest(np.concatenate([self.sketch, other.sketch]))
+        return self
+
+    def position_counts(self) -> np.ndarray:
+        '''
+            Number of reads that cover every position
+        '''
+        return self.length_counts[::-1].cumsum()[::-1][1:]
+
+    def distinct_estimate(self) -> float:
+        '''
+            KMV estimate of the number of distinct sequences, exact if distinct sequences are lt sketch_size
+        '''
+        if len(self.sketch) < self.sketch_size:
+            return float(len(self.sketch))
+        return (self.sketch_size - 1) / ((float(self.sketch[-1]) + 1) / HASH_MAX)
+
+    def report(self) -> dict:
+        lengths = np.flatnonzero(self.length_counts)
+        position_counts = np.maximum(self.position_counts(), 1)
+        base_total = self.base_counts.sum(axis = 0)
+        distinct = min(self.distinct_estimate(), float(self.reads))
+        return {
+            'reads': self.reads,
+            'bases': self.bases,
+            'length': {
+                'min': int(lengths[0]) if len(lengths) > 0 else 0,
+                'max': int(lengths[-1]) if len(lengths) > 0 else 0,
+                'mean': self.bases / self.reads if self.reads > 0 else 0.0,
+                'histogram': {int(i): int(self.length_counts[i]) for i in lengths},
+            },
+            'gc_content': float(base_total[1] + base_total[2]) / max(self.bases, 1),
+            'n_rate': float(base_total[4]) / max(self.bases, 1),
+            'gc_histogram': self.gc_counts.tolist(),
+            'read_quality_histogram': self.read_quality_counts.tolist(),
+            'per_position': {
+                'mean_quality': (self.quality_sums / position_counts).tolist(),
+                'base_content': {chr(j): (self.base_counts[:, i] / position_counts).tolist() for i, j in enumerate(BASES)},
+            },
+            'duplicate': {
+                'distinct_estimate': distinct,
+                'duplicate_rate': 1 - distinct / self.reads if self.reads > 0 else 0.0,
+            },
+        }
+
+    def write_json(self, file:str) -> None:
+        with open(file, 'w') as output_handle:
+            json.dump(self.report(), output_handle, indent = 4)
+
+    def write_tsv(self, file:str) -> None:
+        '''
+            One table for every module, a module starts with a '>>' line, same as fastqc_data.txt
+        '''
+        report = self.report()
+        lines = ['>>Basic Statistics', '#Measure\tValue']
+        for key in ['reads', 'bases', 'gc_content', 'n_rate']:
+            lines.append('%s\t%s' % (key, report[key]))
+        for key in ['min', 'max', 'mean']:
+            lines.append('length_%s\t%s' % (key, report['length'][key]))
+        for key, value in report['duplicate'].items():
+            lines.append('%s\t%s' % (key, value))
+        lines += ['>>END_MODULE', '>>Sequence Length Distribution', '#Length\tCount']
+        lines += ['%d\t%d' % i for i in report['length']['histogram'].items()]
+        lines += ['>>END_MODULE', '>>Per Base Sequence Quality And Content', '#Base\tMean\t' + '\t'.join(chr(i) for i in BASES)]
+        for position, mean_quality in enumerate(report['per_position']['mean_quality']):
+            contents = '\t'.join('%.4f' % report['per_position']['base_content'][chr(i)][position] for i in BASES)
+            lines.append('%d\t%.3f\t%s' % (position + 1, mean_quality, contents))
+        lines += ['>>END_MODULE', '>>Per Sequence GC Content', '#GC Content\tCount']
+        lines += ['%d\t%d' % i for i in enumerate(report['gc_histogram'])]
+        lines += ['>>END_MODULE', '>>Per Sequence Quality Scores', '#Quality\tCount']
+        lines += ['%d\t%d' % i for i in enumerate(report['read_quality_histogram']) if i[1] > 0]
+        lines.append('>>END_MODULE')
+        with open(file, 'w') as output_handle:
+            output_handle.write('\n'.join(lines) + '\n')
+
+def chunk_stats(data:memoryview, batch_size:int = 65536, sketch_size:int = 4096) -> FastqStats:
+    '''
+        Statistics of a chunk, it runs in the child process of map_chunks
+    '''
+    stats = FastqStats(sketch_size)
+    for batch in iter_batches(data, batch_size):
+        stats.add(batch)
+    return stats
+
+def fastq_stats(file_list:List[str], threads:int = 5, chunk_size:int = 16777216, batch_size:int = 65536, sketch_size:int = 4096,
+    slicer:object = None) -> FastqStats:
+    '''
+        Statistics of all reads of file_list, slicer is a MultiFastqSlicer (or any slicer of 4-line FASTQ) of file_list by default
+    '''
+    if slicer is None:
+        slicer = MultiFastqSlicer(file_list, threads = threads, chunk_size = chunk_size)
+    #merge is associative, so chunks are merged as soon as they are done
+    chunk_result = map_chunks(chunk_stats, slicer, processes = threads, ordered = False, args = (batch_size, sketch_size))
+    return reduce(FastqStats.merge, (i[1] for i in chunk_result), FastqStats(sketch_size))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+__all__ = ['merge_files', 'safely_merge_file', 'chunk_outputs']
+
+'''
+    Readme:
+        merge_files concatenate the output files of chunks into one file, it is the Python safely_merge_file (see perl/safely_merge_file.pm)
+        for the jobs driven by the slicers, the output of chunk i is usually written by process i and merged at the end.
+    Scheme:
+        1. The destination offset of every input is the sum of the sizes before it, the temp file is preallocated to the total size.
+        2. Inputs are cut into copy tasks of block_size bytes, a thread pool copy them to their offsets at the same time,
+            os.copy_file_range copy in the kernel (no data in user space, reflink on btrfs/xfs),
+            os.pread and os.pwrite are used if the file system does not support it.
+            sendfile is not used, it writes at the file position of the output, parallel writers can not share it.
+        3. The temp file is in the folder of output_file, it is fsync and renamed to output_file (os.replace),
+            so readers never see a half merged file, and the temp file is removed if the merge fails.
+    gzip: concatenated gzip files are a valid multi-member gzip file, so .gz outputs of chunks can be merged as they are.
+    Usage:
+        from file_merge import merge_files, chunk_outputs
+        merge_files(chunk_outputs('work_dir', r'chunk_\\d+\\.txt$'), 'result.txt', threads = 8)
+'''
+
+import os
+import re
+import errno
+import tempfile
+
+from typing import List
+from multiprocessing.pool import ThreadPool
+
+#errors of copy_file_range that mean the file system (or kernel) can not do it, so pread and pwrite are used
+COPY_ERRORS = set([errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF])
+
+def natural_key(file:str) -> list:
+    '''
+        chunk_2 before chunk_10
+    '''
+    return [int(i) if i.isdigit() else i for i in re.split(r'(\d+)', file)]
+
+def chunk_outputs(folder:str, pattern:str = '') -> List[str]:
+    '''
+        Files in folder (recursive) whose path match the regex pattern, in natural order of path, hidden files are skipped
+    '''
+    if not os.path.isdir(folder):
+        raise FileNotFoundError("%s is not a folder!" % folder)
+    regex = re.compile(pattern)
+    file_list = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [i for i in dirs if not i.startswith('.')]
+        file_list += [os.path.join(root, i) for i in files if not i.startswith('.') and regex.search(os.path.join(root, i))]
+    return sorted(file_list, key = natural_key)
+
+def copy_range(input_file:str, output_fd:int, src_offset:int, dst_offset:int, size:int, block_size:int = 8388608) -> int:
+    '''
+        Copy size bytes of input_file at src_offset to output_fd at dst_offset, return bytes copied
+    '''
+    copied = 0
+    input_fd = os.open(input_file, os.O_RDONLY)
+    try:
+        use_copy = hasattr(os, 'copy_file_range')
+        while copied < size:
+            count = min(size - copied, block_size)
+            if use_copy:
+                try:
+                    done = os.copy_file_range(input_fd, output_fd, count, src_offset + copied, dst_offset + copied)
+                except OSError as e:
+                    if e.errno not in COPY_ERRORS:
+                        raise
+                    use_copy = False
+                    continue
+            else:
+                data = os.pread(input_fd, count, src_offset + copied)
+                done = 0
+                while done < len(data):
+                    done += os.pwrite(output_fd, data[done:], dst_offset + copied + done)
+            if done == 0:
+                raise ValueError("%s is shorter than %d bytes, it is changed during merge!" % (input_file, src_offset + size))
+            copied += done
+    finally:
+        os.close(input_fd)
+    return copied
+
+def preallocate(output_fd:int, total_size:int) -> None:
+    if total_size <= 0:
+        return None
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(output_fd, 0, total_size)
+            return None
+        except OSError:
+            #not supported by the file system (some network file systems ...)
+            pass
+    os.ftruncate(output_fd, total_size)
+
+def new_file_mode(output_file:str, input_list:List[str]) -> int:
+    '''
+        Mode of the merged file: the mode of output_file if it exists, or a normal new file (0o666 & ~umask).
+        The umask is read from /proc/self/status, os.umask() sets it to read it and another thread may create a file in between,
+        the mode of the first input is used if /proc is not there (Linux < 4.7, other systems)
+    '''
+    try:
+        return os.stat(output_file).st_mode & 0o7777
+    except FileNotFoundError:
+        pass
+    try:
+        with open('/proc/self/status', mode = 'r') as ihandle:
+            for line in ihandle:
+                if line.startswith('Umask:'):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except OSError:
+        pass
+    return os.stat(input_list[0]).st_mode & 0o777 if len(input_list) > 0 else 0o644
+
+def merge_files(input_list:List[str], output_file:str, threads:int = 4, block_size:int = 268435456, fsync:bool = True) -> int:
+    '''
+        Concatenate input_list into output_file in order, atomic and parallel, return size of output_file
+    '''
+    if not isinstance(input_list, List):
+        raise TypeError("input_list is List, but now is %s" % type(input_list))
+    if block_size <= 0:
+        raise ValueError("block_size is must be gt 0, but now is %d" % block_size)
+    for every_file in input_list:
+        if not os.path.isfile(every_file):
+            raise FileNotFoundError("%s is not found!" % (every_file))
+        if os.path.abspath(every_file) == os.path.abspath(output_file):
+            raise ValueError("%s is both input and output!" % every_file)
+    #1 destination offset of every input, and copy tasks of block_size
+    sizes = [os.path.getsize(i) for i in input_list]
+    tasks, dst_offset = [], 0
+    for every_file, file_size in zip(input_list, sizes):
+        for src_offset in range(0, file_size, block_size):
+            tasks.append((every_file, src_offset, dst_offset + src_offset, min(block_size, file_size - src_offset)))
+        dst_offset += file_size
+    total_size = dst_offset
+    #2 preallocate the temp file next to output_file and copy in parallel
+    output_folder = os.path.dirname(os.path.abspath(output_file))
+    output_fd, temp_file = tempfile.mkstemp(prefix = '.' + os.path.basename(output_file) + '.', suffix = '.tmp', dir = output_folder)
+    try:
+        try:
+            preallocate(output_fd, total_size)
+            if threads <= 1 or len(tasks) <= 1:
+                copied = sum(copy_range(i[0], output_fd, *i[1:]) for i in tasks)
+            else:
+                with ThreadPool(processes = min(threads, len(tasks))) as pool:
+                    copied = sum(pool.starmap(copy_range, [(i[0], output_fd, *i[1:]) for i in tasks]))
+            if copied != total_size:
+                raise ValueError("%d bytes are copied, but inputs have %d bytes!" % (copied, total_size))
+            #3 mkstemp create the file with mode 600, give it the mode of the replaced file or a normal new file
+            os.fchmod(output_fd, new_file_mode(output_file, input_list))
+            if fsync:
+                os.fsync(output_fd)
+        finally:
+            os.close(output_fd)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return total_size
+
+def safely_merge_file(folder:str, output_file:str, pattern:str = '', threads:int = 4) -> int:
+    '''
+        Same arguments as perl safely_merge_file: merge the files in folder whose path match pattern into output_file
+    '''
+    return merge_files(chunk_outputs(folder, pattern), output_file, threads)
@@ -12,14 +12,29 @@ __all__ = ['FileSlicer', 'MultiFileSlicer']
         chunk_size: important parameter, decide how big the file is to be divided into, unit is byte.
         split_num: recalculate chunk_size according to the input value.
         skip: skip the first few lines.
+        split_mode: 'file' give each process a whole file, 'offset' compute candidate offsets (k * chunk_size) up front
+            and let any process resolve each one to the next line end, so one huge file is also sliced in parallel.
+        cache_dir: save pointers and header in this directory (see slice_cache.py), a repeat run on unchanged inputs loads them from disk.
+        cache_size: max total size of cache_dir, unit is byte.
+        task_size: MultiFileSlicer 'file' mode submit files largest first and split a plain file larger than task_size
+            into sub-range tasks, so idle processes take the rest of a huge file (see schedule.py), unit is byte,
+            0 is sum of file sizes / (threads * 2) and not lt 64MB. Busy time of every process is in worker_stats attr.
+        backend: MultiFileSlicer run tasks in 'process' (default), 'thread' or 'serial', FileSlicer is always 'serial'.
+        boundary: record boundary of the chunks, line end by default, slice_engine.CsvBoundary keep quoted line ends of CSV/TSV
+            in one record (see slice_engine.py), the seek loop of all slicers is slice_engine.SliceEngine.
+    gzip support:
+        gzip file is sliced in uncompressed space (see gzip_split.py), pointers of BGZF file are virtual offsets,
+        pointers of plain gzip file are uncompressed offsets, read the chunk by gzip_split.GzipChunkReader or chunk_reader.map_chunks.
     Result format:
-        pointers attr: [(file_path, begin_pointer, end_pointer), (...), ...]
+        pointers attr: PointerTable (see pointer_table.py), iterate it get (file_path, begin_pointer, end_pointer),
+            pointers.to_list() return the old [(file_path, begin_pointer, end_pointer), (...), ...] list.
 '''
 
 import os
-import multiprocessing as mp
 
-from typing import List
+from typing import Iterator, List, Union
+from .slice_cache import SliceCache
+from .slice_engine import Boundary, NewlineBoundary, SliceEngine
 
 class MultiFileSlicer:
     '''
@@ -31,74 +46,34 @@ class MultiFileSlicer:
             b = open(every_block[0], 'rb')
             b.seek(every_block[1])
             c = b.read(every_block[2] - every_block[1]) #c is data for sub process.
+        #or let map_chunks (see chunk_reader.py) mmap the files and pass memoryview of every block to func in child processes:
+        #for result in map_chunks(func, slicer, processes = 5): ...
     '''
     def __init__(self, file_list:List[str], threads:int = 5, chunk_size:int = 100000, split_num:int = 0, header:List[int] = [],
-        encoding:str = 'utf8', skip:bool = False):
-        if not isinstance(file_list, List):
-            raise TypeError("file_list is List, but now is %s" % type(file_list))
+        encoding:str = 'utf8', skip:bool = False, split_mode:str = 'file', cache_dir:str = '', cache_size:int = 1073741824, task_size:int = 0,
+        backend:str = 'process', boundary:Union[Boundary, None] = None):
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
         if not isinstance(header, List):
             raise TypeError("header is List, but now is %s" % type(header))
-        if len(header) < len(file_list):
-            header += [0 for _ in range(len(file_list) - len(header))]
-        elif len(header) > len(file_list):
-            raise ValueError("length of file list is %d, length of skip list is %d, skip gt file???" % (len(file_list), len(header)))
         self.encoding = encoding
         self.skip = skip
-        self.pointers, self.header = self.begin(file_list, threads, chunk_size, split_num, header)
+        self.split_mode = split_mode
+        self.task_size = task_size
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        self.engine = SliceEngine(NewlineBoundary() if boundary is None else boundary, backend, threads, split_mode, task_size, encoding, skip,
+            self.cache, {'slicer': type(self).__name__})
+        self.pointers, self.header = self.engine.slice(file_list, chunk_size, split_num, header)
+        self.worker_stats = self.engine.worker_stats
 
-    def begin(self, file_list:list, threads:int = 5, chunk_size:int = 100000, split_num:int = 0, header:list = []) -> tuple:
-        pool = mp.Pool(processes = threads)
-        pool_result = []
-        for every_file, every_header in zip(file_list, header):
-            parameters = [every_file, chunk_size, split_num, every_header]
-            pool_result.append(pool.apply_async(self.seek_file, parameters))
-        result, final_result, final_header = [], [], []
-        for e in pool_result:
-            e.wait()
-            result = e.get()
-            final_result += result[0]
-            final_header += result[1]
-        pool.close()
-        pool.join()
-        return final_result, final_header
-
-    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0, every_header:int = 0) -> list:
-        seek_result, header_result = [], []
-        if not os.path.exists(file):
-            raise FileNotFoundError("%s is not found!" % (file))
-        init_pointer = 0
-        total_size = os.path.getsize(file)
-        input_handle = open(file, 'rb')
-        if every_header > 0:
-            one_header = []
-            for _ in range(0, every_header):
-                if self.skip:
-                    _ = input_handle.readline()
-                else:
-                    one_header.append(input_handle.readline().decode(encoding = self.encoding).strip("\n"))
-            header_result.append(one_header)
-            init_pointer = input_handle.tell()
-        if split_num >= 1:
-            #recalculate chunk_size
-            chunk_size = int((total_size - init_pointer) / split_num)
-        while init_pointer < total_size:
-            #seek and find line ends
-            input_handle.seek(chunk_size, 1)
-            _ = input_handle.readline()
-            now_pointer = input_handle.tell()
-            if now_pointer == init_pointer:
-                continue
-            else:
-                #save result
-                seek_result.append((file, init_pointer, now_pointer))
-                #because the readline method is used
-                init_pointer = now_pointer
+    def resolve_offsets(self, file:str, offsets:List[int]) -> List[int]:
         '''
-            The problem of the last loop exceeding the file size is not dealt with,
-            because it will automatically stop if it exceeds the file size during reading
+            Resolve every candidate offset to the next line end on its own
         '''
-        input_handle.close()
-        return [seek_result, header_result]
+        return self.engine.resolve_offsets(file, offsets)
+
+    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0, every_header:int = 0) -> list:
+        return self.engine.seek_file(file, chunk_size, split_num, every_header)
 
 class FileSlicer:
     '''
@@ -107,63 +82,30 @@ class FileSlicer:
             b = open(every_block[0], 'rb')
             b.seek(every_block[1])
             c = b.read(every_block[2] - every_block[1]) #c is data for sub process
+        #or let map_chunks (see chunk_reader.py) mmap the files and pass memoryview of every block to func in child processes:
+        #for result in map_chunks(func, slicer, processes = 5): ...
     '''
-    def __init__(self, file_list:List[str], chunk_size:int = 100000, split_num:int = 0, header:List[int] = [], encoding:str = 'utf8', skip:bool = False):
-        if not isinstance(file_list, List):
-            raise TypeError("file_list is List, but now is %s" % type(file_list))
+    def __init__(self, file_list:List[str], chunk_size:int = 100000, split_num:int = 0, header:List[int] = [], encoding:str = 'utf8', skip:bool = False,
+        cache_dir:str = '', cache_size:int = 1073741824, boundary:Union[Boundary, None] = None):
+        if not isinstance(file_list, (List, Iterator)):
+            raise TypeError("file_list is List or Iterator, but now is %s" % type(file_list))
         if not isinstance(header, List):
             raise TypeError("header is List, but now is %s" % type(header))
         self.encoding = encoding
         self.skip = skip
+        self.cache = SliceCache(cache_dir, cache_size) if cache_dir != '' else None
+        self.engine = SliceEngine(NewlineBoundary() if boundary is None else boundary, 'serial', 1, encoding = encoding, skip = skip,
+            cache = self.cache, options = {'slicer': type(self).__name__})
         self.pointers, self.header = self.seek_file(file_list, chunk_size, split_num, header)
 
     def seek_file(self, file_list:list, chunk_size:int = 100000, split_num:int = 0, header:list = []) -> tuple:
-        if len(header) < len(file_list):
-            header += [0 for _ in range(len(file_list) - len(header))]
-        elif len(file_list) < len(header):
-            raise ValueError("length of file list is %d, length of skip list is %d, skip gt file???" % (len(file_list), len(header)))
-        seek_result, header_result = [], []
-        for every_file, every_header in zip(file_list, header):
-            if not os.path.exists(every_file):
-                raise FileNotFoundError("%s is not found!" % (every_file))
-            init_pointer = 0
-            total_size = os.path.getsize(every_file)
-            input_handle = open(every_file, 'rb')
-            if every_header > 0:
-                one_header = []
-                for _ in range(0, every_header):
-                    if self.skip:
-                        _ = input_handle.readline()
-                    else:
-                        one_header.append(input_handle.readline().decode(encoding = self.encoding).strip("\n"))
-                header_result.append(one_header)
-                init_pointer = input_handle.tell()
-            if split_num >= 1:
-                #recalculate chunk_size
-                chunk_size = int((total_size - init_pointer) / split_num)
-            while init_pointer < total_size:
-                #seek and find line ends
-                input_handle.seek(chunk_size, 1)
-                _ = input_handle.readline()
-                now_pointer = input_handle.tell()
-                if now_pointer == init_pointer:
-                    continue
-                else:
-                    #save result
-                    seek_result.append((every_file, init_pointer, now_pointer))
-                    #because the readline method is used
-                    init_pointer = now_pointer
-            '''
-                The problem of the last loop exceeding the file size is not dealt with,
-                because it will automatically stop if it exceeds the file size during reading
-            '''
-            input_handle.close()
-        return seek_result, header_result
+        return self.engine.slice(file_list, chunk_size, split_num, header)
 
 class FileSlicerAlpha:
     '''
         NOT RECOMMENDED FOR USE
         Read file and recode pointer, no support chinese and so slow
+        Use line_index.LineIndex.split_by_lines to split by line number
     '''
     def __init__(self, file_list, line_num, encoding = 'utf8', header = False):
         self.pointer_list = self.__seek_file(file_list, line_num, encoding, header)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+__all__ = ['find_files']
+
+'''
+    Readme:
+        find_files is the Python recursive_find_file (see perl/recursive_find_file.pm), folders are listed by os.scandir on a thread pool,
+        so the round trips of a shared file system (GPFS, Lustre, NFS ...) to list many folders overlap,
+        and (path, size) is yielded as soon as a file is found, the slicers accept it and start before the walk finishes.
+    Scheme:
+        1. Every worker thread take a folder from the queue, list it by os.scandir and put the sub folders back to the queue.
+        2. Type of an entry comes from the folder listing (DirEntry.is_dir and is_file do not stat on most file systems),
+            only the files which match pattern are stat for the size, so no os.path.getsize is needed in the slicers.
+        3. The walk ends when no folder is queued or being listed, hidden files and folders (start with .) are skipped like the perl one.
+    Options:
+        root: a folder, or a file (it is yielded as it is).
+        pattern: regex searched in the path of a file, '' match all files.
+        workers: number of threads listing folders.
+        follow_links: follow symlinks to folders, links are not followed by default so a link loop can not hang the walk.
+        onerror: like os.walk, called with the OSError of a folder which can not be listed (or a file which can not be stat),
+            the folder is skipped and the walk goes on; the error is logged by default, raise it in onerror to stop the walk.
+    Usage:
+        from find_files import find_files
+        slicer = MultiFileSlicer(find_files('data', r'\\.txt$', workers = 16), 100000)
+        #or get a sorted list of paths
+        file_list = sorted(i[0] for i in find_files('data', r'\\.fq\\.gz$'))
+'''
+
+import os
+import re
+import queue
+import logging
+import threading
+
+from typing import Callable, Iterator, Union
+
+#end of a worker thread in the result queue
+END = object()
+
+def find_files(root:str, pattern:str = '', workers:int = 8, follow_links:bool = False, onerror:Union[Callable, None] = None) -> Iterator[tuple]:
+    '''
+        Yield (absolute path, size) of every file under root whose path match pattern, in the order they are found
+    '''
+    if workers < 1:
+        raise ValueError("workers is must be ge 1, but now is %d" % workers)
+    if not os.path.exists(root):
+        raise FileNotFoundError("%s is not found!" % root)
+    root = os.path.abspath(root)
+    if os.path.isfile(root):
+        yield root, os.path.getsize(root)
+        return None
+    regex = re.compile(pattern)
+    folder_queue, result_queue = queue.Queue(), queue.Queue(maxsize = 65536)
+    stop_event = threading.Event()
+    #folders queued or being listed, the walk is done when it is 0
+    pending = [1]
+    pending_lock = threading.Lock()
+    folder_queue.put(root)
+
+    def put_result(item:object) -> bool:
+        #a bounded queue keeps memory low if the consumer is slow, a stopped consumer frees the worker
+        while not stop_event.is_set():
+            try:
+                result_queue.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def report(error:OSError) -> None:
+        if onerror is not None:
+            onerror(error)
+        else:
+            logging.getLogger('file_line_split').warning("%s is skipped by find_files: %s" % (error.filename, error.strerror))
+
+    def list_folder(folder:str) -> None:
+        #an unreadable folder (PermissionError ...) or a file removed while listing is skipped, it does not stop the walk
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks = follow_links):
+                        with pending_lock:
+                            pending[0] += 1
+                        folder_queue.put(entry.path)
+                    elif entry.is_file() and regex.search(entry.path):
+                        try:
+                            size = entry.stat().st_size
+                        except OSError as error:
+                            report(error)
+                            continue
+                        if not put_result((entry.path, size)):
+                            return None
+        except OSError as error:
+            report(error)
+
+    def worker() -> None:
+        try:
+            while not stop_event.is_set():
+                folder = folder_queue.get()
+                if folder is END:
+                    break
+                try:
+                    list_folder(folder)
+                finally:
+                    with pending_lock:
+                        pending[0] -= 1
+                        done = pending[0] == 0
+                    if done:
+                        #wake up all workers blocked on the empty folder queue
+                        for _ in range(workers):
+                            folder_queue.put(END)
+        except BaseException as e:
+            stop_event.set()
+            result_queue.put(e)
+            for _ in range(workers):
+                folder_queue.put(END)
+        finally:
+            result_queue.put(END)
+
+    threads = [threading.Thread(target = worker, daemon = True) for _ in range(workers)]
+    for every_thread in threads:
+        every_thread.start()
+    try:
+        ended = 0
+        while ended < workers:
+            item = result_queue.get()
+            if item is END:
+                ended += 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        #the consumer may stop early, free the workers blocked on the queues
+        stop_event.set()
+        for _ in range(workers):
+            folder_queue.put(END)
+        while any(i.is_alive() for i in threads):
+            try:
+                result_queue.get(timeout = 0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+__all__ = ['BgzfIndex', 'GzipIndex', 'IndexedGzipFile', 'GzipChunkReader', 'is_gzip', 'is_bgzf', 'load_index',
+    'open_slice_file', 'slice_size', 'slice_pointers']
+
+'''
+    Readme:
+        Random access of gzip files for the slicers, the slicers seek and readline in uncompressed space by IndexedGzipFile.
+        BGZF: every block is a complete gzip member, the block table is the index (htslib .gzi format, saved next to the file),
+            pointers of BGZF file are virtual offsets: compressed block offset << 16 | offset in uncompressed block,
+            same as htslib, so other tools can read the chunk too.
+        Plain gzip: one decompress pass build zran-style access points (compressed bit offset, uncompressed offset and the
+            32KB inflate window before the point), any chunk can be decompressed on its own from the nearest access point.
+            The index is saved next to the file as file.zran (or in the temp directory if the folder is not writable),
+            pointers of plain gzip file are uncompressed offsets.
+        Python zlib can not stop at deflate block ends or prime bits, so access points are built and used with libz by ctypes.
+    Usage:
+        from gzip_split import GzipChunkReader
+        reader = GzipChunkReader(every_block[0])
+        c = reader.read(every_block[1], every_block[2]) #c is data for sub process
+'''
+
+import os
+import io
+import zlib
+import ctypes
+import struct
+import hashlib
+import tempfile
+import threading
+import ctypes.util
+import numpy as np
+
+from typing import List, Union
+from collections import OrderedDict
+from .pointer_table import PointerTable
+
+GZIP_MAGIC = b'\x1f\x8b'
+WINDOW_SIZE = 32768
+BUFFER_SIZE = 262144
+#zlib constants
+Z_NO_FLUSH, Z_BLOCK = 0, 5
+Z_OK, Z_STREAM_END, Z_NEED_DICT, Z_BUF_ERROR = 0, 1, 2, -5
+
+class z_stream(ctypes.Structure):
+    _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+        ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+libz = None
+
+def load_libz() -> ctypes.CDLL:
+    global libz
+    if libz is None:
+        libz_path = ctypes.util.find_library('z')
+        if libz_path is None:
+            raise OSError("libz is not found, random access of plain gzip file is not supported!")
+        libz = ctypes.CDLL(libz_path)
+        libz.zlibVersion.restype = ctypes.c_char_p
+        for every_function in ('inflate', 'inflateEnd', 'inflateReset'):
+            getattr(libz, every_function).argtypes = [ctypes.POINTER(z_stream)] + ([ctypes.c_int] if every_function == 'inflate' else [])
+        libz.inflateInit2_.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        libz.inflateReset2.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int]
+        libz.inflatePrime.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int, ctypes.c_int]
+        libz.inflateSetDictionary.argtypes = [ctypes.POINTER(z_stream), ctypes.c_char_p, ctypes.c_uint]
+    return libz
+
+class InflateStream:
+    '''
+        libz inflate stream with a fixed input buffer
+    '''
+    def __init__(self, input_handle:io.RawIOBase, window_bits:int) -> None:
+        self.libz = load_libz()
+        self.input_handle = input_handle
+        self.strm = z_stream()
+        self.input_buffer = bytearray(BUFFER_SIZE)
+        self.input_address = ctypes.addressof((ctypes.c_char * BUFFER_SIZE).from_buffer(self.input_buffer))
+        ret = self.libz.inflateInit2_(ctypes.byref(self.strm), window_bits, self.libz.zlibVersion(), ctypes.sizeof(z_stream))
+        if ret != Z_OK:
+            raise zlib.error("inflateInit2 failed, return %d" % ret)
+
+    def fill(self, need:int = 1) -> int:
+        '''
+            Make avail_in ge need if the file is not end, return avail_in
+        '''
+        if self.strm.avail_in >= need:
+            return self.strm.avail_in
+        rest_size = self.strm.avail_in
+        if rest_size > 0:
+            self.input_buffer[:rest_size] = ctypes.string_at(self.strm.next_in, rest_size)
+        read_size = self.input_handle.readinto(memoryview(self.input_buffer)[rest_size:])
+        self.strm.next_in = self.input_address
+        self.strm.avail_in = rest_size + (read_size or 0)
+        return self.strm.avail_in
+
+    def take(self, size:int) -> bytes:
+        self.fill(size)
+        size = min(size, self.strm.avail_in)
+        data = ctypes.string_at(self.strm.next_in, size)
+        self.strm.next_in += size
+        self.strm.avail_in -= size
+        return data
+
+    def next_member(self) -> bool:
+        '''
+            After a member end, return True if the next input is a gzip member header
+        '''
+        if self.fill(2) < 2 or ctypes.string_at(self.strm.next_in, 2) != GZIP_MAGIC:
+            return False
+        return True
+
+    def inflate(self, flush:int) -> int:
+        ret = self.libz.inflate(ctypes.byref(self.strm), flush)
+        if ret not in (Z_OK, Z_STREAM_END, Z_BUF_ERROR):
+            raise zlib.error("inflate failed, return %d, %s" % (ret, self.strm.msg))
+        return ret
+
+    def close(self) -> None:
+        if self.strm is not None:
+            self.libz.inflateEnd(ctypes.byref(self.strm))
+            self.strm = None
+
+class GzipIndex:
+    '''
+        zran-style access points of a plain gzip file
+    '''
+    suffix = '.zran'
+
+    def __init__(self, file:str, size:int, ins:np.ndarray, outs:np.ndarray, bits:np.ndarray, windows:List[bytes]) -> None:
+        self.file = file
+        self.size = size
+        self.ins = np.asarray(ins, dtype = np.int64)
+        self.outs = np.asarray(outs, dtype = np.int64)
+        self.bits = np.asarray(bits, dtype = np.int8)
+        #windows are compressed by zlib
+        self.windows = windows
+
+    @classmethod
+    def build(cls, file:str, span:int = 4194304) -> 'GzipIndex':
+        '''
+            Decompress the whole file once, add an access point at a deflate block end every span uncompressed bytes
+        '''
+        ins, outs, bits, windows = [], [], [], []
+        window = bytearray(WINDOW_SIZE)
+        window_address = ctypes.addressof((ctypes.c_char * WINDOW_SIZE).from_buffer(window))
+        with open(file, 'rb', buffering = 0) as input_handle:
+            #47: automatic zlib or gzip header
+            stream = InflateStream(input_handle, 47)
+            strm = stream.strm
+            total_in, total_out, last_out = 0, 0, 0
+            try:
+                while True:
+                    if stream.fill() == 0:
+                        raise EOFError("%s is a truncated gzip file!" % file)
+                    if strm.avail_out == 0:
+                        strm.next_out = window_address
+                        strm.avail_out = WINDOW_SIZE
+                    total_in += strm.avail_in
+                    total_out += strm.avail_out
+                    ret = stream.inflate(Z_BLOCK)
+                    total_in -= strm.avail_in
+                    total_out -= strm.avail_out
+                    if ret == Z_STREAM_END:
+                        #trailer is consumed in gzip mode, concatenated members are common
+                        if not stream.next_member():
+                            break
+                        stream.libz.inflateReset(ctypes.byref(strm))
+                        continue
+                    #at the end of a deflate block or header, and not the last block
+                    if strm.data_type & 128 and not strm.data_type & 64 and (total_out == 0 or total_out - last_out > span):
+                        left = strm.avail_out
+                        ins.append(total_in)
+                        outs.append(total_out)
+                        bits.append(strm.data_type & 7)
+                        windows.append(zlib.compress(bytes(window[WINDOW_SIZE - left:] + window[:WINDOW_SIZE - left]), 1))
+                        last_out = total_out
+            finally:
+                stream.close()
+        return cls(file, total_out, ins, outs, bits, windows)
+
+    def save(self, index_file:str, identity:tuple) -> None:
+        window_offsets = np.cumsum([0] + [len(i) for i in self.windows], dtype = np.int64)
+        with open(index_file, 'wb') as output_handle:
+            np.savez(output_handle, identity = np.array(identity, dtype = np.int64), size = np.array([self.size], dtype = np.int64),
+                ins = self.ins, outs = self.outs, bits = self.bits, window_offsets = window_offsets,
+                windows = np.frombuffer(b''.join(self.windows), dtype = np.uint8))
+
+    @classmethod
+    def load(cls, file:str, index_file:str, identity:tuple) -> Union['GzipIndex', None]:
+        with np.load(index_file, allow_pickle = False) as npz_data:
+            if tuple(npz_data['identity'].tolist()) != tuple(identity):
+                return None
+            window_offsets, window_data = npz_data['window_offsets'], npz_data['windows'].tobytes()
+            windows = [window_data[i:j] for i, j in zip(window_offsets[:-1], window_offsets[1:])]
+            return cls(file, int(npz_data['size'][0]), npz_data['ins'], npz_data['outs'], npz_data['bits'], windows)
+
+    def decoder(self, position:int) -> 'GzipDecoder':
+        return GzipDecoder(self, position)
+
+    def virtual_offsets(self, offsets:np.ndarray) -> np.ndarray:
+        return np.asarray(offsets, dtype = np.int64)
+
+    def uncompressed_offsets(self, offsets:np.ndarray) -> np.ndarray:
+        return np.asarray(offsets, dtype = np.int64)
+
+class GzipDecoder:
+    '''
+        Decompress a plain gzip file from the nearest access point before position
+    '''
+    def __init__(self, index:GzipIndex, position:int) -> None:
+        point = max(0, int(np.searchsorted(index.outs, position, side = 'right')) - 1)
+        point_bits = int(index.bits[point])
+        self.input_handle = open(index.file, 'rb', buffering = 0)
+        self.input_handle.seek(int(index.ins[point]) - (1 if point_bits else 0))
+        #-15: raw deflate, access point is inside the deflate stream
+        self.stream = InflateStream(self.input_handle, -15)
+        if point_bits:
+            ret = self.stream.libz.inflatePrime(ctypes.byref(self.stream.strm), point_bits, self.stream.take(1)[0] >> (8 - point_bits))
+            if ret != Z_OK:
+                raise zlib.error("inflatePrime failed, return %d" % ret)
+        ret = self.stream.libz.inflateSetDictionary(ctypes.byref(self.stream.strm), zlib.decompress(index.windows[point]), WINDOW_SIZE)
+        if ret != Z_OK:
+            raise zlib.error("inflateSetDictionary failed, return %d" % ret)
+        self.output_buffer = bytearray(BUFFER_SIZE)
+        self.output_address = ctypes.addressof((ctypes.c_char * BUFFER_SIZE).from_buffer(self.output_buffer))
+        self.raw = True
+        self.eof = False
+        self.position = int(index.outs[point])
+        self.skip(position - self.position)
+
+    def read(self, size:int) -> bytes:
+        strm = self.stream.strm
+        request_size = min(size, BUFFER_SIZE)
+        strm.next_out = self.output_address
+        strm.avail_out = request_size
+        while strm.avail_out == request_size and not self.eof:
+            if self.stream.fill() == 0:
+                self.eof = True
+                break
+            ret = self.stream.inflate(Z_NO_FLUSH)
+            if ret == Z_STREAM_END:
+                if self.raw:
+                    #raw stream does not consume the trailer
+                    self.stream.take(8)
+                if self.stream.next_member():
+                    self.stream.libz.inflateReset2(ctypes.byref(strm), 47)
+                    self.raw = False
+                else:
+                    self.eof = True
+        read_size = request_size - strm.avail_out
+        self.position += read_size
+        return bytes(self.output_buffer[:read_size])
+
+    def skip(self, size:int) -> None:
+        while size > 0 and not self.eof:
+            size -= len(self.read(size))
+
+    def close(self) -> None:
+        self.stream.close()
+        self.input_handle.close()
+
+class BgzfIndex:
+    '''
+        Block table of a BGZF file, coffsets and uoffsets end with the end of data
+    '''
+    suffix = '.gzi'
+
+    def __init__(self, file:str, coffsets:np.ndarray, uoffsets:np.ndarray) -> None:
+        self.file = file
+        self.coffsets = np.asarray(coffsets, dtype = np.int64)
+        self.uoffsets = np.asarray(uoffsets, dtype = np.int64)
+        self.size = int(self.uoffsets[-1])
+
+    @classmethod
+    def build(cls, file:str, begin_offset:int = 0, begin_uoffset:int = 0) -> 'BgzfIndex':
+        '''
+            Read header and ISIZE of every block, block data is not decompressed
+        '''
+        coffsets, uoffsets = [begin_offset], [begin_uoffset]
+        input_fd = os.open(file, os.O_RDONLY)
+        try:
+            while True:
+                block_size = bgzf_block_size(os.pread(input_fd, 18, coffsets[-1]), file, coffsets[-1])
+                if block_size == 0:
+                    break
+                isize = struct.unpack('<I', os.pread(input_fd, 4, coffsets[-1] + block_size - 4))[0]
+                coffsets.append(coffsets[-1] + block_size)
+                uoffsets.append(uoffsets[-1] + isize)
+        finally:
+            os.close(input_fd)
+        #remove empty blocks (EOF marker), end of data is the end of the last block which is not empty
+        keep = [i for i in range(len(coffsets) - 1) if uoffsets[i + 1] != uoffsets[i]]
+        if len(keep) == 0:
+            return cls(file, [begin_offset], [begin_uoffset])
+        return cls(file, [coffsets[i] for i in keep] + [coffsets[keep[-1] + 1]], [uoffsets[i] for i in keep] + [uoffsets[-1]])
+
+    def save(self, index_file:str, identity:tuple) -> None:
+        '''
+            htslib .gzi format, number of entries and (compressed offset, uncompressed offset) of every block except the first
+        '''
+        with open(index_file, 'wb') as output_handle:
+            entries = np.stack([self.coffsets[1:-1], self.uoffsets[1:-1]], axis = 1).astype('<u8')
+            output_handle.write(struct.pack('<Q', len(entries)))
+            output_handle.write(entries.tobytes())
+
+    @classmethod
+    def load(cls, file:str, index_file:str, identity:tuple) -> Union['BgzfIndex', None]:
+        if os.stat(index_file).st_mtime_ns < identity[1]:
+            #index is older than the file
+            return None
+        with open(index_file, 'rb') as input_handle:
+            entry_num = struct.unpack('<Q', input_handle.read(8))[0]
+            entries = np.frombuffer(input_handle.read(entry_num * 16), dtype = '<u8').reshape(-1, 2).astype(np.int64)
+        #.gzi has no end of data, scan the blocks after the last entry
+        if entry_num == 0:
+            return cls.build(file)
+        tail_index = cls.build(file, int(entries[-1, 0]), int(entries[-1, 1]))
+        return cls(file, np.concatenate([[0], entries[:-1, 0], tail_index.coffsets]), np.concatenate([[0], entries[:-1, 1], tail_index.uoffsets]))
+
+    def decoder(self, position:int) -> 'BgzfDecoder':
+        return BgzfDecoder(self, position)
+
+    def virtual_offsets(self, offsets:np.ndarray) -> np.ndarray:
+        offsets = np.minimum(np.asarray(offsets, dtype = np.int64), self.size)
+        block = np.searchsorted(self.uoffsets, offsets, side = 'right') - 1
+        return (self.coffsets[block] << 16) | (offsets - self.uoffsets[block])
+
+    def uncompressed_offsets(self, offsets:np.ndarray) -> np.ndarray:
+        offsets = np.asarray(offsets, dtype = np.int64)
+        block = np.searchsorted(self.coffsets, offsets >> 16)
+        return self.uoffsets[block] + (offsets & 0xffff)
+
+class BgzfDecoder:
+    '''
+        Decompress a BGZF file block by block with zlib
+    '''
+    def __init__(self, index:BgzfIndex, position:int) -> None:
+        self.index = index
+        self.input_fd = os.open(index.file, os.O_RDONLY)
+        self.block, self.block_data = -1, b''
+        self.eof = False
+        self.position = 0
+        self.skip(position)
+
+    def load_block(self) -> None:
+        self.block = int(np.searchsorted(self.index.uoffsets, self.position, side = 'right')) - 1
+        if self.block >= len(self.index.coffsets) - 1:
+            self.eof, self.block_data = True, b''
+            return None
+        block_begin, block_end = int(self.index.coffsets[self.block]), int(self.index.coffsets[self.block + 1])
+        #data may end with empty blocks, decompressobj stop at the end of the first member
+        self.block_data = zlib.decompressobj(31).decompress(os.pread(self.input_fd, block_end - block_begin, block_begin))
+
+    def read(self, size:int) -> bytes:
+        if self.eof:
+            return b''
+        block_offset = self.position - int(self.index.uoffsets[self.block])
+        if block_offset >= len(self.block_data):
+            self.load_block()
+            return self.read(size)
+        data = self.block_data[block_offset:block_offset + size]
+        self.position += len(data)
+        return data
+
+    def skip(self, size:int) -> None:
+        self.position = min(self.position + size, self.index.size)
+        self.eof = False
+        self.load_block()
+
+    def close(self) -> None:
+        os.close(self.input_fd)
+
+def bgzf_block_size(header:bytes, file:str, offset:int) -> int:
+    '''
+        Return BSIZE + 1 of a BGZF block header, 0 at the end of file
+    '''
+    if len(header) == 0:
+        return 0
+    if len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04':
+        raise ValueError("%s is not a BGZF file, bad block header at %d!" % (file, offset))
+    extra_size = struct.unpack('<H', header[10:12])[0]
+    extra = header[12:12 + extra_size]
+    while len(extra) >= 4:
+        sub_size = struct.unpack('<H', extra[2:4])[0]
+        if extra[:2] == b'BC' and sub_size == 2:
+            return struct.unpack('<H', extra[4:6])[0] + 1
+        extra = extra[4 + sub_size:]
+    raise ValueError("%s is not a BGZF file, no BC field at %d!" % (file, offset))
+
+def is_gzip(file:str) -> bool:
+    with open(file, 'rb') as input_handle:
+        return input_handle.read(2) == GZIP_MAGIC
+
+def is_bgzf(file:str) -> bool:
+    with open(file, 'rb') as input_handle:
+        header = input_handle.read(18)
+    try:
+        return bgzf_block_size(header, file, 0) > 0
+    except ValueError:
+        return False
+
+#loaded indexes of this process (LRU), key is (absolute path, identity), R1 and R2 or several files are read in turn
+index_memo = OrderedDict()
+INDEX_MEMO_SIZE = 16
+index_memo_lock = threading.Lock()
+
+def index_files(file:str, suffix:str) -> List[str]:
+    '''
+        Index file next to the file, and the one in the temp directory if the folder is not writable
+    '''
+    temp_name = 'gzip_index_' + hashlib.sha1(os.path.abspath(file).encode('utf8')).hexdigest() + suffix
+    return [file + suffix, os.path.join(tempfile.gettempdir(), temp_name)]
+
+def load_index(file:str) -> Union[BgzfIndex, GzipIndex]:
+    '''
+        Load index of a gzip file, build and save it if it is not exists or stale
+    '''
+    file_stat = os.stat(file)
+    identity = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+    memo_key = (os.path.abspath(file), identity)
+    with index_memo_lock:
+        if memo_key in index_memo:
+            index_memo.move_to_end(memo_key)
+            return index_memo[memo_key]
+    index_class = BgzfIndex if is_bgzf(file) else GzipIndex
+    index = None
+    for every_index in index_files(file, index_class.suffix):
+        if os.path.exists(every_index):
+            try:
+                index = index_class.load(file, every_index, identity)
+            except (OSError, ValueError, KeyError):
+                index = None
+            if index is not None:
+                break
+    if index is None:
+        index = index_class.build(file)
+        for every_index in index_files(file, index_class.suffix):
+            #a unique temp file for every builder, processes and jobs building the same index never write one file
+            temp_file = '%s.%d.%s.tmp' % (every_index, os.getpid(), os.urandom(4).hex())
+            try:
+                index.save(temp_file, identity)
+                os.replace(temp_file, every_index)
+                break
+            except OSError:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                continue
+    with index_memo_lock:
+        index_memo[memo_key] = index
+        index_memo.move_to_end(memo_key)
+        while len(index_memo) > INDEX_MEMO_SIZE:
+            index_memo.popitem(last = False)
+    return index
+
+class IndexedGzipFile(io.RawIOBase):
+    '''
+        Seekable gzip file in uncompressed space, use io.BufferedReader for readline
+    '''
+    def __init__(self, file:str, index:Union[BgzfIndex, GzipIndex, None] = None) -> None:
+        self.file = file
+        self.index = load_index(file) if index is None else index
+        self.size = self.index.size
+        self.position = 0
+        self.decoder = None
+        #last decoded data, a short seek back (the boundary finders read ahead and return) does not restart the decoder
+        self.history = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset:int, whence:int = 0) -> int:
+        if whence == 0:
+            self.position = offset
+        elif whence == 1:
+            self.position += offset
+        elif whence == 2:
+            self.position = self.size + offset
+        else:
+            raise ValueError("whence is must be 0, 1 or 2, but now is %d" % whence)
+        if self.position < 0:
+            raise ValueError("negative seek position %d" % self.position)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer:memoryview) -> int:
+        if self.position >= self.size:
+            return 0
+        if self.decoder is not None and 0 < self.decoder.position - self.position <= len(self.history):
+            history_begin = len(self.history) - (self.decoder.position - self.position)
+            data = self.history[history_begin:history_begin + len(buffer)]
+            buffer[:len(data)] = data
+            self.position += len(data)
+            return len(data)
+        if self.decoder is not None and self.decoder.position != self.position:
+            #decode forward if it is near, else start from an access point
+            if 0 < self.position - self.decoder.position <= BUFFER_SIZE * 4:
+                self.decoder.skip(self.position - self.decoder.position)
+                self.history = b''
+            else:
+                self.decoder.close()
+                self.decoder = None
+                self.history = b''
+        if self.decoder is None:
+            self.decoder = self.index.decoder(self.position)
+        data = self.decoder.read(len(buffer))
+        self.history = (self.history + data)[-BUFFER_SIZE:] if len(data) < BUFFER_SIZE else data[-BUFFER_SIZE:]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if self.decoder is not None:
+            self.decoder.close()
+            self.decoder = None
+        super().close()
+
+class GzipChunkReader:
+    '''
+        Read chunk of slicer pointers, virtual offsets of BGZF file are converted here
+    '''
+    def __init__(self, file:str) -> None:
+        self.input_handle = IndexedGzipFile(file)
+
+    def read(self, begin_pointer:int, end_pointer:int) -> bytes:
+        begin_pointer, end_pointer = self.input_handle.index.uncompressed_offsets([begin_pointer, end_pointer]).tolist()
+        self.input_handle.seek(begin_pointer)
+        chunk_data, size = [], end_pointer - begin_pointer
+        while size > 0:
+            data = self.input_handle.read(size)
+            if not data:
+                break
+            chunk_data.append(data)
+            size -= len(data)
+        return b''.join(chunk_data)
+
+    def close(self) -> None:
+        self.input_handle.close()
+
+def open_slice_file(file:str) -> tuple:
+    '''
+        Return (input handle, total size) for the slicers, gzip file is opened in uncompressed space
+    '''
+    if is_gzip(file):
+        raw_handle = IndexedGzipFile(file)
+        return io.BufferedReader(raw_handle, buffer_size = 65536), raw_handle.size
+    return open(file, 'rb'), os.path.getsize(file)
+
+def slice_size(file:str) -> int:
+    '''
+        Total size of a file for the slicers, build the index of gzip file
+    '''
+    if is_gzip(file):
+        return load_index(file).size
+    return os.path.getsize(file)
+
+def slice_pointers(file:str, pointers:PointerTable) -> PointerTable:
+    '''
+        Convert uncompressed pointers of a BGZF file to virtual offsets, others are not changed
+    '''
+    if not is_gzip(file):
+        return pointers
+    index = load_index(file)
+    begins = index.virtual_offsets(np.minimum(pointers.begins, index.size))
+    ends = index.virtual_offsets(np.minimum(pointers.ends, index.size))
+    return PointerTable(pointers.paths, pointers.file_ids, begins, ends)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+__all__ = ['ParallelGzipWriter', 'BGZF_BLOCK_SIZE', 'BGZF_EOF']
+
+'''
+    Readme:
+        ParallelGzipWriter compress the output of slicer chunks on a thread pool (zlib release the GIL) and write the blocks in order,
+        it is the Python gzip_support of perl/safely_merge_file.pm without pigz.
+    Options:
+        mode: 'gzip' write one gzip member like pigz: every block is raw deflate ended by a sync flush,
+                the last 32KB of the block before is the dictionary of a block, so the ratio is close to a single-thread gzip.
+            'bgzf' write BGZF blocks (every block is a gzip member with the BC extra field and an EOF block at the end),
+                same as bgzip, the output can be sliced again by gzip_split without a full decompress.
+        level: compress level of zlib.
+        threads: number of compress threads.
+        block_size: uncompressed bytes of a block, 128KB in 'gzip' mode (same as pigz), 65280 in 'bgzf' mode (same as htslib).
+        index: 'bgzf' mode write the .gzi index (see gzip_split.BgzfIndex) when the writer is closed, so no scan is needed to slice it.
+    Usage:
+        from gzip_writer import ParallelGzipWriter
+        with ParallelGzipWriter('result.fq.gz', mode = 'bgzf', threads = 8) as output_handle:
+            for result in map_chunks(func, slicer):
+                output_handle.write(result)
+'''
+
+import io
+import time
+import zlib
+import struct
+
+from typing import Union
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from .gzip_split import BgzfIndex
+
+MODES = ['gzip', 'bgzf']
+WINDOW_SIZE = 32768
+#max uncompressed size of a BGZF block, and the empty block at the end of a BGZF file (htslib)
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+def deflate_block(data:bytes, level:int, zdict:bytes, last:bool) -> bytes:
+    '''
+        Raw deflate of a block of one gzip member, the block ends at a byte boundary (sync flush) unless it is the last one
+    '''
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def bgzf_block(data:bytes, level:int) -> bytes:
+    '''
+        A complete BGZF block, incompressible data is stored (level 0) so the block is not gt 64KB
+    '''
+    for every_level in (level, 0):
+        compressor = zlib.compressobj(every_level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) + 26 <= 65536:
+            break
+    header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + struct.pack('<H', len(compressed) + 25)
+    return header + compressed + struct.pack('<II', zlib.crc32(data), len(data))
+
+class ParallelGzipWriter(io.RawIOBase):
+    '''
+        Write bytes like a file, blocks are compressed by threads, close() write the rest and the trailer.
+        flush() does not cut a block, data less than block_size is kept until more data or close().
+    '''
+    def __init__(self, file:str, mode:str = 'gzip', level:int = 6, threads:int = 4, block_size:int = 0, index:bool = False) -> None:
+        super().__init__()
+        if mode not in MODES:
+            raise ValueError("mode is must be one of %s, but now is %s" % (MODES, mode))
+        if level < 0 or level > 9:
+            raise ValueError("level is must be in [0, 9], but now is %d" % level)
+        if threads < 1:
+            raise ValueError("threads is must be ge 1, but now is %d" % threads)
+        if block_size <= 0:
+            block_size = BGZF_BLOCK_SIZE if mode == 'bgzf' else 131072
+        if mode == 'bgzf' and block_size > BGZF_BLOCK_SIZE:
+            raise ValueError("block_size of bgzf is must be le %d, but now is %d" % (BGZF_BLOCK_SIZE, block_size))
+        self.file = file
+        self.gzip_mode = mode
+        self.level = level
+        self.block_size = block_size
+        self.index = index
+        self.buffer = bytearray()
+        #gzip mode: last 32KB of data as the dictionary of the next block, crc and size of all data
+        self.dictionary = b''
+        self.crc = 0
+        self.size = 0
+        #bgzf mode: compressed and uncompressed offsets of blocks
+        self.coffsets, self.uoffsets = [0], [0]
+        self.pool = ThreadPool(processes = threads)
+        self.pending = deque()
+        self.max_pending = threads * 4
+        self.output_handle = open(file, 'wb')
+        if mode == 'gzip':
+            #gzip header: no name, mtime, unknown OS
+            self.output_handle.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff')
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data:Union[bytes, bytearray, memoryview]) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        view = memoryview(data).cast('B')
+        offset = 0
+        if len(self.buffer) > 0:
+            offset = min(self.block_size - len(self.buffer), len(view))
+            self.buffer += view[:offset]
+            if len(self.buffer) < self.block_size:
+                return len(view)
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        #whole blocks are cut from data, no copy into the buffer
+        while len(view) - offset >= self.block_size:
+            self.submit(view[offset:offset + self.block_size].tobytes())
+            offset += self.block_size
+        self.buffer += view[offset:]
+        return len(view)
+
+    def submit(self, block:bytes, last:bool = False) -> None:
+        if self.gzip_mode == 'bgzf':
+            self.pending.append((len(block), self.pool.apply_async(bgzf_block, [block, self.level])))
+        else:
+            self.crc = zlib.crc32(block, self.crc)
+            self.size += len(block)
+            self.pending.append((len(block), self.pool.apply_async(deflate_block, [block, self.level, self.dictionary, last])))
+            self.dictionary = (self.dictionary + block)[-WINDOW_SIZE:] if len(block) < WINDOW_SIZE else block[-WINDOW_SIZE:]
+        self.write_done(self.max_pending)
+
+    def write_done(self, max_pending:int = 0) -> None:
+        '''
+            Write the compressed blocks in order, wait for the first one if more than max_pending blocks are pending
+        '''
+        while self.pending and (self.pending[0][1].ready() or len(self.pending) > max_pending):
+            block_size, pool_result = self.pending.popleft()
+            compressed = pool_result.get()
+            self.output_handle.write(compressed)
+            self.coffsets.append(self.coffsets[-1] + len(compressed))
+            self.uoffsets.append(self.uoffsets[-1] + block_size)
+
+    def close(self) -> None:
+        if self.closed:
+            return None
+        try:
+            if self.gzip_mode == 'bgzf':
+                if len(self.buffer) > 0:
+                    self.submit(bytes(self.buffer))
+                self.write_done()
+                self.output_handle.write(BGZF_EOF)
+            else:
+                #the last block has the final bit, it may be empty
+                self.submit(bytes(self.buffer), last = True)
+                self.write_done()
+                self.output_handle.write(struct.pack('<II', self.crc, self.size & 0xffffffff))
+            self.buffer = bytearray()
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.output_handle.close()
+            super().close()
+        if self.gzip_mode == 'bgzf' and self.index:
+            #the index is written after the file, so it is not older than the file
+            BgzfIndex(self.file, self.coffsets, self.uoffsets).save(self.file + BgzfIndex.suffix, ())
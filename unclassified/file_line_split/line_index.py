@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+__all__ = ['LineIndex', 'load_line_index']
+
+'''
+    Readme:
+        LineIndex is a sparse line index of a file, (line number, offset of line start) of every step-th line,
+        so the offset of any line is found by reading at most step lines after the nearest indexed line.
+        The index is built by one parallel pass: every process counts the newlines of its own block with numpy
+        and keeps the local sample points, the line numbers are fixed by a prefix sum of the block counts.
+        The index is saved next to the file as file.lidx (or in the temp directory if the folder is not writable),
+        it is rebuilt if the file is changed.
+    Usage:
+        from line_index import load_line_index
+        index = load_line_index(fp1, threads = 5)
+        index.offset_of_line(1000000) #offset of the start of line 1000000 (0-based)
+        index.split_by_lines(4000) #PointerTable, every chunk has exactly 4000 lines except the last one
+        index.split_by_records(1000) #PointerTable of 4-line FASTQ, every chunk has exactly 1000 records except the last one
+    gzip support:
+        gzip file is indexed in uncompressed space (see gzip_split.py), pointers of BGZF file are virtual offsets.
+'''
+
+import os
+import numpy as np
+import multiprocessing as mp
+
+from typing import List, Union
+from .pointer_table import PointerTable
+from .gzip_split import index_files, open_slice_file, slice_size, slice_pointers
+
+READ_SIZE = 8388608
+
+class LineIndex:
+    '''
+        lines[i] is a line number and offsets[i] is the offset of its start, lines[0] is line 0 at offset 0
+    '''
+    suffix = '.lidx'
+
+    def __init__(self, file:str, size:int, line_count:int, lines:np.ndarray, offsets:np.ndarray) -> None:
+        self.file = file
+        self.size = size
+        self.line_count = line_count
+        self.lines = np.asarray(lines, dtype = np.int64)
+        self.offsets = np.asarray(offsets, dtype = np.int64)
+
+    @classmethod
+    def build(cls, file:str, step:int = 16384, threads:int = 5, block_size:int = 67108864) -> 'LineIndex':
+        '''
+            Count newlines of every block in parallel, keep the start of every step-th line of the block
+        '''
+        if step <= 0 or block_size <= 0:
+            raise ValueError("step and block_size are must be gt 0, but now are %d and %d" % (step, block_size))
+        size = slice_size(file)
+        blocks = [(file, i, min(i + block_size, size), step) for i in range(0, size, block_size)]
+        if threads > 1 and len(blocks) > 1:
+            with mp.Pool(processes = min(threads, len(blocks))) as pool:
+                block_result = pool.starmap(count_block, blocks)
+        else:
+            block_result = [count_block(*i) for i in blocks]
+        lines, offsets, line_count = [np.zeros(1, dtype = np.int64)], [np.zeros(1, dtype = np.int64)], 0
+        for block_count, block_lines, block_offsets in block_result:
+            lines.append(block_lines + line_count)
+            offsets.append(block_offsets)
+            line_count += block_count
+        if size > 0 and read_range(file, size - 1, size) != b'\n':
+            #the last line has no line end
+            line_count += 1
+        return cls(file, size, line_count, np.concatenate(lines), np.concatenate(offsets))
+
+    def save(self, index_file:str, identity:tuple) -> None:
+        with open(index_file, 'wb') as output_handle:
+            np.savez(output_handle, identity = np.array(identity, dtype = np.int64), size = np.array([self.size, self.line_count], dtype = np.int64),
+                lines = self.lines, offsets = self.offsets)
+
+    @classmethod
+    def load(cls, file:str, index_file:str, identity:tuple) -> Union['LineIndex', None]:
+        with np.load(index_file, allow_pickle = False) as npz_data:
+            if tuple(npz_data['identity'].tolist()) != tuple(identity):
+                return None
+            size, line_count = npz_data['size'].tolist()
+            return cls(file, size, line_count, npz_data['lines'], npz_data['offsets'])
+
+    def offset_of_line(self, line:int) -> int:
+        '''
+            Offset of the start of a line (0-based), line_count is the end of file
+        '''
+        return int(self.offsets_of_lines([line])[0])
+
+    def offsets_of_lines(self, lines:Union[List[int], np.ndarray]) -> np.ndarray:
+        '''
+            Offsets of the start of many lines, every indexed segment is read once
+        '''
+        lines = np.asarray(lines, dtype = np.int64)
+        if len(lines) > 0 and (lines.min() < 0 or lines.max() > self.line_count):
+            raise IndexError("line is must be in [0, %d], but now is %d" % (self.line_count, lines.min() if lines.min() < 0 else lines.max()))
+        order = np.argsort(lines, kind = 'stable')
+        segments = np.searchsorted(self.lines, lines[order], side = 'right') - 1
+        #newlines to skip from the indexed line, the line starts after the last of them
+        skip_lines = lines[order] - self.lines[segments]
+        sorted_result = self.offsets[segments]
+        need = np.flatnonzero(skip_lines > 0)
+        for segment, group_begin, group_size in zip(*np.unique(segments[need], return_index = True, return_counts = True)):
+            group = need[group_begin:group_begin + group_size]
+            segment_end = self.offsets[segment + 1] if segment + 1 < len(self.offsets) else self.size
+            positions = newline_positions(self.file, int(self.offsets[segment]), int(segment_end), int(skip_lines[group].max()))
+            #no newline after the last line of a file without line end, line_count starts at the end of file
+            found = skip_lines[group] <= len(positions)
+            sorted_result[group[found]] = positions[skip_lines[group][found] - 1] + 1
+            sorted_result[group[~found]] = self.size
+        result = np.empty(len(lines), dtype = np.int64)
+        result[order] = sorted_result
+        return result
+
+    def split_by_lines(self, line_num:int, first_line:int = 0) -> PointerTable:
+        '''
+            Chunks of exactly line_num lines from first_line (skip header), the last chunk has the rest
+        '''
+        if line_num <= 0:
+            raise ValueError("line_num is must be gt 0, but now is %d" % line_num)
+        if first_line >= self.line_count:
+            return PointerTable([self.file])
+        boundaries = self.offsets_of_lines(list(range(first_line, self.line_count, line_num)) + [self.line_count])
+        return slice_pointers(self.file, PointerTable.from_ranges(self.file, boundaries[:-1], boundaries[1:]))
+
+    def split_by_records(self, record_num:int, record_lines:int = 4, first_line:int = 0) -> PointerTable:
+        '''
+            Chunks of exactly record_num records of record_lines lines (4-line FASTQ), the last chunk has the rest
+        '''
+        if (self.line_count - first_line) % record_lines != 0:
+            raise ValueError("%s has %d lines after line %d, it is not a %d-line record file!" % (self.file, self.line_count - first_line, first_line, record_lines))
+        return self.split_by_lines(record_num * record_lines, first_line)
+
+def read_range(file:str, begin:int, end:int) -> bytes:
+    input_handle = open_slice_file(file)[0]
+    with input_handle:
+        input_handle.seek(begin)
+        return input_handle.read(end - begin)
+
+def count_block(file:str, begin:int, end:int, step:int) -> tuple:
+    '''
+        Return (newline count, local line numbers, line start offsets) of every step-th line start of a block
+    '''
+    block_count, lines, offsets = 0, [], []
+    input_handle = open_slice_file(file)[0]
+    with input_handle:
+        input_handle.seek(begin)
+        for read_begin in range(begin, end, READ_SIZE):
+            data = input_handle.read(min(READ_SIZE, end - read_begin))
+            positions = np.flatnonzero(np.frombuffer(data, dtype = np.uint8) == 10)
+            #newline k (1-based in block) starts line k of the block
+            sample = np.arange((step - block_count % step) % step or step, len(positions) + 1, step) - 1
+            lines.append(sample + block_count + 1)
+            offsets.append(positions[sample] + read_begin + 1)
+            block_count += len(positions)
+    return block_count, np.concatenate(lines).astype(np.int64), np.concatenate(offsets).astype(np.int64)
+
+def newline_positions(file:str, begin:int, end:int, count:int) -> np.ndarray:
+    '''
+        Offsets of the first count newlines from begin, end is a hint of where they end
+    '''
+    positions, found = [], 0
+    input_handle = open_slice_file(file)[0]
+    with input_handle:
+        input_handle.seek(begin)
+        read_begin, data = begin, input_handle.read(end - begin if end > begin else READ_SIZE)
+        while data:
+            positions.append(np.flatnonzero(np.frombuffer(data, dtype = np.uint8) == 10) + read_begin)
+            found += len(positions[-1])
+            if found >= count:
+                break
+            read_begin += len(data)
+            data = input_handle.read(READ_SIZE)
+    if len(positions) == 0:
+        return np.zeros(0, dtype = np.int64)
+    return np.concatenate(positions)[:count]
+
+def load_line_index(file:str, step:int = 16384, threads:int = 5) -> LineIndex:
+    '''
+        Load line index of a file, build and save it if it is not exists or stale
+    '''
+    if not os.path.exists(file):
+        raise FileNotFoundError("%s is not found!" % (file))
+    file_stat = os.stat(file)
+    identity = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+    for every_index in index_files(file, LineIndex.suffix):
+        if os.path.exists(every_index):
+            try:
+                index = LineIndex.load(file, every_index, identity)
+            except (OSError, ValueError, KeyError):
+                index = None
+            if index is not None:
+                return index
+    index = LineIndex.build(file, step, threads)
+    for every_index in index_files(file, LineIndex.suffix):
+        try:
+            index.save(every_index + '.tmp', identity)
+            os.replace(every_index + '.tmp', every_index)
+            break
+        except OSError:
+            continue
+    return index
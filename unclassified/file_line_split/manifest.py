@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+__all__ = ['ChunkManifest', 'file_checksum']
+
+'''
+    Readme:
+        ChunkManifest record the status of every chunk of a slicer in a journal, so a job killed by the wall-time limit
+        resume from the chunks which are not done, and more jobs can share the chunks of one manifest.
+    Journal:
+        Append-only JSON lines, the first line is the chunks ({"op": "init", "chunks": [[file, begin, end], ...]}),
+        every change of a chunk is one line: claim (owner and lease end time), renew, done (output path and checksum), fail.
+        A line is written by one os.write with O_APPEND and fsync, a line without line end (the writer is killed) is ignored,
+        so the journal is never corrupted by a crash. The status of a chunk is its last line.
+    Status:
+        pending: never claimed, failed, or the lease of its claim is expired (the job is dead).
+        running: claimed and the lease is not expired, the worker call renew to keep a long chunk.
+        done: output and checksum are recorded, resume(verify = True) check the output again.
+    Claim:
+        Read the new lines and append the claim lines under flock of the journal, so two jobs never claim the same chunk.
+        flock of one fd does not exclude the threads of a process, so a threading.Lock is taken with it.
+        renew and done read the journal under the lock, they raise PermissionError unless the last claim of the chunk is of this owner
+        (the lease was expired and an other job claimed the chunk), so the chunk is not done by two jobs.
+    Usage:
+        from manifest import ChunkManifest
+        manifest = ChunkManifest('job.manifest', MultiFileSlicer([fp1, fp2], 100000), lease = 3600)
+        for index, file, begin_pointer, end_pointer in manifest.claims():
+            output = 'out/chunk_%d.txt' % index
+            ... #process the chunk and write output
+            manifest.done(index, output)
+        #a resubmitted job or a second job run the same code, done chunks are skipped
+'''
+
+import os
+import json
+import time
+import fcntl
+import socket
+import hashlib
+import threading
+
+from typing import Dict, Iterator, List, Union
+from .pointer_table import PointerTable
+
+STATUS = ['pending', 'running', 'done']
+
+def file_checksum(file:str, block_size:int = 4194304) -> str:
+    '''
+        sha256 of a file
+    '''
+    digest = hashlib.sha256()
+    with open(file, 'rb') as input_handle:
+        for block in iter(lambda: input_handle.read(block_size), b''):
+            digest.update(block)
+    return 'sha256:' + digest.hexdigest()
+
+def default_owner() -> str:
+    #PBS and Slurm job id make the owner readable in the journal
+    job_id = os.environ.get('PBS_JOBID', os.environ.get('SLURM_JOB_ID', ''))
+    return '%s:%d%s' % (socket.gethostname(), os.getpid(), ':' + job_id if job_id else '')
+
+class ChunkManifest:
+    '''
+        Open the journal if it exists, or create it from source (a slicer object, a PointerTable or a list of pointers).
+        lease: seconds a claim is kept without renew, set it longer than the processing time of one chunk.
+    '''
+    def __init__(self, file:str, source:Union[object, PointerTable, List[tuple], None] = None, lease:float = 3600, owner:str = '') -> None:
+        if lease <= 0:
+            raise ValueError("lease is must be gt 0, but now is %s" % lease)
+        self.file = file
+        self.lease = lease
+        self.owner = owner
+        self.chunks = None
+        self.state = {}
+        self.read_pointer = 0
+        self.fd, self.fd_pid, self.thread_lock = None, None, None
+        chunks = None
+        if source is not None:
+            pointers = source.pointers if hasattr(source, 'pointers') else source
+            chunks = [[str(i[0]), int(i[1]), int(i[2])] for i in pointers]
+        with self.locked():
+            self.refresh()
+            if self.chunks is None:
+                if chunks is None:
+                    raise FileNotFoundError("%s is not a manifest, source is must be given to create it!" % file)
+                self.append({'op': 'init', 'chunks': chunks, 'time': time.time()})
+                self.refresh()
+        if chunks is not None and chunks != self.chunks:
+            raise ValueError("%s is a manifest of other chunks, remove it or use the same slicer options!" % file)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def handle(self) -> int:
+        '''
+            fd of the journal, a child process (fork) open its own, so flock of processes are independent
+        '''
+        if self.fd is None or self.fd_pid != os.getpid():
+            self.fd, self.fd_pid = os.open(self.file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644), os.getpid()
+            #threads of this process share the fd, the lock of a forked parent may be held by a thread which is not copied
+            self.thread_lock = threading.Lock()
+        return self.fd
+
+    def locked(self) -> 'JournalLock':
+        fd = self.handle()
+        return JournalLock(fd, self.thread_lock)
+
+    def owner_name(self) -> str:
+        return self.owner or default_owner()
+
+    def check_owner(self, index:int, op:str) -> None:
+        '''
+            Raise PermissionError unless the last claim of the chunk is of this owner, the caller hold the lock and refresh
+        '''
+        chunk_state = self.state.get(index)
+        if chunk_state is None or chunk_state['status'] != 'running' or chunk_state['owner'] != self.owner_name():
+            holder = 'nobody' if chunk_state is None else '%s (%s)' % (chunk_state['owner'], chunk_state['status'])
+            raise PermissionError("Can not %s chunk %d of %s, it is claimed by %s, not by %s!" % (op, index, self.file, holder,
+                self.owner_name()))
+
+    def append(self, record:dict) -> None:
+        '''
+            Write one line at the end of journal, the caller hold the lock
+        '''
+        record.setdefault('owner', self.owner_name())
+        line = (json.dumps(record, separators = (',', ':')) + '\n').encode('utf8')
+        size = os.fstat(self.handle()).st_size
+        if size > 0 and os.pread(self.handle(), 1, size - 1) != b'\n':
+            #end the torn line of a crashed writer, so this line is not glued to it
+            line = b'\n' + line
+        written = os.write(self.handle(), line)
+        if written != len(line):
+            raise OSError("%d of %d bytes are written to %s!" % (written, len(line), self.file))
+        os.fsync(self.handle())
+
+    def refresh(self) -> None:
+        '''
+            Read the complete lines written after the last refresh, the caller hold the lock
+        '''
+        size = os.fstat(self.handle()).st_size
+        if size <= self.read_pointer:
+            return None
+        data = os.pread(self.handle(), size - self.read_pointer, self.read_pointer)
+        #the last line without line end is a write interrupted by a crash, it is skipped
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                #a torn line followed by later lines
+                continue
+            self.apply(record)
+        self.read_pointer += len(complete)
+
+    def apply(self, record:dict) -> None:
+        if record.get('op') == 'init':
+            if self.chunks is None:
+                self.chunks = record['chunks']
+            return None
+        index = record.get('chunk')
+        if not isinstance(index, int):
+            return None
+        if record['op'] in ['claim', 'renew']:
+            self.state[index] = {'status': 'running', 'owner': record['owner'], 'expire': record['expire']}
+        elif record['op'] == 'done':
+            self.state[index] = {'status': 'done', 'owner': record['owner'], 'output': record.get('output', ''),
+                'checksum': record.get('checksum', '')}
+        elif record['op'] == 'fail':
+            self.state[index] = {'status': 'pending', 'owner': record['owner'], 'error': record.get('error', '')}
+
+    def status_of(self, index:int, now:float = 0) -> str:
+        chunk_state = self.state.get(index)
+        if chunk_state is None or chunk_state['status'] == 'pending':
+            return 'pending'
+        if chunk_state['status'] == 'running' and chunk_state['expire'] < (now or time.time()):
+            #the lease is expired, the owner is dead or too slow
+            return 'pending'
+        return chunk_state['status']
+
+    def status(self) -> Dict[str, int]:
+        '''
+            Number of chunks of every status
+        '''
+        with self.locked():
+            self.refresh()
+        now = time.time()
+        counts = {i: 0 for i in STATUS}
+        for index in range(len(self.chunks)):
+            counts[self.status_of(index, now)] += 1
+        return counts
+
+    def resume(self, verify:bool = False) -> List[int]:
+        '''
+            Index of the chunks which are not done, verify = True also return done chunks whose output is lost or changed
+        '''
+        with self.locked():
+            self.refresh()
+        now = time.time()
+        resume_result = []
+        for index in range(len(self.chunks)):
+            if self.status_of(index, now) != 'done':
+                resume_result.append(index)
+            elif verify and not self.output_ok(self.state[index]):
+                resume_result.append(index)
+        return resume_result
+
+    def output_ok(self, chunk_state:dict) -> bool:
+        output, checksum = chunk_state.get('output', ''), chunk_state.get('checksum', '')
+        if output == '':
+            return True
+        if not os.path.exists(output):
+            return False
+        return checksum == '' or file_checksum(output) == checksum
+
+    def claim(self, number:int = 1, indexes:Union[List[int], None] = None) -> List[tuple]:
+        '''
+            Claim up to number pending chunks (of indexes, all chunks by default), return [(index, file, begin, end), ...]
+        '''
+        claim_result = []
+        with self.locked():
+            self.refresh()
+            now = time.time()
+            for index in (range(len(self.chunks)) if indexes is None else indexes):
+                if len(claim_result) >= number:
+                    break
+                if self.status_of(index, now) == 'pending':
+                    self.append({'op': 'claim', 'chunk': index, 'expire': now + self.lease, 'time': now})
+                    claim_result.append((index, *self.chunks[index]))
+            self.refresh()
+        return claim_result
+
+    def claims(self, number:int = 1, verify:bool = False) -> Iterator[tuple]:
+        '''
+            Claim and yield chunks until no chunk is pending, the caller call done (or fail) for every chunk.
+            verify = True claim the done chunks whose output is lost or changed again.
+        '''
+        redo = [] if not verify else [i for i in self.resume(verify = True) if self.status_of(i) == 'done']
+        for index in redo:
+            with self.locked():
+                self.append({'op': 'fail', 'chunk': index, 'error': 'output is lost or changed', 'time': time.time()})
+                self.refresh()
+        while True:
+            claim_result = self.claim(number)
+            if len(claim_result) == 0:
+                break
+            yield from claim_result
+
+    def renew(self, index:int) -> None:
+        '''
+            Extend the lease of a running chunk of this owner
+        '''
+        with self.locked():
+            self.refresh()
+            self.check_owner(index, 'renew')
+            now = time.time()
+            self.append({'op': 'renew', 'chunk': index, 'expire': now + self.lease, 'time': now})
+            self.refresh()
+
+    def done(self, index:int, output:str = '', checksum:str = '') -> None:
+        '''
+            Mark a chunk done, checksum of output is computed if it is not given, write output with fsync before done
+        '''
+        if output != '' and checksum == '':
+            checksum = file_checksum(output)
+        with self.locked():
+            self.refresh()
+            self.check_owner(index, 'done')
+            self.append({'op': 'done', 'chunk': index, 'output': output, 'checksum': checksum, 'time': time.time()})
+            self.refresh()
+
+    def fail(self, index:int, error:str = '') -> None:
+        '''
+            Give a chunk back, it is pending again
+        '''
+        with self.locked():
+            self.append({'op': 'fail', 'chunk': index, 'error': error, 'time': time.time()})
+            self.refresh()
+
+    def outputs(self) -> List[str]:
+        '''
+            Output of every chunk in order of chunks, '' if the chunk is not done, it is the input of file_merge.merge_files
+        '''
+        with self.locked():
+            self.refresh()
+        return [self.state[i].get('output', '') if self.status_of(i) == 'done' else '' for i in range(len(self.chunks))]
+
+    def close(self) -> None:
+        if self.fd is not None and self.fd_pid == os.getpid():
+            os.close(self.fd)
+        self.fd, self.fd_pid = None, None
+
+    def __getstate__(self) -> dict:
+        #fd and lock are not passed to a child process
+        return dict(self.__dict__, fd = None, fd_pid = None, thread_lock = None)
+
+class JournalLock:
+    '''
+        flock of the journal fd, exclusive between processes and jobs (GPFS and NFS support flock of different nodes),
+        and the threading.Lock of the manifest, exclusive between threads which share the fd
+    '''
+    def __init__(self, fd:int, thread_lock:threading.Lock) -> None:
+        self.fd = fd
+        self.thread_lock = thread_lock
+
+    def __enter__(self) -> 'JournalLock':
+        self.thread_lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args) -> None:
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.thread_lock.release()
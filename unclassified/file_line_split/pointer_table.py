@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+__all__ = ['PointerTable']
+
+'''
+    Readme:
+        PointerTable is a compact pointers result of the slicers, a file id column and int64 begin/end columns with a small path list,
+        instead of a list of (file_path, begin_pointer, end_pointer) tuples which hold their own reference to the path string.
+        8.5 million pointers cost about 170MB, and pickle to child process or disk is a copy of three arrays.
+    Usage:
+        for every_block in PointerTable: every_block is (file_path, begin_pointer, end_pointer), same as the old tuple list.
+        PointerTable[i] is a tuple, PointerTable[i:j] and PointerTable.file(file_path) are PointerTable.
+        PointerTable.to_list() return the old tuple list.
+        PointerTable.save(file) and PointerTable.load(file) use numpy npz format.
+'''
+
+import numpy as np
+
+from typing import List, Iterator, Union
+
+class PointerTable:
+    '''
+        from pointer_table import PointerTable
+        table = PointerTable.from_list([(fp1, 0, 100), (fp1, 100, 200), (fp2, 0, 50)])
+        for every_block in table.file(fp1):
+            b = open(every_block[0], 'rb')
+            b.seek(every_block[1])
+            c = b.read(every_block[2] - every_block[1])
+    '''
+    iter_size = 65536
+
+    def __init__(self, paths:List[str] = [], file_ids:np.ndarray = None, begins:np.ndarray = None, ends:np.ndarray = None) -> None:
+        self.paths = list(paths)
+        self.path_ids = {every_path: every_id for every_id, every_path in enumerate(self.paths)}
+        self.file_ids = np.zeros(0, dtype = np.int32) if file_ids is None else np.asarray(file_ids, dtype = np.int32)
+        self.begins = np.zeros(0, dtype = np.int64) if begins is None else np.asarray(begins, dtype = np.int64)
+        self.ends = np.zeros(0, dtype = np.int64) if ends is None else np.asarray(ends, dtype = np.int64)
+        if not (len(self.file_ids) == len(self.begins) == len(self.ends)):
+            raise ValueError("length of file_ids, begins and ends is %d, %d, %d, they are must be equal!" % (len(self.file_ids), len(self.begins), len(self.ends)))
+
+    @classmethod
+    def from_list(cls, pointers:List[tuple]) -> 'PointerTable':
+        '''
+            Build from the old [(file_path, begin_pointer, end_pointer), ...] list
+        '''
+        paths, path_ids = [], {}
+        file_ids = np.empty(len(pointers), dtype = np.int32)
+        begins = np.empty(len(pointers), dtype = np.int64)
+        ends = np.empty(len(pointers), dtype = np.int64)
+        for index, (every_path, begin_pointer, end_pointer) in enumerate(pointers):
+            if every_path not in path_ids:
+                path_ids[every_path] = len(paths)
+                paths.append(every_path)
+            file_ids[index] = path_ids[every_path]
+            begins[index] = begin_pointer
+            ends[index] = end_pointer
+        return cls(paths, file_ids, begins, ends)
+
+    @classmethod
+    def from_ranges(cls, path:str, begins:Union[List[int], np.ndarray], ends:Union[List[int], np.ndarray]) -> 'PointerTable':
+        '''
+            Build from begin and end pointers of one file
+        '''
+        return cls([path], np.zeros(len(begins), dtype = np.int32), begins, ends)
+
+    @classmethod
+    def concat(cls, tables:List['PointerTable']) -> 'PointerTable':
+        '''
+            Join several tables in order, path list is merged
+        '''
+        paths, path_ids, file_ids = [], {}, []
+        for every_table in tables:
+            id_map = np.empty(len(every_table.paths), dtype = np.int32)
+            for every_id, every_path in enumerate(every_table.paths):
+                if every_path not in path_ids:
+                    path_ids[every_path] = len(paths)
+                    paths.append(every_path)
+                id_map[every_id] = path_ids[every_path]
+            file_ids.append(id_map[every_table.file_ids])
+        if len(tables) == 0:
+            return cls()
+        return cls(paths, np.concatenate(file_ids), np.concatenate([i.begins for i in tables]), np.concatenate([i.ends for i in tables]))
+
+    def __len__(self) -> int:
+        return len(self.begins)
+
+    def __getitem__(self, index:Union[int, slice, np.ndarray]) -> Union[tuple, 'PointerTable']:
+        if isinstance(index, (int, np.integer)):
+            return (self.paths[self.file_ids[index]], int(self.begins[index]), int(self.ends[index]))
+        #slice and index array share the path list
+        return PointerTable(self.paths, self.file_ids[index], self.begins[index], self.ends[index])
+
+    def __iter__(self) -> Iterator[tuple]:
+        #convert a block at a time, do not build millions of int objects at once
+        for block_begin in range(0, len(self), self.iter_size):
+            block_end = block_begin + self.iter_size
+            for file_id, begin_pointer, end_pointer in zip(self.file_ids[block_begin:block_end].tolist(),
+                self.begins[block_begin:block_end].tolist(), self.ends[block_begin:block_end].tolist()):
+                yield (self.paths[file_id], begin_pointer, end_pointer)
+
+    def __eq__(self, other:object) -> bool:
+        if isinstance(other, PointerTable):
+            return len(self) == len(other) and self.to_list() == other.to_list()
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "PointerTable(%d pointers, %d files)" % (len(self), len(self.files()))
+
+    def __getstate__(self) -> dict:
+        return {'paths': self.paths, 'file_ids': self.file_ids, 'begins': self.begins, 'ends': self.ends}
+
+    def __setstate__(self, state:dict) -> None:
+        self.__init__(state['paths'], state['file_ids'], state['begins'], state['ends'])
+
+    def file(self, path:str) -> 'PointerTable':
+        '''
+            Pointers of one file, a view without copy if they are contiguous
+        '''
+        if path not in self.path_ids:
+            return PointerTable([path])
+        index = np.flatnonzero(self.file_ids == self.path_ids[path])
+        if len(index) > 0 and index[-1] - index[0] + 1 == len(index):
+            return self[int(index[0]):int(index[-1]) + 1]
+        return self[index]
+
+    def files(self) -> List[str]:
+        '''
+            Paths that have pointers, in order of first appearance
+        '''
+        present = np.unique(self.file_ids, return_index = True)
+        return [self.paths[i] for i in present[0][np.argsort(present[1])]]
+
+    def sizes(self) -> np.ndarray:
+        return self.ends - self.begins
+
+    def to_list(self) -> List[tuple]:
+        '''
+            The old [(file_path, begin_pointer, end_pointer), ...] list
+        '''
+        return list(iter(self))
+
+    def save(self, file:str) -> None:
+        with open(file, 'wb') as output_handle:
+            np.savez(output_handle, paths = np.array(self.paths, dtype = str), file_ids = self.file_ids, begins = self.begins, ends = self.ends)
+
+    @classmethod
+    def load(cls, file:str) -> 'PointerTable':
+        with np.load(file, allow_pickle = False) as npz_data:
+            return cls(npz_data['paths'].tolist(), npz_data['file_ids'], npz_data['begins'], npz_data['ends'])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+__all__ = ['ChunkPrefetcher', 'PrefetchStats']
+
+'''
+    Readme:
+        ChunkPrefetcher read the chunks of a slicer one by one and fetch the next depth chunks while the current one is processed,
+        so a worker reading consecutive ranges on a shared file system (GPFS ...) does not stall on a cold fetch of every chunk.
+    Options:
+        source: a slicer object (with pointers attr), a PointerTable or a [(file_path, begin_pointer, end_pointer), ...] list.
+        depth: number of chunks fetched ahead of the current one.
+        mode: 'fadvise' call posix_fadvise(WILLNEED) on the next depth chunks and let the kernel read them,
+            'pread' read the next depth chunks with os.pread in a background thread into a bounded queue.
+            fadvise is not available on some systems (macOS ...), 'fadvise' mode read without advice there.
+        dontneed: call posix_fadvise(DONTNEED) on a chunk when the consumer asks for the next one,
+            so the chunks read once do not evict page cache of other jobs.
+        gzip file is read by gzip_split.GzipChunkReader, it is fetched ahead in 'pread' mode, no advice is given.
+    Metrics:
+        stats attr is PrefetchStats, stall time is the time the consumer waits for the data of a chunk,
+        a chunk is a stall if the wait is gt stall_threshold seconds.
+'''
+
+import os
+import time
+import queue
+import threading
+
+from typing import Any, Dict, Iterator, List, Union
+from collections import deque
+from .pointer_table import PointerTable
+from .gzip_split import GzipChunkReader, is_gzip
+
+MODES = ['fadvise', 'pread']
+#end of the chunks in the queue of 'pread' mode
+END = object()
+
+class PrefetchStats:
+    '''
+        prefetcher = ChunkPrefetcher(MultiFileSlicer([fp1, fp2], 100000), depth = 4)
+        for file, begin_pointer, end_pointer, data in prefetcher:
+            ...
+        print(prefetcher.stats.report())
+    '''
+    def __init__(self, stall_threshold:float = 0.001) -> None:
+        self.stall_threshold = stall_threshold
+        self.chunks = 0
+        self.bytes = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.max_stall = 0.0
+        self.begin_time = time.time()
+        self.end_time = self.begin_time
+
+    def add(self, size:int, wait_time:float) -> None:
+        self.chunks += 1
+        self.bytes += size
+        self.stall_time += wait_time
+        self.max_stall = max(self.max_stall, wait_time)
+        if wait_time > self.stall_threshold:
+            self.stalls += 1
+        self.end_time = time.time()
+
+    def as_dict(self) -> Dict[str, float]:
+        wall_time = max(self.end_time - self.begin_time, 1e-9)
+        return {'chunks': self.chunks, 'bytes': self.bytes, 'stalls': self.stalls, 'stall_time': self.stall_time, 'max_stall': self.max_stall,
+            'wall_time': wall_time, 'stall_ratio': self.stall_time / wall_time}
+
+    def report(self) -> str:
+        stats = self.as_dict()
+        return 'chunks: %d\nbytes: %d\nstalls: %d\nstall time: %.3f (%.1f%%)\nmax stall: %.3f\nwall time: %.3f' % (stats['chunks'], stats['bytes'],
+            stats['stalls'], stats['stall_time'], stats['stall_ratio'] * 100, stats['max_stall'], stats['wall_time'])
+
+class ChunkPrefetcher:
+    '''
+        from prefetch import ChunkPrefetcher
+        for file, begin_pointer, end_pointer, data in ChunkPrefetcher(MultiFileSlicer([fp1, fp2], 100000), depth = 4):
+            ... #data is bytes of the chunk
+        #a worker of a multi-process job iterates its own part of pointers:
+        #ChunkPrefetcher(slicer.pointers.to_list()[worker_index::workers], depth = 4, mode = 'pread')
+    '''
+    def __init__(self, source:Union[object, PointerTable, List[tuple]], depth:int = 4, mode:str = 'fadvise', dontneed:bool = True,
+        stall_threshold:float = 0.001) -> None:
+        if depth < 0:
+            raise ValueError("depth is must be ge 0, but now is %d" % depth)
+        if mode not in MODES:
+            raise ValueError("mode is must be one of %s, but now is %s" % (MODES, mode))
+        self.pointers = source.pointers if hasattr(source, 'pointers') else source
+        self.depth = depth
+        self.mode = mode
+        self.dontneed = dontneed
+        self.stats = PrefetchStats(stall_threshold)
+        self.handles = {}
+        #in 'pread' mode the reader thread (read) and the consumer (advise) both open files
+        self.handle_lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[tuple]:
+        self.stats = PrefetchStats(self.stats.stall_threshold)
+        try:
+            if self.mode == 'pread':
+                yield from self.iter_pread()
+            else:
+                yield from self.iter_fadvise()
+        finally:
+            self.close()
+
+    def iter_fadvise(self) -> Iterator[tuple]:
+        #the current chunk and depth chunks after it are advised, then one new chunk per step
+        lookahead, pointers = deque(), iter(self.pointers)
+        for _ in range(self.depth + 1):
+            next_block = next(pointers, None)
+            if next_block is None:
+                break
+            lookahead.append(tuple(next_block))
+            self.advise(*lookahead[-1], 'WILLNEED')
+        while lookahead:
+            file, begin_pointer, end_pointer = lookahead.popleft()
+            next_block = next(pointers, None)
+            if next_block is not None:
+                lookahead.append(tuple(next_block))
+                self.advise(*lookahead[-1], 'WILLNEED')
+            begin_time = time.time()
+            data = self.read(file, begin_pointer, end_pointer)
+            self.stats.add(len(data), time.time() - begin_time)
+            yield file, begin_pointer, end_pointer, data
+            if self.dontneed:
+                self.advise(file, begin_pointer, end_pointer, 'DONTNEED')
+
+    def iter_pread(self) -> Iterator[tuple]:
+        #depth 0 still needs one slot, the reader thread hands over one chunk at a time
+        chunk_queue = queue.Queue(maxsize = max(self.depth, 1))
+        stop_event = threading.Event()
+        reader = threading.Thread(target = self.read_ahead, args = (chunk_queue, stop_event), daemon = True)
+        reader.start()
+        try:
+            while True:
+                begin_time = time.time()
+                item = chunk_queue.get()
+                wait_time = time.time() - begin_time
+                if item is END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                file, begin_pointer, end_pointer, data = item
+                self.stats.add(len(data), wait_time)
+                yield item
+                if self.dontneed:
+                    self.advise(file, begin_pointer, end_pointer, 'DONTNEED')
+        finally:
+            #the consumer may stop early, free the reader thread blocked on a full queue
+            stop_event.set()
+            while reader.is_alive():
+                try:
+                    chunk_queue.get(timeout = 0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+
+    def read_ahead(self, chunk_queue:queue.Queue, stop_event:threading.Event) -> None:
+        '''
+            Read chunks in the background thread, an error is passed to the consumer
+        '''
+        try:
+            for file, begin_pointer, end_pointer in self.pointers:
+                item = (file, begin_pointer, end_pointer, self.read(file, begin_pointer, end_pointer))
+                while not stop_event.is_set():
+                    try:
+                        chunk_queue.put(item, timeout = 0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop_event.is_set():
+                    return None
+            chunk_queue.put(END)
+        except BaseException as e:
+            chunk_queue.put(e)
+
+    def open(self, file:str) -> Any:
+        with self.handle_lock:
+            if file not in self.handles:
+                self.handles[file] = GzipChunkReader(file) if is_gzip(file) else os.open(file, os.O_RDONLY)
+            return self.handles[file]
+
+    def read(self, file:str, begin_pointer:int, end_pointer:int) -> bytes:
+        handle = self.open(file)
+        if isinstance(handle, GzipChunkReader):
+            return handle.read(begin_pointer, end_pointer)
+        blocks, now_pointer = [], begin_pointer
+        while now_pointer < end_pointer:
+            data = os.pread(handle, end_pointer - now_pointer, now_pointer)
+            if not data:
+                break
+            blocks.append(data)
+            now_pointer += len(data)
+        return blocks[0] if len(blocks) == 1 else b''.join(blocks)
+
+    def advise(self, file:str, begin_pointer:int, end_pointer:int, advice:str) -> None:
+        '''
+            posix_fadvise on a range of a plain file, a no-op for gzip file or on the systems without it
+        '''
+        if not hasattr(os, 'posix_fadvise') or end_pointer <= begin_pointer:
+            return None
+        handle = self.open(file)
+        if isinstance(handle, GzipChunkReader):
+            return None
+        try:
+            os.posix_fadvise(handle, begin_pointer, end_pointer - begin_pointer, getattr(os, 'POSIX_FADV_' + advice))
+        except OSError:
+            #some file systems do not support it, the advice is only a hint
+            pass
+
+    def close(self) -> None:
+        with self.handle_lock:
+            for handle in self.handles.values():
+                if isinstance(handle, GzipChunkReader):
+                    handle.close()
+                else:
+                    os.close(handle)
+            self.handles = {}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+__all__ = ['WorkerStats', 'largest_first', 'split_ranges', 'timed_call']
+
+'''
+    Readme:
+        Size-aware scheduling of the multi-process slicers.
+        Files are submitted largest first, a file larger than task_size is split into sub-range tasks,
+        all tasks wait in the queue of the process pool and an idle process takes the next one,
+        so a few huge files among many small ones no longer leave one process working alone at the end.
+        Every task is timed in the child process, WorkerStats sum busy time and bytes of every process,
+        use it to tune the threads count on a shared file system (GPFS ...).
+'''
+
+import time
+import threading
+
+from typing import Any, Callable, Dict, List
+
+def largest_first(sizes:List[int]) -> List[int]:
+    '''
+        Index of sizes, largest first, same sizes keep their order
+    '''
+    return sorted(range(len(sizes)), key = lambda i: -sizes[i])
+
+def split_ranges(begin_pointer:int, total_size:int, task_size:int, chunk_size:int) -> List[tuple]:
+    '''
+        Split [begin_pointer, total_size) into ranges of about task_size bytes, a multiple of chunk_size
+    '''
+    chunk_size = max(chunk_size, 1)
+    range_size = max(-(-task_size // chunk_size), 1) * chunk_size
+    return [(i, min(i + range_size, total_size)) for i in range(begin_pointer, total_size, range_size)]
+
+def timed_call(func:Callable, parameters:list, size:int = 0) -> tuple:
+    '''
+        Run func in a child process, return (pid, begin time, end time, size, result),
+        pid is the native thread id, it is the process id in a process pool and every thread has its own in a thread pool
+    '''
+    begin_time = time.time()
+    result = func(*parameters)
+    return threading.get_native_id(), begin_time, time.time(), size, result
+
+class WorkerStats:
+    '''
+        slicer = MultiFileSlicer([fp1, fp2], 100000)
+        print(slicer.worker_stats.report())
+    '''
+    def __init__(self) -> None:
+        self.begin_time = time.time()
+        self.end_time = self.begin_time
+        self.workers = {}
+
+    def add(self, pid:int, begin_time:float, end_time:float, size:int) -> None:
+        worker = self.workers.setdefault(pid, {'tasks': 0, 'bytes': 0, 'busy': 0.0})
+        worker['tasks'] += 1
+        worker['bytes'] += size
+        worker['busy'] += end_time - begin_time
+        self.end_time = max(self.end_time, end_time)
+
+    def get(self, pool_result:Any) -> Any:
+        '''
+            Wait a timed_call result of apply_async, record it and return the result of func
+        '''
+        pid, begin_time, end_time, size, result = pool_result.get()
+        self.add(pid, begin_time, end_time, size)
+        return result
+
+    def finish(self) -> 'WorkerStats':
+        self.end_time = time.time()
+        return self
+
+    def as_dict(self) -> Dict[int, dict]:
+        '''
+            {pid: {'tasks': n, 'bytes': n, 'busy': seconds, 'utilization': busy / wall time}, ...}
+        '''
+        wall_time = max(self.end_time - self.begin_time, 1e-9)
+        return {pid: dict(worker, utilization = worker['busy'] / wall_time) for pid, worker in self.workers.items()}
+
+    def report(self) -> str:
+        lines = ['pid\ttasks\tbytes\tbusy\tutilization']
+        for pid, worker in sorted(self.as_dict().items()):
+            lines.append('%d\t%d\t%d\t%.3f\t%.1f%%' % (pid, worker['tasks'], worker['bytes'], worker['busy'], worker['utilization'] * 100))
+        lines.append('wall time: %.3f' % (self.end_time - self.begin_time))
+        return '\n'.join(lines)
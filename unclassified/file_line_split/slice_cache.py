@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+__all__ = ['SliceCache']
+
+'''
+    Readme:
+        SliceCache save the pointers and header results of a slicer in a cache directory,
+        a repeat run on unchanged inputs loads boundaries from disk instead of seeking the whole file again.
+    Options:
+        cache_dir: cache directory, it will be created if not exists.
+        max_size: max total size of the cache directory, unit is byte. The least recently used entries are removed first.
+    Cache key:
+        Entry name is decided by absolute path, slicer type and slicer options (chunk_size, split_num, header ...),
+        file identity (size, mtime, inode, device) is saved in the entry, an entry whose identity does not match
+        the file now is stale and it will be removed when it is loaded.
+'''
+
+import os
+import pickle
+import hashlib
+import tempfile
+
+from typing import List, Union
+from .pointer_table import PointerTable
+
+class SliceCache:
+    '''
+        from slice_cache import SliceCache
+        cache = SliceCache('/path/to/cache_dir')
+        cache_result = cache.load(fp1, {'slicer': 'FileSlicer', 'chunk_size': 100000})
+        if cache_result is None:
+            cache.save(fp1, {'slicer': 'FileSlicer', 'chunk_size': 100000}, pointers, header)
+    '''
+    suffix = '.slice'
+
+    def __init__(self, cache_dir:str, max_size:int = 1073741824) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size is must be gt 0, but now is %d" % max_size)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok = True)
+
+    def identity(self, file:str) -> tuple:
+        '''
+            File identity, any change of content will change the identity
+        '''
+        file_stat = os.stat(file)
+        return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, file_stat.st_dev)
+
+    def entry(self, file:str, options:dict) -> str:
+        '''
+            Entry path of a file and slicer options
+        '''
+        key_strings = repr((os.path.abspath(file), sorted(options.items())))
+        return os.path.join(self.cache_dir, hashlib.sha1(key_strings.encode('utf8')).hexdigest() + self.suffix)
+
+    def load(self, file:str, options:dict) -> Union[tuple, None]:
+        '''
+            Return (pointers, header) of a file, or None if there is no usable entry
+        '''
+        entry_file = self.entry(file, options)
+        try:
+            with open(entry_file, 'rb') as input_handle:
+                entry_data = pickle.load(input_handle)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if not isinstance(entry_data, dict) or 'begins' not in entry_data or entry_data['identity'] != self.identity(file):
+            #stale entry, file is changed or entry is an old format
+            self.remove(entry_file)
+            return None
+        #mark entry as recently used
+        os.utime(entry_file)
+        return PointerTable.from_ranges(file, entry_data['begins'], entry_data['ends']), entry_data['header']
+
+    def save(self, file:str, options:dict, pointers:PointerTable, header:List) -> None:
+        '''
+            Save pointers and header of a file, write to a temporary file then rename it, so readers never see a half entry
+        '''
+        entry_data = {'identity': self.identity(file), 'begins': pointers.begins, 'ends': pointers.ends, 'header': header}
+        temp_fd, temp_file = tempfile.mkstemp(suffix = '.tmp', dir = self.cache_dir)
+        try:
+            with os.fdopen(temp_fd, 'wb') as output_handle:
+                pickle.dump(entry_data, output_handle, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.entry(file, options))
+        except BaseException:
+            self.remove(temp_file)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        '''
+            Remove the least recently used entries until the cache directory is not gt max_size
+        '''
+        entries, total_size = [], 0
+        with os.scandir(self.cache_dir) as dir_handle:
+            for every_entry in dir_handle:
+                if every_entry.name.endswith(self.suffix) and every_entry.is_file():
+                    entry_stat = every_entry.stat()
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, every_entry.path))
+                    total_size += entry_stat.st_size
+        for _, entry_size, entry_file in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.remove(entry_file)
+            total_size -= entry_size
+
+    def remove(self, entry_file:str) -> None:
+        try:
+            os.remove(entry_file)
+        except FileNotFoundError:
+            pass
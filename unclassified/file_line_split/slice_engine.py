@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+
+__all__ = ['Boundary', 'NewlineBoundary', 'CsvBoundary', 'LengthPrefixedBoundary', 'SerialPool', 'SliceEngine', 'make_pool', 'BACKENDS']
+
+'''
+    Readme:
+        SliceEngine is the one seek loop of all slicers, it is built from two parts:
+        boundary: how the next record start after an offset is found, a Boundary subclass.
+            NewlineBoundary: line end (FileSlicer, MultiFileSlicer).
+            CsvBoundary: line end outside quotes, a quoted field of CSV/TSV may hold line ends.
+            LengthPrefixedBoundary: binary records, every record starts with its length.
+            fastq_split.FastqBoundary and fasta_split.FastaBoundary: record start of FASTQ and FASTA.
+        backend: who runs the tasks, 'serial' (this process), 'process' (multiprocessing.Pool) or 'thread' (ThreadPool).
+        A new format is one Boundary subclass and it gets every backend, split_mode, task_size scheduling, cache and gzip support.
+    Boundary:
+        find(input_handle, offset, total_size, begin) return the first record start after offset, or total_size.
+        random_access = True if find does not need begin (a known record start le offset),
+            only such boundary can be used by split_mode 'offset' and sub-range tasks of task_size,
+            the others (CsvBoundary, LengthPrefixedBoundary) walk the records from begin, one task per file.
+        scan_file(file, chunk_size, split_num, begin) return the pointers of a whole file from begin (the pointer after header lines)
+            if the boundary slices it in its own pass (fasta_split.FastaBoundary with fai), None use the seek loop.
+            Header lines are read by the engine in both split modes, so every boundary gets the same header result.
+        fresh(file) return False if the cache of file is out of date for the boundary.
+    Usage:
+        from slice_engine import SliceEngine, CsvBoundary
+        engine = SliceEngine(CsvBoundary(), backend = 'thread', threads = 4)
+        pointers, header = engine.slice([fp1, fp2], chunk_size = 100000, header = [1, 1])
+'''
+
+import os
+import numpy as np
+import multiprocessing as mp
+
+from typing import Any, Callable, Iterator, List, Union
+from multiprocessing.pool import ThreadPool
+from .slice_cache import SliceCache
+from .pointer_table import PointerTable
+from .gzip_split import is_gzip, open_slice_file, slice_size, slice_pointers
+from .schedule import WorkerStats, largest_first, split_ranges, timed_call
+
+BACKENDS = ['serial', 'process', 'thread']
+
+class Boundary:
+    '''
+        Base class of record boundaries, see the Readme of slice_engine
+    '''
+    random_access = True
+
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        raise NotImplementedError("%s does not implement find()" % type(self).__name__)
+
+    def scan_file(self, file:str, chunk_size:int, split_num:int, begin:int = 0) -> Union[PointerTable, None]:
+        return None
+
+    def fresh(self, file:str) -> bool:
+        return True
+
+    def cache_options(self) -> dict:
+        '''
+            Type and parameters of the boundary (quote, prefix_size, fai ...) in the cache key, so pointers of another boundary are never reused,
+            block_size only changes the reads, not the pointers
+        '''
+        return dict({'boundary': type(self).__name__}, **{k: v for k, v in vars(self).items() if k not in ('block_size', 'random_access')})
+
+class NewlineBoundary(Boundary):
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        '''
+            The line end after offset
+        '''
+        if offset >= total_size:
+            return total_size
+        input_handle.seek(offset)
+        _ = input_handle.readline()
+        return min(input_handle.tell(), total_size)
+
+class CsvBoundary(Boundary):
+    '''
+        Line end outside quotes, a doubled quote ("") in a quoted field toggles twice, so it is handled too
+    '''
+    random_access = False
+
+    def __init__(self, quote:bytes = b'"', block_size:int = 4194304) -> None:
+        if len(quote) != 1:
+            raise ValueError("quote is must be one byte, but now is %s" % quote)
+        self.quote = quote[0]
+        self.block_size = block_size
+
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        if offset >= total_size:
+            return total_size
+        #quotes are counted from a known record start, so the chunk from begin is read once
+        input_handle.seek(begin)
+        now_pointer, quote_num = begin, 0
+        while now_pointer < total_size:
+            data = input_handle.read(min(self.block_size, total_size - now_pointer))
+            if not data:
+                break
+            array = np.frombuffer(data, dtype = np.uint8)
+            quotes = np.cumsum(array == self.quote) + quote_num
+            line_ends = np.flatnonzero((array == 10) & (quotes % 2 == 0))
+            line_ends = line_ends[line_ends >= offset - now_pointer]
+            if len(line_ends) > 0:
+                return now_pointer + int(line_ends[0]) + 1
+            quote_num = int(quotes[-1]) % 2
+            now_pointer += len(data)
+        return total_size
+
+class LengthPrefixedBoundary(Boundary):
+    '''
+        Binary records: prefix_size bytes of unsigned length (byteorder), then length bytes of payload,
+        inclusive = True if the length counts the prefix itself.
+    '''
+    random_access = False
+
+    def __init__(self, prefix_size:int = 4, byteorder:str = 'little', inclusive:bool = False, block_size:int = 1048576) -> None:
+        if prefix_size <= 0:
+            raise ValueError("prefix_size is must be gt 0, but now is %d" % prefix_size)
+        if byteorder not in ['little', 'big']:
+            raise ValueError("byteorder is must be one of ['little', 'big'], but now is %s" % byteorder)
+        self.prefix_size = prefix_size
+        self.byteorder = byteorder
+        self.inclusive = inclusive
+        self.block_size = block_size
+
+    def find(self, input_handle, offset:int, total_size:int, begin:int = 0) -> int:
+        '''
+            The first record start ge offset, records are walked from begin in blocks
+        '''
+        now_pointer, buffer_begin, data = begin, begin, b''
+        while now_pointer < min(offset, total_size):
+            position = now_pointer - buffer_begin
+            if position + self.prefix_size > len(data):
+                input_handle.seek(now_pointer)
+                data = input_handle.read(max(self.block_size, self.prefix_size))
+                buffer_begin, position = now_pointer, 0
+                if len(data) < self.prefix_size:
+                    #truncated record at the end of file
+                    return total_size
+            record_size = int.from_bytes(data[position:position + self.prefix_size], self.byteorder)
+            if self.inclusive:
+                if record_size < self.prefix_size:
+                    raise ValueError("record at %d has length %d, it is lt prefix size %d!" % (now_pointer, record_size, self.prefix_size))
+                now_pointer += record_size
+            else:
+                now_pointer += self.prefix_size + record_size
+        return min(now_pointer, total_size)
+
+class SerialResult:
+    '''
+        Result of SerialPool.apply_async, func is already called
+    '''
+    def __init__(self, func:Callable, args:tuple, kwds:dict) -> None:
+        self.value, self.error = None, None
+        try:
+            self.value = func(*args, **kwds)
+        except Exception as e:
+            self.error = e
+
+    def ready(self) -> bool:
+        return True
+
+    def successful(self) -> bool:
+        return self.error is None
+
+    def wait(self, timeout:Union[float, None] = None) -> None:
+        pass
+
+    def get(self, timeout:Union[float, None] = None) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class SerialPool:
+    '''
+        Same calls as multiprocessing.Pool, every task runs in this process when it is submitted
+    '''
+    def apply_async(self, func:Callable, args:tuple = (), kwds:dict = {}) -> SerialResult:
+        return SerialResult(func, args, kwds)
+
+    def map(self, func:Callable, iterable:list) -> list:
+        return [func(i) for i in iterable]
+
+    def close(self) -> None:
+        pass
+
+    def join(self) -> None:
+        pass
+
+def file_entry(item:Union[str, tuple]) -> tuple:
+    '''
+        (path, size) of a path or a (path, size) item, size of a path is read here
+    '''
+    if isinstance(item, (tuple, list)):
+        return str(item[0]), int(item[1])
+    if not os.path.exists(item):
+        raise FileNotFoundError("%s is not found!" % (item))
+    return item, os.path.getsize(item)
+
+def make_pool(backend:str, threads:int) -> Any:
+    if backend not in BACKENDS:
+        raise ValueError("backend is must be one of %s, but now is %s" % (BACKENDS, backend))
+    if backend == 'process':
+        return mp.Pool(processes = threads)
+    if backend == 'thread':
+        return ThreadPool(processes = threads)
+    return SerialPool()
+
+class SliceEngine:
+    '''
+        pointers, header = SliceEngine(NewlineBoundary(), 'process', 5).slice([fp1, fp2], 100000)
+        options: fixed items of the cache key, the slicers put their class name in it.
+    '''
+    def __init__(self, boundary:Boundary, backend:str = 'process', threads:int = 5, split_mode:str = 'file', task_size:int = 0,
+        encoding:str = 'utf8', skip:bool = False, cache:Union[SliceCache, None] = None, options:dict = {}) -> None:
+        if not isinstance(boundary, Boundary):
+            raise TypeError("boundary is Boundary, but now is %s" % type(boundary))
+        if backend not in BACKENDS:
+            raise ValueError("backend is must be one of %s, but now is %s" % (BACKENDS, backend))
+        if split_mode not in ['file', 'offset']:
+            raise ValueError("split_mode is must be one of ['file', 'offset'], but now is %s" % split_mode)
+        if split_mode == 'offset' and not boundary.random_access:
+            raise ValueError("split_mode 'offset' needs a random access boundary, %s is not" % type(boundary).__name__)
+        self.boundary = boundary
+        self.backend = backend
+        self.threads = threads
+        self.split_mode = split_mode
+        self.task_size = task_size
+        self.encoding = encoding
+        self.skip = skip
+        self.cache = cache
+        self.options = dict(options)
+        self.worker_stats = WorkerStats()
+
+    def slice(self, file_list:Union[List[str], List[tuple], Iterator], chunk_size:int = 100000, split_num:int = 0, header:List[int] = []) -> tuple:
+        '''
+            Return (PointerTable of all files, header result), every_header is the number of header lines of a file.
+            An item of file_list is a path or (path, size) (see find_files.py), a list is submitted largest first,
+            an iterator (find_files ...) is submitted as the files come, so slicing starts before the walk finishes.
+        '''
+        if isinstance(file_list, list):
+            if len(header) > len(file_list):
+                raise ValueError("length of file list is %d, length of skip list is %d, skip gt file???" % (len(file_list), len(header)))
+            entries = [file_entry(i) for i in file_list]
+        else:
+            entries = (file_entry(i) for i in file_list)
+        pool = make_pool(self.backend, self.threads)
+        try:
+            if self.split_mode == 'offset':
+                return self.begin_offset(pool, list(entries), chunk_size, split_num, header)
+            return self.begin(pool, entries, chunk_size, split_num, header)
+        finally:
+            pool.close()
+            pool.join()
+
+    def begin(self, pool:Any, entries:Union[List[tuple], Iterator], chunk_size:int, split_num:int, header:list) -> tuple:
+        '''
+            Files are submitted largest first, a plain file larger than task_size is split into sub-range tasks (see schedule.py)
+        '''
+        worker_stats = WorkerStats()
+        #0 file sizes and task size, gzip file is one task because its ranges are not known before the index is built
+        if isinstance(entries, list):
+            task_size = self.task_size if self.task_size > 0 else max(-(-sum(i[1] for i in entries) // (self.threads * 2)), 67108864)
+            submit_order = [(i, entries[i]) for i in largest_first([i[1] for i in entries])]
+        else:
+            #total size of a stream is not known
+            task_size = self.task_size if self.task_size > 0 else 67108864
+            submit_order = enumerate(entries)
+        can_split = self.backend != 'serial' and self.boundary.random_access
+        #1 submit tasks, largest first
+        file_list, file_result = {}, {}
+        for index, (every_file, file_size) in submit_order:
+            every_header = header[index] if index < len(header) else 0
+            file_list[index] = every_file
+            cache_result = self.load_cache(every_file, chunk_size, split_num, every_header)
+            if cache_result is not None:
+                file_result[index] = cache_result
+                continue
+            if not can_split or file_size <= task_size or is_gzip(every_file):
+                parameters = [every_file, chunk_size, split_num, every_header]
+                file_result[index] = pool.apply_async(timed_call, [self.seek_file, parameters, file_size])
+                continue
+            init_pointer, header_result = self.read_header(every_file, every_header)
+            file_chunk = int((file_size - init_pointer) / split_num) if split_num >= 1 else chunk_size
+            range_result = []
+            for range_begin, range_end in split_ranges(init_pointer, file_size, task_size, file_chunk):
+                parameters = [every_file, range_begin, range_end, file_chunk, range_begin == init_pointer]
+                range_result.append(pool.apply_async(timed_call, [self.seek_range, parameters, range_end - range_begin]))
+            file_result[index] = (range_result, header_result)
+        #2 join results in order of file list
+        final_result, final_header = [], []
+        for index in range(len(file_list)):
+            every_file, every_header, result = file_list[index], header[index] if index < len(header) else 0, file_result[index]
+            if isinstance(result, tuple) and isinstance(result[0], list):
+                result = (PointerTable.concat([worker_stats.get(e) for e in result[0]]), result[1])
+                self.save_cache(every_file, chunk_size, split_num, every_header, result)
+            elif not isinstance(result, tuple):
+                result = worker_stats.get(result)
+                self.save_cache(every_file, chunk_size, split_num, every_header, result)
+            final_result.append(result[0])
+            final_header += result[1]
+        self.worker_stats = worker_stats.finish()
+        return PointerTable.concat(final_result), final_header
+
+    def begin_offset(self, pool:Any, entries:List[tuple], chunk_size:int, split_num:int, header:list) -> tuple:
+        '''
+            Candidate offsets of every file are computed up front and resolved to record starts by any worker,
+            so the slowest single file no longer sets the wall time of the whole batch.
+        '''
+        worker_stats = WorkerStats()
+        file_list = [i[0] for i in entries]
+        header = list(header) + [0 for _ in range(len(file_list) - len(header))]
+        #0 total size of every file, index of gzip files is built in parallel here
+        total_sizes = pool.map(slice_size, file_list)
+        #1 read header and submit candidate offsets
+        file_result = []
+        for every_file, every_header, total_size in zip(file_list, header, total_sizes):
+            cache_result = self.load_cache(every_file, chunk_size, split_num, every_header)
+            if cache_result is not None:
+                file_result.append((every_file, every_header, cache_result))
+                continue
+            init_pointer, header_result = self.read_header(every_file, every_header)
+            file_chunk = chunk_size
+            if split_num >= 1:
+                #recalculate chunk_size
+                file_chunk = int((total_size - init_pointer) / split_num)
+            candidates = range(init_pointer + max(file_chunk, 1), total_size, max(file_chunk, 1))
+            #a few batches per worker, one task per offset is too expensive
+            batch_size = max(1, -(-len(candidates) // (self.threads * 4)))
+            pool_result = []
+            for batch_begin in range(0, len(candidates), batch_size):
+                parameters = [every_file, list(candidates[batch_begin:batch_begin + batch_size])]
+                pool_result.append(pool.apply_async(timed_call, [self.resolve_offsets, parameters, len(parameters[1]) * max(file_chunk, 1)]))
+            file_result.append((every_file, every_header, (init_pointer, total_size, header_result, pool_result)))
+        #2 join boundaries of every file
+        final_result, final_header = [], []
+        for every_file, every_header, result in file_result:
+            if len(result) == 4:
+                init_pointer, total_size, header_result, pool_result = result
+                boundaries = set([init_pointer, total_size])
+                for e in pool_result:
+                    boundaries.update(worker_stats.get(e))
+                boundaries = sorted(boundaries)
+                result = (slice_pointers(every_file, PointerTable.from_ranges(every_file, boundaries[:-1], boundaries[1:])), header_result)
+                self.save_cache(every_file, chunk_size, split_num, every_header, result)
+            final_result.append(result[0])
+            final_header += result[1]
+        self.worker_stats = worker_stats.finish()
+        return PointerTable.concat(final_result), final_header
+
+    def load_cache(self, file:str, chunk_size:int, split_num:int, every_header:int) -> Union[tuple, None]:
+        if self.cache is None or not self.boundary.fresh(file):
+            return None
+        return self.cache.load(file, self.cache_options(chunk_size, split_num, every_header))
+
+    def save_cache(self, file:str, chunk_size:int, split_num:int, every_header:int, result:tuple) -> None:
+        if self.cache is not None:
+            self.cache.save(file, self.cache_options(chunk_size, split_num, every_header), result[0], result[1])
+
+    def cache_options(self, chunk_size:int, split_num:int, every_header:int) -> dict:
+        #chunk_size is recalculated for every file when split_num is used
+        return dict(self.options, **self.boundary.cache_options(), split_mode = self.split_mode, chunk_size = chunk_size if split_num < 1 else 0,
+            split_num = split_num, header = every_header, skip = self.skip, encoding = self.encoding)
+
+    def read_header(self, file:str, every_header:int = 0, input_handle:Any = None) -> tuple:
+        '''
+            Return the pointer after header and the header result of one file, input_handle is left after header
+        '''
+        header_result = []
+        handle = open_slice_file(file)[0] if input_handle is None else input_handle
+        if every_header > 0:
+            one_header = []
+            for _ in range(0, every_header):
+                if self.skip:
+                    _ = handle.readline()
+                else:
+                    one_header.append(handle.readline().decode(encoding = self.encoding).strip("\n"))
+            header_result.append(one_header)
+        init_pointer = handle.tell()
+        if input_handle is None:
+            handle.close()
+        return init_pointer, header_result
+
+    def resolve_offsets(self, file:str, offsets:List[int]) -> List[int]:
+        '''
+            Resolve every candidate offset to the next record start on its own
+        '''
+        input_handle, total_size = open_slice_file(file)
+        with input_handle:
+            return [self.boundary.find(input_handle, every_offset, total_size) for every_offset in offsets]
+
+    def seek_range(self, file:str, range_begin:int, range_end:int, chunk_size:int, first:bool = False) -> PointerTable:
+        '''
+            Pointers of a sub-range of a plain file, the range starts and ends at the record start after range_begin and range_end,
+            so the ranges of one file join without gap, the first range starts at range_begin (after header).
+        '''
+        seek_result = []
+        input_handle, total_size = open_slice_file(file)
+        with input_handle:
+            init_pointer = range_begin if first else self.boundary.find(input_handle, range_begin, total_size)
+            end_pointer = self.boundary.find(input_handle, range_end, total_size) if range_end < total_size else total_size
+            while init_pointer < end_pointer:
+                #seek and find record start, the last chunk stops at the end of range
+                now_pointer = min(self.boundary.find(input_handle, init_pointer + max(chunk_size, 1), total_size, init_pointer), end_pointer)
+                seek_result.append((file, init_pointer, now_pointer))
+                init_pointer = now_pointer
+        return PointerTable.from_list(seek_result) if seek_result else PointerTable([file])
+
+    def seek_file(self, file:str, chunk_size:int = 100000, split_num:int = 0, every_header:int = 0) -> list:
+        '''
+            Return [pointers, header result] of one file
+        '''
+        if not os.path.exists(file):
+            raise FileNotFoundError("%s is not found!" % (file))
+        seek_result = []
+        input_handle, total_size = open_slice_file(file)
+        with input_handle:
+            init_pointer, header_result = self.read_header(file, every_header, input_handle)
+            #the boundary slices the records after header in its own pass
+            scan_result = self.boundary.scan_file(file, chunk_size, split_num, init_pointer)
+            if scan_result is not None:
+                return [scan_result, header_result]
+            if split_num >= 1:
+                #recalculate chunk_size
+                chunk_size = int((total_size - init_pointer) / split_num)
+            while init_pointer < total_size:
+                #seek and find record start
+                now_pointer = self.boundary.find(input_handle, init_pointer + max(chunk_size, 1), total_size, init_pointer)
+                seek_result.append((file, init_pointer, now_pointer))
+                init_pointer = now_pointer
+        return [slice_pointers(file, PointerTable.from_list(seek_result)), header_result]
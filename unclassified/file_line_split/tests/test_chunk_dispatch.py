@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+'''
+    ChunkDispatcher with local workers return the same results as func on seek and read in both modes,
+    the chunks of a lost worker are requeued and done by the others, errors of func and of the launcher are raised in the driver.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import random
+import pytest
+
+from ..chunk_dispatch import ChunkDispatcher, LocalLauncher, dispatch_chunks, read_nodefile, worker_command
+from ..file_split import FileSlicer
+
+def count_lines(chunk:memoryview, extra:int = 0) -> int:
+    return chunk.tobytes().count(b'\n') + extra
+
+def die_once(chunk:memoryview, marker:str) -> int:
+    '''
+        The first worker which reads line 50 is killed, the chunk is done by an other worker
+    '''
+    if b'\n50\t' in b'\n' + chunk.tobytes():
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+            os._exit(1)
+        except FileExistsError:
+            pass
+    return count_lines(chunk)
+
+def always_die(chunk:memoryview) -> int:
+    os._exit(1)
+
+def fail_on_seven(chunk:memoryview) -> int:
+    if chunk.tobytes().startswith(b'7\t'):
+        raise ValueError("line 7")
+    return len(chunk)
+
+class SilentLauncher:
+    '''
+        A launcher whose workers never start
+    '''
+    def driver_host(self) -> str:
+        return '127.0.0.1'
+
+    def slots(self) -> int:
+        return 2
+
+    def start(self, address:tuple, authkey:bytes) -> None:
+        pass
+
+    def alive(self) -> bool:
+        return False
+
+    def stop(self) -> None:
+        pass
+
+def text_slicer(tmp_path, chunk_size:int = 2000) -> FileSlicer:
+    rng = random.Random(1)
+    text_path = tmp_path / 'input.txt'
+    text_path.write_text(''.join('%d\t%s\n' % (i, 'x' * rng.randint(0, 100)) for i in range(3000)))
+    return FileSlicer([str(text_path)], chunk_size)
+
+def expected_results(slicer:FileSlicer, extra:int = 0) -> list:
+    data = open(slicer.pointers[0][0], 'rb').read()
+    return [count_lines(memoryview(data[i[1]:i[2]]), extra) for i in slicer.pointers]
+
+@pytest.mark.parametrize('mode', ['dynamic', 'static'])
+def test_results_are_in_order(tmp_path, mode:str) -> None:
+    slicer = text_slicer(tmp_path)
+    dispatcher = ChunkDispatcher(count_lines, slicer, LocalLauncher(3), mode, args = (1,), connect_timeout = 60)
+    assert list(dispatcher) == expected_results(slicer, 1)
+    assert sum(dispatcher.worker_tasks.values()) == len(slicer.pointers)
+    assert list(dispatch_chunks(count_lines, [], LocalLauncher(1))) == []
+
+@pytest.mark.parametrize('mode', ['dynamic', 'static'])
+def test_chunks_of_a_lost_worker_are_requeued(tmp_path, mode:str) -> None:
+    slicer = text_slicer(tmp_path, 500)
+    marker = str(tmp_path / 'killed')
+    dispatcher = ChunkDispatcher(die_once, slicer, LocalLauncher(3), mode, args = (marker,), connect_timeout = 60)
+    assert list(dispatcher) == expected_results(slicer)
+    assert os.path.exists(marker)
+    #the killed worker never sent the result of its chunk, the others did every chunk
+    assert sum(dispatcher.worker_tasks.values()) == len(slicer.pointers)
+
+def test_errors_are_raised_in_the_driver(tmp_path) -> None:
+    slicer = text_slicer(tmp_path, 1)
+    with pytest.raises(ValueError, match = 'line 7'):
+        list(ChunkDispatcher(fail_on_seven, slicer, LocalLauncher(2), connect_timeout = 60))
+    with pytest.raises(RuntimeError, match = 'all workers are lost'):
+        list(ChunkDispatcher(always_die, slicer, LocalLauncher(2), connect_timeout = 60))
+    with pytest.raises(TimeoutError):
+        list(ChunkDispatcher(count_lines, slicer, SilentLauncher(), connect_timeout = 1))
+    with pytest.raises(ValueError):
+        ChunkDispatcher(count_lines, slicer, LocalLauncher(1), 'round_robin')
+    with pytest.raises(ValueError):
+        ChunkDispatcher(count_lines, slicer, LocalLauncher(1), prefetch = 0)
+
+def test_nodefile_and_worker_command(tmp_path) -> None:
+    nodefile = tmp_path / 'nodes'
+    nodefile.write_text('node_b\nnode_a\nnode_b\n\nnode_b\n')
+    assert read_nodefile(str(nodefile)) == [('node_b', 3), ('node_a', 1)]
+    with pytest.raises(FileNotFoundError):
+        read_nodefile(str(tmp_path / 'missing'))
+    command = worker_command(('node_a', 12345), 4)
+    assert "run_host(('node_a', 12345), bytes.fromhex(sys.stdin.readline().strip()), 4)" in command
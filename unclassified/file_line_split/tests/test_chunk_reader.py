@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+'''
+    ChunkReader return the same bytes as seek and read (plain, empty and gzip files),
+    map_chunks return the same results in this process and in a pool, ordered or as done, and raise the error of func.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import gzip
+import random
+import pytest
+import multiprocessing as mp
+
+from ..chunk_reader import ChunkReader, map_chunks
+from ..file_split import FileSlicer
+
+def count_lines(chunk:memoryview, extra:int = 0) -> int:
+    return chunk.tobytes().count(b'\n') + extra
+
+def fail_on_seven(chunk:memoryview) -> int:
+    if chunk.tobytes().startswith(b'7\t'):
+        raise ValueError("line 7")
+    return len(chunk)
+
+def text_file(tmp_path, name:str = 'input.txt', line_num:int = 3000) -> str:
+    rng = random.Random(1)
+    text_path = tmp_path / name
+    text_path.write_text(''.join('%d\t%s\n' % (i, 'x' * rng.randint(0, 100)) for i in range(line_num)))
+    return str(text_path)
+
+def test_read_is_same_as_seek_and_read(tmp_path) -> None:
+    input_file = text_file(tmp_path)
+    empty_file = tmp_path / 'empty.txt'
+    empty_file.write_bytes(b'')
+    data = open(input_file, 'rb').read()
+    with ChunkReader() as reader:
+        for _, begin, end in FileSlicer([input_file], 5000).pointers:
+            assert reader.read(input_file, begin, end) == data[begin:end]
+        assert reader.read(str(empty_file), 0, 0) == b''
+
+def test_gzip_chunks_are_decompressed(tmp_path) -> None:
+    input_file = text_file(tmp_path)
+    data = open(input_file, 'rb').read()
+    with gzip.open(input_file + '.gz', 'wb') as output_handle:
+        output_handle.write(data)
+    pointers = FileSlicer([input_file + '.gz'], 5000).pointers
+    with ChunkReader() as reader:
+        assert b''.join(reader.read(*i).tobytes() for i in pointers) == data
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_map_chunks_ordered_and_unordered(tmp_path, processes:int) -> None:
+    input_file = text_file(tmp_path)
+    slicer = FileSlicer([input_file], 2000)
+    expected = [count_lines(memoryview(open(input_file, 'rb').read()[i[1]:i[2]]), 1) for i in slicer.pointers]
+    assert list(map_chunks(count_lines, slicer, processes, args = (1,))) == expected
+    unordered = list(map_chunks(count_lines, slicer.pointers.to_list(), processes, ordered = False, max_inflight = 3, args = (1,)))
+    assert sorted(unordered) == list(enumerate(expected))
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_error_of_func_is_raised(tmp_path, ordered:bool) -> None:
+    slicer = FileSlicer([text_file(tmp_path)], 1)
+    with pytest.raises(ValueError, match = 'line 7'):
+        list(map_chunks(fail_on_seven, slicer, 2, ordered = ordered))
+    assert mp.active_children() == []
+
+def test_early_stop_terminates_pool(tmp_path) -> None:
+    slicer = FileSlicer([text_file(tmp_path)], 100)
+    results = map_chunks(count_lines, slicer, 2)
+    assert next(results) > 0
+    results.close()
+    assert mp.active_children() == []
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+'''
+    FASTA chunks are cut only at record starts and balanced by sequence bytes (long headers are not counted),
+    with a fresh .fai, by the scan pass that writes it, and by the scan pass of FastaSlicer without fai.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import random
+import pytest
+
+from ..fasta_split import FastaIndex, FastaSlicer, MultiFastaSlicer
+
+def long_header_fasta(tmp_path, line_width:int = 60, irregular:bool = False) -> tuple:
+    '''
+        Return (file, {name: sequence}), half of the headers are longer than most records
+    '''
+    rng = random.Random(5)
+    records, lines = {}, []
+    for index in range(120):
+        name = 'seq_%d' % index
+        records[name] = ''.join(rng.choice('ACGT') for _ in range(rng.randint(10, 800)))
+        lines.append('>%s %s' % (name, 'x' * rng.choice([0, 2000])))
+        sequence_lines = [records[name][i:i + line_width] for i in range(0, len(records[name]), line_width)]
+        if irregular and len(sequence_lines) > 2:
+            #the first line is shorter than the others
+            sequence_lines = [sequence_lines[0][:-1], sequence_lines[0][-1:] + sequence_lines[1]] + sequence_lines[2:]
+        lines += sequence_lines
+    fasta_file = tmp_path / 'long_header.fa'
+    fasta_file.write_text('\n'.join(lines) + '\n')
+    return str(fasta_file), records
+
+def chunk_bases(fasta_file:str, pointers) -> list:
+    data = open(fasta_file, 'rb').read()
+    result = []
+    for _, begin, end in pointers:
+        assert data[begin:begin + 1] == b'>'
+        result.append(sum(len(i) for i in data[begin:end].split(b'\n') if not i.startswith(b'>')))
+    return result
+
+@pytest.mark.parametrize('fai', [False, True])
+def test_chunks_are_balanced_by_bases(tmp_path, fai:bool) -> None:
+    fasta_file, records = long_header_fasta(tmp_path)
+    chunk_size = 5000
+    for _ in range(2):
+        #the second run of fai = True uses the .fai written by the first one
+        bases = chunk_bases(fasta_file, FastaSlicer([fasta_file], chunk_size, fai = fai).pointers)
+        assert sum(bases) == sum(len(i) for i in records.values())
+        #a chunk ends at the first record start after chunk_size bases, records are at most 800 bases
+        assert all(chunk_size <= i < chunk_size + 800 for i in bases[:-1])
+    assert os.path.exists(fasta_file + '.fai') == fai
+
+def test_scan_without_fai_allows_irregular_lines(tmp_path) -> None:
+    fasta_file, records = long_header_fasta(tmp_path, irregular = True)
+    bases = chunk_bases(fasta_file, FastaSlicer([fasta_file], 5000).pointers)
+    assert sum(bases) == sum(len(i) for i in records.values())
+    with pytest.raises(ValueError, match = 'different line length'):
+        FastaSlicer([fasta_file], 5000, fai = True)
+
+def test_fai_fetch_and_offset_mode(tmp_path) -> None:
+    fasta_file, records = long_header_fasta(tmp_path)
+    FastaSlicer([fasta_file], 5000, fai = True)
+    with FastaIndex(fasta_file) as index:
+        assert index.names() == list(records)
+        assert index.fetch('seq_7') == records['seq_7']
+        assert index.fetch('seq_7', 5, 70) == records['seq_7'][5:70]
+    pointers = MultiFastaSlicer([fasta_file], 2, 5000, split_mode = 'offset', backend = 'thread').pointers
+    data = open(fasta_file, 'rb').read()
+    assert all(data[i[1]:i[1] + 1] == b'>' for i in pointers)
+    assert b''.join(data[i[1]:i[2]] for i in pointers) == data
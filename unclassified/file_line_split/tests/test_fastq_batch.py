@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+'''
+    RecordBatch and iter_batches: fields, lengths and matrices are the same as a naive parse of the 4 lines,
+    to_bytes and the batches of a chunk join back to the same FASTQ text, broken records are rejected.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import random
+import pytest
+import numpy as np
+
+from ..fastq_batch import RecordBatch, iter_batches
+
+def fastq_records(read_num:int, seed:int = 6) -> list:
+    rng = random.Random(seed)
+    records = []
+    for index in range(read_num):
+        #empty reads too
+        size = rng.randint(0, 300) if index % 17 else 0
+        sequence = ''.join(rng.choice('ACGTN') for _ in range(size))
+        quality = ''.join(chr(rng.randint(33, 74)) for _ in range(size))
+        records.append(('read_%d extra' % index, sequence, quality))
+    return records
+
+def fastq_text(records:list, line_end:str = '\n') -> bytes:
+    return ''.join(line_end.join(['@' + i[0], i[1], '+', i[2]]) + line_end for i in records).encode()
+
+@pytest.mark.parametrize('line_end', ['\n', '\r\n'])
+def test_parse_is_same_as_naive(line_end:str) -> None:
+    records = fastq_records(500)
+    batch = RecordBatch.parse(fastq_text(records, line_end))
+    assert len(batch) == 500
+    assert batch.names() == [i[0].encode() for i in records]
+    assert [batch.sequence(i) for i in range(500)] == [i[1].encode() for i in records]
+    assert [batch.quality(i) for i in range(500)] == [i[2].encode() for i in records]
+    assert batch.lengths().tolist() == [len(i[1]) for i in records]
+    quality = batch.quality_matrix(fill = 255)
+    sequence = batch.sequence_matrix()
+    assert quality.shape == sequence.shape == (500, max(len(i[1]) for i in records))
+    for row, (_, every_sequence, every_quality) in enumerate(records):
+        assert quality[row, :len(every_quality)].tolist() == [ord(i) - 33 for i in every_quality]
+        assert (quality[row, len(every_quality):] == 255).all()
+        assert sequence[row, :len(every_sequence)].tobytes() == every_sequence.encode()
+    assert batch.quality_matrix(10).shape == (500, 10)
+
+def test_take_and_to_bytes_round_trip() -> None:
+    records = fastq_records(300)
+    data = fastq_text(records)
+    batch = RecordBatch.parse(data)
+    assert batch.to_bytes() == data
+    part = batch.take(np.arange(1, 300, 3))
+    assert part.data is batch.data
+    assert part.to_bytes() == fastq_text(records[1::3])
+    assert batch.take(slice(10, 20)).names() == [i[0].encode() for i in records[10:20]]
+    assert batch.record(3) == fastq_text(records[3:4])
+    #the last record has no line end
+    assert RecordBatch.parse(data[:-1]).to_bytes() == data
+    assert len(RecordBatch.parse(b'')) == 0
+
+@pytest.mark.parametrize('batch_size', [1, 7, 64, 100000])
+def test_iter_batches_join_to_chunk(batch_size:int) -> None:
+    records = fastq_records(1000)
+    data = fastq_text(records)
+    batches = list(iter_batches(memoryview(data), batch_size))
+    assert [len(i) for i in batches][:-1] == [batch_size] * (len(batches) - 1)
+    assert sum(len(i) for i in batches) == 1000
+    assert b''.join(i.to_bytes() for i in batches) == data
+    assert list(iter_batches(b'', batch_size)) == []
+    with pytest.raises(ValueError):
+        list(iter_batches(data, 0))
+
+@pytest.mark.parametrize('data', [
+    b'@r1\nACGT\n+\nIIII\n@r2\nAC\n',
+    b'r1\nACGT\n+\nIIII\n',
+    b'@r1\nACGT\n-\nIIII\n',
+    b'@r1\nACGT\n+\nIII\n',
+])
+def test_broken_records_are_rejected(data:bytes) -> None:
+    with pytest.raises(ValueError):
+        RecordBatch.parse(data)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+'''
+    FastqSampler: the sample is exactly number distinct reads of the files (or all of them), the same seed gives the same sample,
+    paired samples are the mates of each other and unpaired files are rejected.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import gzip
+import random
+import pytest
+
+from ..fastq_sample import FastqSampler
+
+def fastq_records(read_num:int, mate:int = 1, seed:int = 3) -> list:
+    rng = random.Random(seed * 10 + mate)
+    records = []
+    for index in range(read_num):
+        size = rng.randint(30, 150)
+        records.append(b'@read_%d/%d\n%s\n+\n%s\n' % (index, mate, b'ACGT'[index % 4:index % 4 + 1] * size, b'I' * size))
+    return records
+
+def write_fastq(file:str, records:list) -> str:
+    with (gzip.open(file, 'wb') if file.endswith('.gz') else open(file, 'wb')) as output_handle:
+        output_handle.write(b''.join(records))
+    return file
+
+def sampled(sampler:FastqSampler, number:int = 0, fraction:float = 0.0) -> tuple:
+    r1_records, r2_records = [], []
+    for r1_batch, r2_batch in sampler.sample(number, fraction):
+        r1_records += [r1_batch.record(i) for i in range(len(r1_batch))]
+        if r2_batch is not None:
+            r2_records += [r2_batch.record(i) for i in range(len(r2_batch))]
+    sampler.close()
+    return r1_records, r2_records
+
+@pytest.mark.parametrize('suffix', ['.fq', '.fq.gz'])
+def test_exact_number_of_distinct_reads(tmp_path, suffix:str) -> None:
+    records = fastq_records(3000)
+    files = [write_fastq(str(tmp_path / ('a' + suffix)), records[:2000]), write_fastq(str(tmp_path / ('b' + suffix)), records[2000:])]
+    sample = sampled(FastqSampler(files, chunk_size = 8192, seed = 7), 500)[0]
+    assert len(sample) == len(set(sample)) == 500
+    assert set(sample) <= set(records)
+    assert sampled(FastqSampler(files, chunk_size = 8192, seed = 7), 500)[0] == sample
+    assert sampled(FastqSampler(files, chunk_size = 8192, seed = 8), 500)[0] != sample
+    #more than all reads, every read once
+    assert sorted(sampled(FastqSampler(files, chunk_size = 8192), 5000)[0]) == sorted(records)
+
+def test_fraction(tmp_path) -> None:
+    input_file = write_fastq(str(tmp_path / 'a.fq'), fastq_records(5000))
+    sample = sampled(FastqSampler([input_file], chunk_size = 16384, seed = 1), fraction = 0.1)[0]
+    assert len(sample) == len(set(sample))
+    assert 350 <= len(sample) <= 650
+
+def test_paired_reads_are_mates(tmp_path) -> None:
+    r1_records, r2_records = fastq_records(3000, 1), fastq_records(3000, 2)
+    r1_file, r2_file = write_fastq(str(tmp_path / 'r1.fq'), r1_records), write_fastq(str(tmp_path / 'r2.fq.gz'), r2_records)
+    r1_sample, r2_sample = sampled(FastqSampler([r1_file], [r2_file], chunk_size = 8192, seed = 2), 700)
+    assert len(r1_sample) == len(r2_sample) == 700
+    mates = dict(zip(r1_records, r2_records))
+    assert [mates[i] for i in r1_sample] == r2_sample
+    #written files hold the same reads
+    sampler = FastqSampler([r1_file], [r2_file], chunk_size = 8192, seed = 2)
+    assert sampler.write(str(tmp_path / 'out_R1.fq'), 700, r2_output = str(tmp_path / 'out_R2.fq.gz')) == 700
+    assert open(str(tmp_path / 'out_R1.fq'), 'rb').read() == b''.join(r1_sample)
+    assert gzip.open(str(tmp_path / 'out_R2.fq.gz')).read() == b''.join(r2_sample)
+    with pytest.raises(ValueError):
+        FastqSampler([r1_file], [r2_file]).write(str(tmp_path / 'out_R1.fq'), 10)
+
+def test_unpaired_reads_are_rejected(tmp_path) -> None:
+    r1_records, r2_records = fastq_records(2000, 1), fastq_records(2000, 2)
+    del r2_records[1000]
+    r1_file, r2_file = write_fastq(str(tmp_path / 'r1.fq'), r1_records), write_fastq(str(tmp_path / 'r2.fq'), r2_records)
+    with pytest.raises(ValueError, match = 'not paired'):
+        sampled(FastqSampler([r1_file], [r2_file], chunk_size = 4096, seed = 1), 2000)
+    with pytest.raises(ValueError, match = 'not paired'):
+        FastqSampler([r1_file], [r2_file, r2_file])
+    with pytest.raises(FileNotFoundError):
+        FastqSampler([str(tmp_path / 'missing.fq')])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+'''
+    Stress test of find_record_start with adversarial quality strings:
+        quality lines starting with '@' or '+', quality lines equal to a header or a '+name' line,
+        '+' separator lines repeating the read name, and boundaries at every byte (so every phase of the 4 lines).
+    PairedFastqSlicer: every chunk pair holds the same reads, unpaired files are rejected and no worker process is left.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import io
+import random
+import pytest
+import multiprocessing as mp
+
+from ..fastq_split import FastqSlicer, PairedFastqSlicer, find_record_start
+
+BASES = 'ACGTN'
+QUALITY = ''.join(chr(i) for i in range(33, 127))
+
+def adversarial_reads(read_num:int, seed:int, multi_line:bool = False) -> tuple:
+    '''
+        Return (FASTQ bytes, sorted record starts)
+    '''
+    rng = random.Random(seed)
+    lines, starts, pointer = [], [], 0
+    for index in range(read_num):
+        name = 'read_%d/1' % index
+        size = rng.randint(1, 12)
+        sequence = ''.join(rng.choice(BASES) for _ in range(size))
+        kind = index % 5
+        if kind == 0:
+            #quality looks like a header
+            quality = ('@' + name)[:size].ljust(size, 'I')
+        elif kind == 1:
+            #quality looks like a separator which repeats the name
+            quality = ('+' + name)[:size].ljust(size, 'I')
+        elif kind == 2:
+            quality = '@' * size
+        elif kind == 3:
+            quality = '+' * size
+        else:
+            quality = ''.join(rng.choice(QUALITY) for _ in range(size))
+        separator = '+' + name if index % 2 == 0 else '+'
+        if multi_line and size > 1:
+            cut = rng.randint(1, size - 1)
+            record = ['@' + name, sequence[:cut], sequence[cut:], separator, quality[:cut], quality[cut:]]
+        else:
+            record = ['@' + name, sequence, separator, quality]
+        starts.append(pointer)
+        for line in record:
+            lines.append(line)
+            pointer += len(line) + 1
+    return ('\n'.join(lines) + '\n').encode(), starts
+
+@pytest.mark.parametrize('multi_line', [False, True])
+@pytest.mark.parametrize('window', [8, 65536])
+def test_every_offset_is_resolved_to_next_record_start(multi_line:bool, window:int) -> None:
+    data, starts = adversarial_reads(60, 7, multi_line)
+    handle = io.BytesIO(data)
+    starts_set = set(starts)
+    for offset in range(len(data) + 1):
+        expected = next((i for i in starts if i >= offset), len(data))
+        result = find_record_start(handle, offset, len(data), window = window)
+        assert result == expected, 'offset %d resolved to %d, the next record start is %d' % (offset, result, expected)
+        assert result == len(data) or result in starts_set
+
+@pytest.mark.parametrize('chunk_size', [1, 17, 64, 1000])
+def test_every_chunk_starts_at_header_line(tmp_path, chunk_size:int) -> None:
+    data, starts = adversarial_reads(200, 11)
+    fastq_file = tmp_path / 'adversarial.fq'
+    fastq_file.write_bytes(data)
+    pointers = list(FastqSlicer([str(fastq_file)], chunk_size).pointers)
+    assert pointers[0][1] == 0 and pointers[-1][2] == len(data)
+    starts_set = set(starts)
+    for (_, begin, end), (_, next_begin, _) in zip(pointers, pointers[1:] + [(None, len(data), None)]):
+        assert begin in starts_set
+        assert end == next_begin
+
+def paired_reads(tmp_path, read_num:int, prefix:str = 'pair', r2_names:list = None) -> tuple:
+    '''
+        R1 and R2 of read_num reads, mates have different lengths, so the offsets of R1 and R2 are different
+    '''
+    rng = random.Random(read_num)
+    r1_lines, r2_lines = [], []
+    for index in range(read_num):
+        r1_size, r2_size = rng.randint(20, 150), rng.randint(20, 150)
+        r1_lines += ['@read_%d/1' % index, 'A' * r1_size, '+', 'I' * r1_size]
+        r2_name = 'read_%d' % index if r2_names is None else r2_names[index]
+        r2_lines += ['@%s/2 comment' % r2_name, 'C' * r2_size, '+', '@' * r2_size]
+    r1_file, r2_file = tmp_path / ('%s_R1.fq' % prefix), tmp_path / ('%s_R2.fq' % prefix)
+    r1_file.write_text('\n'.join(r1_lines) + ('\n' if read_num > 0 else ''))
+    r2_file.write_text('\n'.join(r2_lines) + ('\n' if read_num > 0 else ''))
+    return str(r1_file), str(r2_file)
+
+def test_paired_chunks_hold_the_same_reads(tmp_path) -> None:
+    r1_file, r2_file = paired_reads(tmp_path, 3000)
+    empty_r1, empty_r2 = paired_reads(tmp_path, 0, 'empty')
+    slicer = PairedFastqSlicer([r1_file, empty_r1], [r2_file, empty_r2], 2, 20000)
+    assert len(slicer.r1_pointers) == len(slicer.r2_pointers) == len(slicer.pointers) > 5
+    r1_data, r2_data = open(r1_file, 'rb').read(), open(r2_file, 'rb').read()
+    for r1_path, r1_begin, r1_end, r2_path, r2_begin, r2_end in slicer.pointers:
+        assert (r1_path, r2_path) == (r1_file, r2_file)
+        r1_names = [i.split(b'/')[0] for i in r1_data[r1_begin:r1_end].split(b'\n')[0::4] if i]
+        r2_names = [i.split(b'/')[0] for i in r2_data[r2_begin:r2_end].split(b'\n')[0::4] if i]
+        assert r1_names == r2_names
+    assert b''.join(r2_data[i[1]:i[2]] for i in slicer.r2_pointers) == r2_data
+    assert mp.active_children() == []
+
+def test_unpaired_reads_are_rejected(tmp_path) -> None:
+    r1_file, r2_file = paired_reads(tmp_path, 1000)
+    _, short_r2 = paired_reads(tmp_path, 999, 'short')
+    with pytest.raises(ValueError, match = 'not paired'):
+        PairedFastqSlicer([r1_file], [short_r2], 2, 5000)
+    names = ['read_%d' % i for i in range(1000)]
+    names[500], names[501] = names[501], names[500]
+    _, swapped_r2 = paired_reads(tmp_path, 1000, 'swapped', names)
+    with pytest.raises(ValueError, match = 'not paired'):
+        #a chunk boundary at read 500 or 501 is checked with chunk_size of one read
+        PairedFastqSlicer([r1_file], [swapped_r2], 2, 1)
+    with pytest.raises(FileNotFoundError):
+        PairedFastqSlicer([r1_file], [str(tmp_path / 'missing_R2.fq')], 2, 5000)
+    with pytest.raises(ValueError):
+        PairedFastqSlicer([r1_file], [], 2, 5000)
+    assert mp.active_children() == []
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+'''
+    FastqStats: every statistic is the same as a naive count of the reads, merge of chunks in any order is the same as one pass,
+    the KMV sketch is exact for few distinct sequences and near the true count for many.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import json
+import random
+import pytest
+
+from collections import Counter
+
+from ..fastq_batch import RecordBatch
+from ..fastq_split import MultiFastqSlicer
+from ..fastq_stats import FastqStats, chunk_stats, fastq_stats
+
+def fastq_records(read_num:int, seed:int = 9, distinct:int = 0) -> list:
+    '''
+        (sequence, quality) of reads, reads are drawn from distinct sequences if distinct gt 0
+    '''
+    rng = random.Random(seed)
+    pool = []
+    for index in range(distinct if distinct > 0 else read_num):
+        size = rng.randint(0, 120) if index % 11 else 0
+        pool.append(''.join(rng.choice('ACGTNacgt') for _ in range(size)))
+    sequences = [rng.choice(pool) for _ in range(read_num)] if distinct > 0 else pool
+    return [(i, ''.join(chr(rng.randint(33, 126)) for _ in i)) for i in sequences]
+
+def fastq_text(records:list) -> bytes:
+    return ''.join('@read_%d\n%s\n+\n%s\n' % (i, j[0], j[1]) for i, j in enumerate(records)).encode()
+
+def naive_report(records:list) -> dict:
+    max_length = max(len(i[0]) for i in records)
+    cover = [sum(1 for i in records if len(i[0]) > j) for j in range(max_length)]
+    gc_counts, quality_counts = [0] * 101, [0] * 94
+    for sequence, quality in records:
+        gc_counts[int(round(sum(i in 'GCgc' for i in sequence) * 100 / max(len(sequence), 1)))] += 1
+        quality_counts[min(int(round(sum(ord(i) - 33 for i in quality) / max(len(quality), 1))), 93)] += 1
+    bases = ''.join(i[0] for i in records).upper()
+    return {
+        'reads': len(records),
+        'bases': len(bases),
+        'histogram': dict(Counter(len(i[0]) for i in records)),
+        'gc_content': (bases.count('G') + bases.count('C')) / len(bases),
+        'n_rate': bases.count('N') / len(bases),
+        'gc_histogram': gc_counts,
+        'read_quality_histogram': quality_counts,
+        'mean_quality': [sum(ord(i[1][j]) - 33 for i in records if len(i[1]) > j) / cover[j] for j in range(max_length)],
+        'base_content': {b: [sum(1 for i in records if len(i[0]) > j and i[0][j].upper() == b) / cover[j] for j in range(max_length)] for b in 'ACGTN'},
+    }
+
+def test_stats_are_same_as_naive() -> None:
+    records = fastq_records(800)
+    report = FastqStats().add(RecordBatch.parse(fastq_text(records))).report()
+    expected = naive_report(records)
+    for key in ['reads', 'bases', 'gc_histogram', 'read_quality_histogram']:
+        assert report[key] == expected[key]
+    assert report['length']['histogram'] == expected['histogram']
+    assert report['gc_content'] == pytest.approx(expected['gc_content'])
+    assert report['n_rate'] == pytest.approx(expected['n_rate'])
+    assert report['per_position']['mean_quality'] == pytest.approx(expected['mean_quality'])
+    for every_base in 'ACGTN':
+        assert report['per_position']['base_content'][every_base] == pytest.approx(expected['base_content'][every_base])
+
+def test_merge_in_any_order_is_same_as_one_pass() -> None:
+    data = fastq_text(fastq_records(1000))
+    one_pass = FastqStats(256).add(RecordBatch.parse(data)).report()
+    records = data.split(b'\n')[:-1]
+    chunks = [b'\n'.join(records[i:i + 4 * 90]) + b'\n' for i in range(0, len(records), 4 * 90)]
+    random.Random(1).shuffle(chunks)
+    merged = FastqStats(256)
+    for every_chunk in chunks:
+        merged.merge(chunk_stats(memoryview(every_chunk), 17, 256))
+    assert merged.report() == one_pass
+
+@pytest.mark.parametrize('distinct', [50, 20000])
+def test_kmv_distinct_estimate(distinct:int) -> None:
+    records = fastq_records(40000, 3, distinct)
+    true_distinct = len(set(i[0].upper() for i in records))
+    stats = FastqStats(1024).add(RecordBatch.parse(fastq_text(records)))
+    if true_distinct < 1024:
+        assert stats.distinct_estimate() == true_distinct
+    else:
+        #standard error of KMV is about 1 / sqrt(k), 3%
+        assert stats.distinct_estimate() == pytest.approx(true_distinct, rel = 0.12)
+    duplicate = stats.report()['duplicate']
+    assert duplicate['duplicate_rate'] == pytest.approx(1 - duplicate['distinct_estimate'] / 40000)
+
+def test_fastq_stats_of_files(tmp_path) -> None:
+    records = fastq_records(3000, 5)
+    files = [str(tmp_path / 'a.fq'), str(tmp_path / 'b.fq')]
+    open(files[0], 'wb').write(fastq_text(records[:1000]))
+    open(files[1], 'wb').write(fastq_text(records[1000:]))
+    expected = FastqStats(512).add(RecordBatch.parse(fastq_text(records))).report()
+    stats = fastq_stats(files, 2, batch_size = 100, sketch_size = 512, slicer = MultiFastqSlicer(files, 2, 20000))
+    assert stats.report() == expected
+    stats.write_json(str(tmp_path / 'qc.json'))
+    assert json.load(open(str(tmp_path / 'qc.json')))['reads'] == 3000
+    stats.write_tsv(str(tmp_path / 'qc.tsv'))
+    lines = open(str(tmp_path / 'qc.tsv')).read().split('\n')
+    assert lines[:3] == ['>>Basic Statistics', '#Measure\tValue', 'reads\t3000']
+    assert lines.count('>>END_MODULE') == 5
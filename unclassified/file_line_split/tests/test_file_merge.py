@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+'''
+    merge_files is the same as the concatenation of the inputs with copy_file_range and with pread/pwrite,
+    in one thread or many, an error leaves no temp file and keeps the old output, chunk_outputs is in natural order.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import gzip
+import errno
+import random
+import pytest
+
+from .. import file_merge
+from ..file_merge import chunk_outputs, merge_files, safely_merge_file
+
+def chunk_files(tmp_path, chunk_num:int = 12) -> list:
+    rng = random.Random(4)
+    folder = tmp_path / 'work'
+    folder.mkdir(exist_ok = True)
+    files = []
+    for index in range(chunk_num):
+        files.append(str(folder / ('chunk_%d.txt' % index)))
+        #an empty chunk too
+        open(files[-1], 'wb').write(bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 5000) if index != 3 else 0)))
+    return files
+
+def no_temp_files(folder) -> bool:
+    return [i for i in os.listdir(str(folder)) if i.endswith('.tmp')] == []
+
+@pytest.mark.parametrize('threads, block_size', [(1, 268435456), (4, 1000), (4, 1)])
+def test_merge_is_same_as_concatenation(tmp_path, threads:int, block_size:int) -> None:
+    files = chunk_files(tmp_path)
+    output_file = str(tmp_path / 'merged.bin')
+    expected = b''.join(open(i, 'rb').read() for i in files)
+    assert merge_files(files, output_file, threads, block_size) == len(expected)
+    assert open(output_file, 'rb').read() == expected
+    assert no_temp_files(tmp_path)
+
+@pytest.mark.parametrize('error', [None, errno.EXDEV])
+def test_pread_fallback(tmp_path, monkeypatch, error:int) -> None:
+    if error is None:
+        monkeypatch.delattr(os, 'copy_file_range', raising = False)
+    else:
+        def cross_device(*args) -> int:
+            raise OSError(error, os.strerror(error))
+        monkeypatch.setattr(os, 'copy_file_range', cross_device, raising = False)
+    files = chunk_files(tmp_path)
+    output_file = str(tmp_path / 'merged.bin')
+    merge_files(files, output_file, 3, 777)
+    assert open(output_file, 'rb').read() == b''.join(open(i, 'rb').read() for i in files)
+
+def test_gzip_members_are_merged(tmp_path) -> None:
+    files = []
+    for index in range(3):
+        files.append(str(tmp_path / ('%d.gz' % index)))
+        with gzip.open(files[-1], 'wb') as output_handle:
+            output_handle.write(b'line %d\n' % index * 100)
+    merge_files(files, str(tmp_path / 'merged.gz'))
+    assert gzip.open(str(tmp_path / 'merged.gz')).read() == b''.join(b'line %d\n' % i * 100 for i in range(3))
+
+def test_errors_keep_the_old_output(tmp_path, monkeypatch) -> None:
+    files = chunk_files(tmp_path)
+    output_file = tmp_path / 'merged.bin'
+    output_file.write_bytes(b'old')
+    os.chmod(str(output_file), 0o640)
+    with pytest.raises(FileNotFoundError):
+        merge_files(files + [str(tmp_path / 'missing.txt')], str(output_file))
+    with pytest.raises(ValueError):
+        merge_files(files + [str(output_file)], str(output_file))
+    #an input is shorter than its size, it is changed during merge
+    getsize = os.path.getsize
+    monkeypatch.setattr(file_merge.os.path, 'getsize', lambda file: getsize(file) + (10 if file == files[0] else 0))
+    with pytest.raises(ValueError):
+        merge_files(files, str(output_file), 2)
+    monkeypatch.undo()
+    assert output_file.read_bytes() == b'old'
+    assert no_temp_files(tmp_path)
+    #the replaced output keeps its mode
+    merge_files(files, str(output_file))
+    assert os.stat(str(output_file)).st_mode & 0o777 == 0o640
+
+def test_chunk_outputs_in_natural_order(tmp_path) -> None:
+    files = chunk_files(tmp_path)
+    (tmp_path / 'work' / '.chunk_99.txt').write_bytes(b'hidden')
+    (tmp_path / 'work' / 'chunk_1.log').write_bytes(b'log')
+    assert chunk_outputs(str(tmp_path / 'work'), r'chunk_\d+\.txt$') == files
+    assert safely_merge_file(str(tmp_path / 'work'), str(tmp_path / 'merged.bin'), r'\.txt$') == sum(os.path.getsize(i) for i in files)
+    with pytest.raises(FileNotFoundError):
+        chunk_outputs(str(tmp_path / 'missing'))
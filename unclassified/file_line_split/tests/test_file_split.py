@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+'''
+    Pointers of FileSlicer and MultiFileSlicer ('file' mode) are the same as the seek loop of the first FileSlicer,
+    every split mode and backend cut the files at line ends without gap, and the chunks of MultiFastqSlicer in both split modes start at the record start after k * chunk_size.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import random
+import pytest
+
+from itertools import accumulate
+
+from ..file_split import FileSlicer, MultiFileSlicer
+from ..fastq_split import MultiFastqSlicer
+
+def baseline_pointers(file:str, chunk_size:int, split_num:int = 0, every_header:int = 0) -> tuple:
+    '''
+        The seek and readline loop of the first FileSlicer, the last end is not gt file size
+    '''
+    seek_result, header_result = [], []
+    total_size = os.path.getsize(file)
+    with open(file, 'rb') as input_handle:
+        if every_header > 0:
+            header_result.append([input_handle.readline().decode().strip('\n') for _ in range(every_header)])
+        init_pointer = input_handle.tell()
+        if split_num >= 1:
+            chunk_size = int((total_size - init_pointer) / split_num)
+        while init_pointer < total_size:
+            input_handle.seek(chunk_size, 1)
+            _ = input_handle.readline()
+            now_pointer = min(input_handle.tell(), total_size)
+            if now_pointer == init_pointer:
+                continue
+            seek_result.append((file, init_pointer, now_pointer))
+            init_pointer = now_pointer
+    return seek_result, header_result
+
+def text_file(tmp_path, name:str, line_num:int, seed:int) -> str:
+    rng = random.Random(seed)
+    lines = ['col_a\tcol_b'] + ['%d\t%s' % (i, 'x' * rng.randint(0, 300)) for i in range(line_num)]
+    text_path = tmp_path / name
+    text_path.write_text('\n'.join(lines) + ('\n' if seed % 2 == 0 else ''))
+    return str(text_path)
+
+def fastq_file(tmp_path, name:str, read_num:int) -> str:
+    rng = random.Random(read_num)
+    lines = []
+    for index in range(read_num):
+        size = rng.randint(20, 150)
+        lines += ['@read_%d' % index, 'A' * size, '+', 'I' * size]
+    fastq_path = tmp_path / name
+    fastq_path.write_text('\n'.join(lines) + '\n')
+    return str(fastq_path)
+
+@pytest.mark.parametrize('chunk_size, split_num', [(1, 0), (997, 0), (100000, 0), (100, 7)])
+def test_file_slicer_is_same_as_baseline(tmp_path, chunk_size:int, split_num:int) -> None:
+    files = [text_file(tmp_path, 'a.tsv', 500, 2), text_file(tmp_path, 'b.tsv', 50, 3)]
+    slicer = FileSlicer(files, chunk_size, split_num, header = [1, 1])
+    expected_pointers, expected_header = [], []
+    for every_file in files:
+        pointers, header = baseline_pointers(every_file, chunk_size, split_num, 1)
+        expected_pointers += pointers
+        expected_header += header
+    assert slicer.pointers.to_list() == expected_pointers
+    assert slicer.header == expected_header
+
+@pytest.mark.parametrize('split_mode', ['file', 'offset'])
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_multi_file_slicer_split_modes(tmp_path, split_mode:str, backend:str) -> None:
+    files = [text_file(tmp_path, '%d.tsv' % i, 300 * (i + 1), i) for i in range(3)]
+    slicer = MultiFileSlicer(files, 3, 2000, header = [1, 0, 1], split_mode = split_mode, backend = backend, task_size = 10000)
+    expected = [baseline_pointers(every_file, 2000, 0, every_header) for every_file, every_header in zip(files, [1, 0, 1])]
+    assert slicer.header == [i[1][0] for i in expected if i[1]]
+    if split_mode == 'file' and backend == 'serial':
+        assert slicer.pointers.to_list() == sum([i[0] for i in expected], [])
+    #every mode cut the files at line ends and the chunks join without gap
+    for every_file, every_header in zip(files, [1, 0, 1]):
+        data = open(every_file, 'rb').read()
+        header_size = len(data.split(b'\n')[0]) + 1 if every_header else 0
+        chunks = [i for i in slicer.pointers if i[0] == every_file]
+        assert b''.join(data[i[1]:i[2]] for i in chunks) == data[header_size:]
+        assert all(data[i[1] - 1:i[1]] == b'\n' for i in chunks if i[1] > 0)
+
+def test_missing_file(tmp_path) -> None:
+    with pytest.raises(FileNotFoundError):
+        FileSlicer([str(tmp_path / 'missing.txt')])
+    with pytest.raises(FileNotFoundError):
+        MultiFileSlicer([str(tmp_path / 'missing.txt')], 2, split_mode = 'offset', backend = 'thread')
+
+def test_multi_fastq_split_modes_cut_at_record_starts(tmp_path) -> None:
+    files = [fastq_file(tmp_path, 'a.fq', 3000), fastq_file(tmp_path, 'b.fq', 700)]
+    file_mode = MultiFastqSlicer(files, 2, 5000, backend = 'serial').pointers.to_list()
+    offset_mode = MultiFastqSlicer(files, 2, 5000, split_mode = 'offset', backend = 'thread').pointers.to_list()
+    for every_file in files:
+        data = open(every_file, 'rb').read()
+        starts = [0] + list(accumulate(len(i) + 1 for i in data.split(b'\n')[:-1]))[3::4][:-1]
+        next_start = lambda offset: next((i for i in starts if i >= offset), len(data))
+        #file mode chain chunk_size from the last start, offset mode resolve k * chunk_size on its own
+        file_bounds, pointer = [0], 0
+        while pointer < len(data):
+            pointer = next_start(pointer + 5000)
+            file_bounds.append(pointer)
+        offset_bounds = sorted(set([0, len(data)] + [next_start(i) for i in range(5000, len(data), 5000)]))
+        for pointers, bounds in ((file_mode, file_bounds), (offset_mode, offset_bounds)):
+            chunks = [i for i in pointers if i[0] == every_file]
+            assert [i[1] for i in chunks] + [chunks[-1][2]] == bounds
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+'''
+    find_files on a thread pool finds the same files and sizes as os.walk (hidden files and folders skipped),
+    a folder which can not be listed goes to onerror and the walk goes on, link loops do not hang, an early stop frees the threads.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import re
+import pytest
+import threading
+
+from .. import find_files as find_files_module
+from ..find_files import find_files
+from ..file_split import MultiFileSlicer
+
+def make_tree(tmp_path) -> str:
+    root = tmp_path / 'data'
+    for depth_a in range(4):
+        for depth_b in range(3):
+            folder = root / ('a_%d' % depth_a) / ('b_%d' % depth_b)
+            folder.mkdir(parents = True)
+            for index in range(5):
+                (folder / ('f_%d.txt' % index)).write_text('%d\n' % index * (depth_a + index))
+            (folder / 'f.log').write_text('log\n')
+    (root / '.hidden').mkdir()
+    (root / '.hidden' / 'f_0.txt').write_text('hidden\n')
+    (root / 'a_0' / '.f_9.txt').write_text('hidden\n')
+    (root / 'top.txt').write_text('top\n')
+    return str(root)
+
+def walk_files(root:str, pattern:str = '') -> list:
+    result = []
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [i for i in dirs if not i.startswith('.')]
+        result += [(os.path.join(folder, i), os.path.getsize(os.path.join(folder, i))) for i in files
+            if not i.startswith('.') and re.search(pattern, os.path.join(folder, i))]
+    return sorted(result)
+
+@pytest.mark.parametrize('workers', [1, 8])
+@pytest.mark.parametrize('pattern', ['', r'\.txt$'])
+def test_same_files_as_os_walk(tmp_path, workers:int, pattern:str) -> None:
+    root = make_tree(tmp_path)
+    assert sorted(find_files(root, pattern, workers)) == walk_files(root, pattern)
+    #a relative root gives absolute paths, a file root is yielded as it is
+    assert sorted(find_files(os.path.relpath(root), pattern, workers)) == walk_files(root, pattern)
+    assert list(find_files(os.path.join(root, 'top.txt'))) == [(os.path.join(root, 'top.txt'), 4)]
+
+def test_slicer_accepts_the_iterator(tmp_path) -> None:
+    root = make_tree(tmp_path)
+    files = walk_files(root, r'\.txt$')
+    pointers = MultiFileSlicer(find_files(root, r'\.txt$', 4), 2, 3, backend = 'thread').pointers
+    assert sorted(pointers.files()) == [i[0] for i in files if i[1] > 0]
+    assert int(pointers.sizes().sum()) == sum(i[1] for i in files)
+
+def test_onerror_and_links(tmp_path, monkeypatch) -> None:
+    root = make_tree(tmp_path)
+    os.symlink(root, os.path.join(root, 'a_1', 'loop'))
+    #a link loop is not followed by default
+    assert sorted(find_files(root)) == walk_files(root)
+    scandir = os.scandir
+    def denied(path:str):
+        if os.path.basename(path) == 'a_2':
+            raise PermissionError(13, 'Permission denied', path)
+        return scandir(path)
+    monkeypatch.setattr(find_files_module.os, 'scandir', denied)
+    errors = []
+    found = sorted(find_files(root, onerror = errors.append))
+    assert [i.filename for i in errors] == [os.path.join(root, 'a_2')]
+    assert found == [i for i in walk_files(root) if '/a_2/' not in i[0]]
+    #onerror raise the error to stop the walk
+    def stop(error:OSError) -> None:
+        raise error
+    with pytest.raises(PermissionError):
+        list(find_files(root, onerror = stop))
+
+def test_early_stop_and_errors(tmp_path) -> None:
+    root = make_tree(tmp_path)
+    threads = threading.active_count()
+    files = find_files(root, workers = 4)
+    next(files)
+    files.close()
+    assert threading.active_count() == threads
+    with pytest.raises(FileNotFoundError):
+        list(find_files(str(tmp_path / 'missing')))
+    with pytest.raises(ValueError):
+        list(find_files(root, workers = 0))
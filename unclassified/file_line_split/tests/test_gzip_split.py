@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+'''
+    Random access of plain gzip (zran access points) and BGZF files is the same as stdlib gzip,
+    chunks of the slicers on a gzip file are the chunks of the uncompressed file, stale indexes are rebuilt.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import io
+import os
+import gzip
+import random
+import pytest
+
+from .. import gzip_split
+from ..gzip_split import GzipChunkReader, GzipIndex, IndexedGzipFile, is_bgzf, is_gzip, load_index, slice_size
+from ..gzip_writer import BGZF_BLOCK_SIZE, BGZF_EOF, bgzf_block
+from ..fastq_split import FastqSlicer
+
+def fastq_data(read_num:int = 20000, seed:int = 2) -> bytes:
+    rng = random.Random(seed)
+    records = []
+    for index in range(read_num):
+        size = rng.randint(30, 150)
+        sequence = ''.join(rng.choice('ACGT') for _ in range(size))
+        records.append('@read_%d\n%s\n+\n%s\n' % (index, sequence, ''.join(rng.choice('#+5?FI') for _ in range(size))))
+    return ''.join(records).encode()
+
+def write_bgzf(file:str, data:bytes) -> None:
+    with open(file, 'wb') as output_handle:
+        for begin in range(0, len(data), BGZF_BLOCK_SIZE):
+            output_handle.write(bgzf_block(data[begin:begin + BGZF_BLOCK_SIZE], 6))
+        output_handle.write(BGZF_EOF)
+
+@pytest.fixture(autouse = True)
+def clean_memo():
+    gzip_split.index_memo.clear()
+    yield
+    gzip_split.index_memo.clear()
+
+@pytest.fixture(scope = 'module')
+def data() -> bytes:
+    return fastq_data()
+
+def test_plain_gzip_random_access(tmp_path, data:bytes) -> None:
+    gzip_file = str(tmp_path / 'plain.fq.gz')
+    #two members, like files joined by cat
+    with open(gzip_file, 'wb') as output_handle:
+        output_handle.write(gzip.compress(data[:len(data) // 3]) + gzip.compress(data[len(data) // 3:]))
+    assert gzip.decompress(open(gzip_file, 'rb').read()) == data
+    assert is_gzip(gzip_file) and not is_bgzf(gzip_file)
+    #small span, so the reads start from many access points
+    index = GzipIndex.build(gzip_file, span = 65536)
+    assert index.size == len(data) and len(index.outs) > 10
+    rng = random.Random(7)
+    #IndexedGzipFile is a raw file, a read may return less, BufferedReader read until size
+    with io.BufferedReader(IndexedGzipFile(gzip_file, index)) as input_handle:
+        for _ in range(200):
+            begin = rng.randint(0, len(data))
+            size = rng.randint(0, 100000)
+            input_handle.seek(begin)
+            assert input_handle.read(size) == data[begin:begin + size]
+
+def test_bgzf_random_access(tmp_path, data:bytes) -> None:
+    bgzf_file = str(tmp_path / 'blocks.fq.gz')
+    write_bgzf(bgzf_file, data)
+    assert gzip.decompress(open(bgzf_file, 'rb').read()) == data
+    assert is_bgzf(bgzf_file)
+    index = load_index(bgzf_file)
+    assert index.size == len(data)
+    offsets = [0, 1, BGZF_BLOCK_SIZE - 1, BGZF_BLOCK_SIZE, len(data) - 1, len(data)]
+    assert index.uncompressed_offsets(index.virtual_offsets(offsets)).tolist() == offsets
+    rng = random.Random(8)
+    with io.BufferedReader(IndexedGzipFile(bgzf_file)) as input_handle:
+        for _ in range(200):
+            begin = rng.randint(0, len(data))
+            input_handle.seek(begin)
+            assert input_handle.read(5000) == data[begin:begin + 5000]
+
+@pytest.mark.parametrize('kind', ['plain', 'bgzf'])
+def test_slicer_chunks_are_same_as_uncompressed(tmp_path, data:bytes, kind:str) -> None:
+    plain_file, gzip_file = str(tmp_path / 'reads.fq'), str(tmp_path / 'reads.fq.gz')
+    open(plain_file, 'wb').write(data)
+    if kind == 'bgzf':
+        write_bgzf(gzip_file, data)
+    else:
+        open(gzip_file, 'wb').write(gzip.compress(data))
+    plain_pointers = FastqSlicer([plain_file], 100000).pointers
+    gzip_pointers = FastqSlicer([gzip_file], 100000).pointers
+    index = load_index(gzip_file)
+    #BGZF pointers are virtual offsets, plain gzip pointers are uncompressed offsets
+    assert index.uncompressed_offsets(gzip_pointers.begins).tolist() == plain_pointers.begins.tolist()
+    assert slice_size(gzip_file) == len(data)
+    reader = GzipChunkReader(gzip_file)
+    try:
+        assert [reader.read(i[1], i[2]) for i in gzip_pointers] == [data[i[1]:i[2]] for i in plain_pointers]
+    finally:
+        reader.close()
+
+@pytest.mark.parametrize('kind', ['plain', 'bgzf'])
+def test_stale_index_is_rebuilt(tmp_path, kind:str) -> None:
+    gzip_file = str(tmp_path / 'reads.fq.gz')
+    write = write_bgzf if kind == 'bgzf' else lambda file, data: open(file, 'wb').write(gzip.compress(data))
+    write(gzip_file, fastq_data(2000, 1))
+    assert load_index(gzip_file).size == len(fastq_data(2000, 1))
+    assert any(os.path.exists(i) for i in gzip_split.index_files(gzip_file, '.gzi' if kind == 'bgzf' else '.zran'))
+    #the file is replaced, the saved index and the memo are stale
+    new_data = fastq_data(3000, 3)
+    write(gzip_file, new_data)
+    os.utime(gzip_file, ns = (os.stat(gzip_file).st_atime_ns, os.stat(gzip_file).st_mtime_ns + 10 ** 9))
+    assert slice_size(gzip_file) == len(new_data)
+    reader = GzipChunkReader(gzip_file)
+    try:
+        assert reader.read(*reader.input_handle.index.virtual_offsets([0, len(new_data)]).tolist()) == new_data
+    finally:
+        reader.close()
+    assert [i for i in os.listdir(str(tmp_path)) if i.endswith('.tmp')] == []
+
+def test_index_memo_is_bounded(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(gzip_split, 'INDEX_MEMO_SIZE', 2)
+    files = []
+    for index in range(4):
+        files.append(str(tmp_path / ('%d.gz' % index)))
+        open(files[-1], 'wb').write(gzip.compress(b'line %d\n' % index))
+        load_index(files[-1])
+    assert len(gzip_split.index_memo) == 2
+    assert [i[0] for i in gzip_split.index_memo] == [os.path.abspath(i) for i in files[2:]]
+
+def test_truncated_gzip(tmp_path, data:bytes) -> None:
+    gzip_file = str(tmp_path / 'truncated.gz')
+    open(gzip_file, 'wb').write(gzip.compress(data)[:5000])
+    with pytest.raises(EOFError):
+        GzipIndex.build(gzip_file)
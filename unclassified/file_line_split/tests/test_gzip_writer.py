@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+'''
+    ParallelGzipWriter output is read back by stdlib gzip in both modes whatever the writes and threads are,
+    'gzip' mode is one member, 'bgzf' blocks are not gt 64KB, its .gzi is the same as a scan and the output is sliced again.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import gzip
+import zlib
+import random
+import pytest
+
+from .. import gzip_split
+from ..gzip_split import BgzfIndex, GzipChunkReader, is_bgzf, load_index
+from ..gzip_writer import BGZF_EOF, ParallelGzipWriter
+from ..fastq_split import FastqSlicer
+
+def fastq_data(read_num:int = 8000) -> bytes:
+    rng = random.Random(1)
+    records = []
+    for index in range(read_num):
+        size = rng.randint(30, 150)
+        records.append(b'@read_%d\n%s\n+\n%s\n' % (index, bytes(rng.choice(b'ACGT') for _ in range(size)), b'I' * size))
+    return b''.join(records)
+
+def write_pieces(writer:ParallelGzipWriter, data:bytes, seed:int = 0) -> None:
+    '''
+        Write data in pieces of random size, smaller and larger than a block
+    '''
+    rng, offset = random.Random(seed), 0
+    with writer:
+        while offset < len(data):
+            size = rng.choice([1, 100, 5000, 300000])
+            assert writer.write(memoryview(data)[offset:offset + size]) == len(data[offset:offset + size])
+            offset += size
+
+@pytest.fixture(autouse = True)
+def clean_memo():
+    gzip_split.index_memo.clear()
+    yield
+    gzip_split.index_memo.clear()
+
+@pytest.mark.parametrize('threads, level, block_size', [(1, 6, 0), (4, 1, 0), (3, 9, 1000), (2, 0, 40000)])
+def test_gzip_mode_is_one_member(tmp_path, threads:int, level:int, block_size:int) -> None:
+    data = fastq_data()
+    output_file = str(tmp_path / 'out.fq.gz')
+    write_pieces(ParallelGzipWriter(output_file, 'gzip', level, threads, block_size), data)
+    assert gzip.open(output_file).read() == data
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(open(output_file, 'rb').read()) == data
+    assert decompressor.eof and decompressor.unused_data == b''
+    if level == 6:
+        #the dictionary of every block keeps the ratio close to one gzip stream
+        assert os.path.getsize(output_file) < len(gzip.compress(data, 6)) * 1.05
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_bgzf_mode_is_sliced_again(tmp_path, monkeypatch, threads:int) -> None:
+    data = fastq_data()
+    output_file = str(tmp_path / 'out.fq.gz')
+    write_pieces(ParallelGzipWriter(output_file, 'bgzf', 6, threads, index = True), data, threads)
+    assert gzip.open(output_file).read() == data
+    assert is_bgzf(output_file) and open(output_file, 'rb').read().endswith(BGZF_EOF)
+    #the .gzi of the writer is used, it is the same as a scan of the blocks
+    scanned, build = BgzfIndex.build(output_file), BgzfIndex.build.__func__
+    def tail_build(cls, file:str, begin_offset:int = 0, begin_uoffset:int = 0) -> BgzfIndex:
+        #only the blocks after the last .gzi entry are scanned
+        assert begin_offset > 0, "the .gzi of the writer is not used"
+        return build(cls, file, begin_offset, begin_uoffset)
+    monkeypatch.setattr(BgzfIndex, 'build', classmethod(tail_build))
+    index = load_index(output_file)
+    assert index.coffsets.tolist() == scanned.coffsets.tolist() and index.uoffsets.tolist() == scanned.uoffsets.tolist()
+    monkeypatch.undo()
+    plain_file = str(tmp_path / 'out.fq')
+    open(plain_file, 'wb').write(data)
+    reader = GzipChunkReader(output_file)
+    try:
+        assert [reader.read(i[1], i[2]) for i in FastqSlicer([output_file], 50000).pointers] == [data[i[1]:i[2]] for i in FastqSlicer([plain_file], 50000).pointers]
+    finally:
+        reader.close()
+
+def test_incompressible_bgzf_blocks(tmp_path) -> None:
+    data = os.urandom(300000)
+    output_file = str(tmp_path / 'random.gz')
+    write_pieces(ParallelGzipWriter(output_file, 'bgzf', 9, 2), data)
+    assert gzip.open(output_file).read() == data
+    index = BgzfIndex.build(output_file)
+    assert (index.coffsets[1:] - index.coffsets[:-1]).max() <= 65536
+
+@pytest.mark.parametrize('mode', ['gzip', 'bgzf'])
+def test_empty_output(tmp_path, mode:str) -> None:
+    output_file = str(tmp_path / 'empty.gz')
+    ParallelGzipWriter(output_file, mode).close()
+    assert gzip.open(output_file).read() == b''
+
+def test_invalid_options(tmp_path) -> None:
+    output_file = str(tmp_path / 'out.gz')
+    for kwargs in [{'mode': 'zstd'}, {'level': 10}, {'threads': 0}, {'mode': 'bgzf', 'block_size': 65536}]:
+        with pytest.raises(ValueError):
+            ParallelGzipWriter(output_file, **kwargs)
+    writer = ParallelGzipWriter(output_file)
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b'closed')
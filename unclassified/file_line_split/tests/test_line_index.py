@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+'''
+    LineIndex: offsets of every line and the chunks of split_by_lines / split_by_records are the same as a naive split of the lines,
+    with one or many blocks, with or without the last line end, the saved index is reloaded and rebuilt if the file is changed.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import gzip
+import random
+import pytest
+
+from itertools import accumulate
+
+from ..line_index import LineIndex, load_line_index
+from ..gzip_split import GzipChunkReader
+
+def text_data(line_num:int = 3000, last_end:bool = True, seed:int = 4) -> bytes:
+    rng = random.Random(seed)
+    #empty lines too, so two newlines are next to each other
+    lines = ['%d\t%s' % (i, 'x' * rng.randint(0, 80)) if i % 13 else '' for i in range(line_num)]
+    return ('\n'.join(lines) + ('\n' if last_end else '')).encode()
+
+def line_starts(data:bytes) -> list:
+    '''
+        Start of every line and the end of file, a naive split of the lines
+    '''
+    lines = data.split(b'\n')
+    if data.endswith(b'\n'):
+        lines = lines[:-1]
+    return [0] + [min(i, len(data)) for i in accumulate(len(i) + 1 for i in lines)]
+
+@pytest.mark.parametrize('last_end', [True, False])
+@pytest.mark.parametrize('block_size, threads', [(67108864, 1), (4099, 1), (4099, 3)])
+def test_offsets_are_same_as_naive(tmp_path, last_end:bool, block_size:int, threads:int) -> None:
+    data = text_data(last_end = last_end)
+    input_file = tmp_path / 'input.txt'
+    input_file.write_bytes(data)
+    starts = line_starts(data)
+    index = LineIndex.build(str(input_file), step = 7, threads = threads, block_size = block_size)
+    assert index.line_count == len(starts) - 1
+    assert index.offsets_of_lines(list(range(index.line_count + 1))).tolist() == starts
+    #unsorted and repeated lines
+    lines = [2999, 0, 15, 15, 3000, 8]
+    assert index.offsets_of_lines(lines).tolist() == [starts[i] for i in lines]
+    with pytest.raises(IndexError):
+        index.offset_of_line(index.line_count + 1)
+
+@pytest.mark.parametrize('line_num, first_line', [(1, 0), (400, 0), (400, 1), (5000, 0)])
+def test_split_by_lines_is_same_as_naive(tmp_path, line_num:int, first_line:int) -> None:
+    data = text_data(last_end = False)
+    input_file = tmp_path / 'input.txt'
+    input_file.write_bytes(data)
+    starts = line_starts(data)
+    bounds = starts[first_line:-1:line_num] + [len(data)]
+    pointers = LineIndex.build(str(input_file), step = 64).split_by_lines(line_num, first_line)
+    assert [i[1:] for i in pointers] == list(zip(bounds[:-1], bounds[1:]))
+    with pytest.raises(ValueError):
+        LineIndex.build(str(input_file)).split_by_lines(0)
+
+def test_split_by_records(tmp_path) -> None:
+    records = [b'@read_%d\n%s\n+\n%s\n' % (i, b'A' * (i % 50 + 1), b'I' * (i % 50 + 1)) for i in range(1001)]
+    fastq_file = tmp_path / 'reads.fq'
+    fastq_file.write_bytes(b''.join(records))
+    pointers = LineIndex.build(str(fastq_file), step = 10).split_by_records(100)
+    data = fastq_file.read_bytes()
+    assert [data[i[1]:i[2]] for i in pointers] == [b''.join(records[i:i + 100]) for i in range(0, 1001, 100)]
+    #a torn record at the end
+    fastq_file.write_bytes(data + b'@read_torn\nA\n')
+    with pytest.raises(ValueError):
+        LineIndex.build(str(fastq_file)).split_by_records(100)
+
+def test_gzip_lines(tmp_path) -> None:
+    data = text_data()
+    gzip_file = str(tmp_path / 'input.txt.gz')
+    open(gzip_file, 'wb').write(gzip.compress(data))
+    starts = line_starts(data)
+    pointers = load_line_index(gzip_file, step = 100, threads = 1).split_by_lines(500)
+    reader = GzipChunkReader(gzip_file)
+    try:
+        assert [reader.read(i[1], i[2]) for i in pointers] == [data[starts[i]:starts[min(i + 500, len(starts) - 1)]] for i in range(0, 3000, 500)]
+    finally:
+        reader.close()
+
+def test_saved_index_is_reloaded_and_rebuilt(tmp_path, monkeypatch) -> None:
+    input_file = tmp_path / 'input.txt'
+    input_file.write_bytes(text_data())
+    first = load_line_index(str(input_file), step = 50, threads = 1)
+    assert os.path.exists(str(input_file) + LineIndex.suffix)
+    monkeypatch.setattr(LineIndex, 'build', classmethod(lambda cls, *args, **kwargs: pytest.fail("the saved index is not used")))
+    second = load_line_index(str(input_file), step = 50, threads = 1)
+    assert second.offsets.tolist() == first.offsets.tolist() and second.line_count == first.line_count
+    #the file is changed, the saved index is stale
+    monkeypatch.undo()
+    data = text_data(100, seed = 5)
+    input_file.write_bytes(data)
+    third = load_line_index(str(input_file), step = 50, threads = 1)
+    assert third.line_count == 100
+    assert third.offsets_of_lines(list(range(101))).tolist() == line_starts(data)
+    with pytest.raises(FileNotFoundError):
+        load_line_index(str(tmp_path / 'missing.txt'))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+'''
+    ChunkManifest: claims of jobs, processes and threads never overlap, a resubmitted job resume the chunks which are not done,
+    a torn journal line is ignored, renew and done of a chunk claimed by an other owner are refused, lost outputs are redone.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import time
+import pytest
+import threading
+import multiprocessing as mp
+
+from ..manifest import ChunkManifest, file_checksum
+
+POINTERS = [('/data/%d.txt' % (i % 3), i * 100, i * 100 + 100) for i in range(40)]
+
+def claim_all(file:str, owner:str) -> list:
+    '''
+        A job: claim and finish chunks until none is pending
+    '''
+    manifest = ChunkManifest(file, owner = owner)
+    done_result = []
+    for index, _, _, _ in manifest.claims(3):
+        manifest.done(index)
+        done_result.append(index)
+    manifest.close()
+    return done_result
+
+def test_claims_of_a_job(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    manifest = ChunkManifest(file, POINTERS, owner = 'job_1')
+    assert len(manifest) == 40 and manifest.status() == {'pending': 40, 'running': 0, 'done': 0}
+    claimed = []
+    for index, every_file, begin_pointer, end_pointer in manifest.claims():
+        assert (every_file, begin_pointer, end_pointer) == POINTERS[index]
+        output = tmp_path / ('chunk_%d.txt' % index)
+        output.write_text('chunk %d\n' % index)
+        manifest.done(index, str(output))
+        claimed.append(index)
+    assert claimed == list(range(40))
+    assert manifest.status()['done'] == 40 and manifest.resume() == []
+    assert manifest.outputs() == [str(tmp_path / ('chunk_%d.txt' % i)) for i in range(40)]
+    assert manifest.state[0]['checksum'] == file_checksum(str(tmp_path / 'chunk_0.txt'))
+    manifest.close()
+    #the journal is opened without source
+    assert ChunkManifest(file).resume(verify = True) == []
+    with pytest.raises(ValueError):
+        ChunkManifest(file, POINTERS[:-1])
+    with pytest.raises(FileNotFoundError):
+        ChunkManifest(str(tmp_path / 'missing.manifest'))
+
+def test_resume_after_the_job_is_killed(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    killed = ChunkManifest(file, POINTERS, lease = 0.2, owner = 'killed')
+    claimed = killed.claim(5)
+    for index, _, _, _ in claimed[:3]:
+        killed.done(index)
+    resumed = ChunkManifest(file, POINTERS, owner = 'resumed')
+    #chunks 3 and 4 are running until the lease of the killed job is expired
+    assert resumed.resume() == list(range(3, 40)) and resumed.status()['running'] == 2
+    assert [i[0] for i in resumed.claim(40)] == list(range(5, 40))
+    time.sleep(0.3)
+    assert [i[0] for i in resumed.claim(40)] == [3, 4]
+    #the killed job wakes up, its chunks belong to the resumed job now
+    with pytest.raises(PermissionError, match = 'resumed'):
+        killed.done(3)
+    with pytest.raises(PermissionError):
+        killed.renew(4)
+    resumed.renew(4)
+    resumed.fail(4, 'retry')
+    assert resumed.resume() == list(range(3, 40)) and resumed.status_of(4) == 'pending'
+    #a chunk which is given back is not done without a new claim
+    with pytest.raises(PermissionError, match = 'pending'):
+        resumed.done(4)
+
+def test_torn_journal_line(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    manifest = ChunkManifest(file, POINTERS, owner = 'job_1')
+    manifest.claim(2)
+    manifest.done(0)
+    manifest.close()
+    #the writer is killed in the middle of a line
+    with open(file, 'ab') as output_handle:
+        output_handle.write(b'{"op":"done","chunk":1,"out')
+    reopened = ChunkManifest(file, owner = 'job_1')
+    assert reopened.status() == {'pending': 38, 'running': 1, 'done': 1}
+    reopened.done(1)
+    reopened.close()
+    #the torn line is ended, the next line is not glued to it
+    lines = open(file, 'rb').read().split(b'\n')
+    assert lines[-3] == b'{"op":"done","chunk":1,"out' and lines[-1] == b''
+    assert ChunkManifest(file).status() == {'pending': 38, 'running': 0, 'done': 2}
+
+def test_lost_output_is_done_again(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    manifest = ChunkManifest(file, POINTERS[:3], owner = 'job_1')
+    for index, _, _, _ in manifest.claims():
+        output = tmp_path / ('chunk_%d.txt' % index)
+        output.write_text('chunk %d\n' % index)
+        manifest.done(index, str(output))
+    os.remove(str(tmp_path / 'chunk_1.txt'))
+    (tmp_path / 'chunk_2.txt').write_text('changed\n')
+    assert manifest.resume() == [] and manifest.resume(verify = True) == [1, 2]
+    assert [i[0] for i in manifest.claims(verify = True)] == [1, 2]
+
+def test_threads_never_claim_the_same_chunk(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    manifest = ChunkManifest(file, POINTERS * 5, owner = 'job_1')
+    claimed, claimed_lock = [], threading.Lock()
+    def worker() -> None:
+        for index, _, _, _ in manifest.claims(2):
+            manifest.done(index)
+            with claimed_lock:
+                claimed.append(index)
+    threads = [threading.Thread(target = worker) for _ in range(8)]
+    for every_thread in threads:
+        every_thread.start()
+    for every_thread in threads:
+        every_thread.join()
+    assert sorted(claimed) == list(range(200))
+
+def test_processes_never_claim_the_same_chunk(tmp_path) -> None:
+    file = str(tmp_path / 'job.manifest')
+    ChunkManifest(file, POINTERS * 5).close()
+    with mp.Pool(processes = 4) as pool:
+        done_result = pool.starmap(claim_all, [(file, 'job_%d' % i) for i in range(4)])
+    assert sorted(sum(done_result, [])) == list(range(200))
+    assert ChunkManifest(file).status()['done'] == 200
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+'''
+    PointerTable is the same sequence as the old tuple list: iteration, index, slice, per file view, concat, pickle and npz round trip.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import pickle
+import random
+import pytest
+
+from ..pointer_table import PointerTable
+
+def tuple_list(pointer_num:int = 1000) -> list:
+    rng = random.Random(3)
+    paths = ['/data/%s.txt' % i for i in ('a', 'b', 'c', 'long_path_' * 20)]
+    return [(rng.choice(paths), i * 10, i * 10 + rng.randint(0, 9)) for i in range(pointer_num)]
+
+def test_iteration_and_index_are_same_as_tuple_list() -> None:
+    pointers = tuple_list()
+    table = PointerTable.from_list(pointers)
+    assert len(table) == len(pointers)
+    assert table.to_list() == pointers and table == pointers
+    assert [table[i] for i in (0, 17, -1)] == [pointers[i] for i in (0, 17, -1)]
+    assert table[100:200].to_list() == pointers[100:200]
+    assert table.files() == list(dict.fromkeys(i[0] for i in pointers))
+    assert (table.sizes() == [i[2] - i[1] for i in pointers]).all()
+
+def test_iteration_crosses_blocks(monkeypatch) -> None:
+    monkeypatch.setattr(PointerTable, 'iter_size', 7)
+    pointers = tuple_list(50)
+    assert list(PointerTable.from_list(pointers)) == pointers
+
+def test_file_view() -> None:
+    pointers = tuple_list()
+    table = PointerTable.from_list(pointers)
+    for every_path in table.files():
+        assert table.file(every_path).to_list() == [i for i in pointers if i[0] == every_path]
+    assert len(table.file('/not/in/table')) == 0
+    contiguous = PointerTable.from_ranges('/data/x', [0, 5, 9], [5, 9, 12])
+    #contiguous pointers of one file are a view, not a copy
+    assert contiguous.file('/data/x').begins.base is not None
+
+def test_concat_merges_paths() -> None:
+    pointers = tuple_list()
+    tables = [PointerTable.from_list(pointers[i:i + 300]) for i in range(0, len(pointers), 300)]
+    joined = PointerTable.concat(tables)
+    assert joined.to_list() == pointers
+    assert sorted(joined.paths) == sorted(set(i[0] for i in pointers))
+    assert len(PointerTable.concat([])) == 0
+
+def test_pickle_and_npz_round_trip(tmp_path) -> None:
+    table = PointerTable.from_list(tuple_list())
+    assert pickle.loads(pickle.dumps(table)) == table
+    table.save(str(tmp_path / 'pointers.npz'))
+    loaded = PointerTable.load(str(tmp_path / 'pointers.npz'))
+    assert loaded == table and loaded.paths == table.paths
+    #an empty table is saved too
+    PointerTable(['/data/a']).save(str(tmp_path / 'empty.npz'))
+    assert len(PointerTable.load(str(tmp_path / 'empty.npz'))) == 0
+
+def test_columns_are_must_be_same_length() -> None:
+    with pytest.raises(ValueError):
+        PointerTable(['/data/a'], [0, 0], [0], [1])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+'''
+    ChunkPrefetcher yields the same chunks as seek and read in both modes and every depth (plain and gzip files),
+    an early stop frees the reader thread, a missing file is raised to the consumer.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import gzip
+import random
+import pytest
+import threading
+
+from ..prefetch import ChunkPrefetcher
+from ..file_split import FileSlicer
+
+def text_files(tmp_path) -> list:
+    rng = random.Random(2)
+    files = []
+    for name in ['a.txt', 'b.txt']:
+        files.append(str(tmp_path / name))
+        open(files[-1], 'w').write(''.join('%d\t%s\n' % (i, 'x' * rng.randint(0, 200)) for i in range(2000)))
+    with gzip.open(str(tmp_path / 'c.txt.gz'), 'wb') as output_handle:
+        output_handle.write(open(files[0], 'rb').read())
+    return files + [str(tmp_path / 'c.txt.gz')]
+
+def expected_chunks(pointers) -> list:
+    result = []
+    for file, begin_pointer, end_pointer in pointers:
+        data = gzip.open(file).read() if file.endswith('.gz') else open(file, 'rb').read()
+        result.append((file, begin_pointer, end_pointer, data[begin_pointer:end_pointer]))
+    return result
+
+@pytest.mark.parametrize('mode', ['fadvise', 'pread'])
+@pytest.mark.parametrize('depth', [0, 1, 4])
+def test_chunks_are_same_as_seek_and_read(tmp_path, mode:str, depth:int) -> None:
+    slicer = FileSlicer(text_files(tmp_path), 5000)
+    prefetcher = ChunkPrefetcher(slicer, depth, mode)
+    assert list(prefetcher) == expected_chunks(slicer.pointers)
+    stats = prefetcher.stats.as_dict()
+    assert stats['chunks'] == len(slicer.pointers) and stats['bytes'] == int(slicer.pointers.sizes().sum())
+    assert prefetcher.handles == {}
+    #a tuple list is a source too, iterated again from the start
+    assert list(ChunkPrefetcher(slicer.pointers.to_list()[5:9], depth, mode)) == expected_chunks(slicer.pointers.to_list()[5:9])
+    assert list(ChunkPrefetcher([], depth, mode)) == []
+
+def test_early_stop_frees_reader_thread(tmp_path) -> None:
+    slicer = FileSlicer(text_files(tmp_path), 1000)
+    threads = threading.active_count()
+    chunks = iter(ChunkPrefetcher(slicer, 2, 'pread'))
+    assert next(chunks)[3] == expected_chunks(slicer.pointers[:1])[0][3]
+    chunks.close()
+    assert threading.active_count() == threads
+
+@pytest.mark.parametrize('mode', ['fadvise', 'pread'])
+def test_missing_file(tmp_path, mode:str) -> None:
+    with pytest.raises(FileNotFoundError):
+        list(ChunkPrefetcher([(str(tmp_path / 'missing.txt'), 0, 10)], 2, mode))
+    with pytest.raises(ValueError):
+        ChunkPrefetcher([], -1)
+    with pytest.raises(ValueError):
+        ChunkPrefetcher([], 1, 'mmap')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+'''
+    Scheduling of the multi-process slicers: largest_first and split_ranges orders and ranges,
+    sub-range tasks of task_size cut a file at the same line starts as a naive chain from every range start,
+    WorkerStats sum the tasks and bytes of every worker.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import random
+import pytest
+
+from itertools import accumulate
+
+from ..schedule import WorkerStats, largest_first, split_ranges
+from ..file_split import MultiFileSlicer
+
+def text_file(tmp_path, name:str, line_num:int, seed:int) -> str:
+    rng = random.Random(seed)
+    text_path = tmp_path / name
+    text_path.write_text('header\n' + ''.join('%d\t%s\n' % (i, 'x' * rng.randint(0, 300)) for i in range(line_num)))
+    return str(text_path)
+
+def test_largest_first() -> None:
+    assert largest_first([3, 10, 0, 10, 5]) == [1, 3, 4, 0, 2]
+    assert largest_first([]) == []
+
+@pytest.mark.parametrize('begin_pointer, total_size, task_size, chunk_size', [(0, 1000, 300, 100), (7, 1000, 250, 100), (0, 1000, 5000, 100), (0, 10, 3, 0)])
+def test_split_ranges_cover_the_file(begin_pointer:int, total_size:int, task_size:int, chunk_size:int) -> None:
+    ranges = split_ranges(begin_pointer, total_size, task_size, chunk_size)
+    assert ranges[0][0] == begin_pointer and ranges[-1][1] == total_size
+    assert all(i[1] == j[0] for i, j in zip(ranges[:-1], ranges[1:]))
+    #every range but the last is a multiple of chunk_size and not lt task_size
+    assert all((i[1] - i[0]) % max(chunk_size, 1) == 0 and i[1] - i[0] >= task_size for i in ranges[:-1])
+    assert split_ranges(1000, 1000, 300, 100) == []
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_sub_range_tasks(tmp_path, backend:str) -> None:
+    files = [text_file(tmp_path, 'big.tsv', 5000, 1), text_file(tmp_path, 'small.tsv', 20, 2)]
+    slicer = MultiFileSlicer(files, 3, 2000, header = [1, 1], backend = backend, task_size = 20000)
+    assert slicer.header == [['header'], ['header']]
+    data = open(files[0], 'rb').read()
+    starts = list(accumulate(len(i) + 1 for i in data.split(b'\n')[:-1]))
+    #seek and readline, the line start after offset (a line start at offset is skipped)
+    next_start = lambda offset: next((i for i in starts if i > offset), len(data))
+    #a naive chain of chunk_size from the line start after every range start, the first range starts after header
+    expected = []
+    for range_begin, range_end in split_ranges(starts[0], len(data), 20000, 2000):
+        pointer, end_pointer = range_begin if range_begin == starts[0] else next_start(range_begin), next_start(range_end)
+        while pointer < end_pointer:
+            expected.append((files[0], pointer, min(next_start(pointer + 2000), end_pointer)))
+            pointer = expected[-1][2]
+    assert [i for i in slicer.pointers if i[0] == files[0]] == expected
+    #the big file is many tasks, the small one is one task
+    stats = slicer.worker_stats.as_dict()
+    assert sum(i['tasks'] for i in stats.values()) == len(split_ranges(starts[0], len(data), 20000, 2000)) + 1
+    assert sum(i['bytes'] for i in stats.values()) == len(data) - starts[0] + len(open(files[1], 'rb').read())
+    assert all(0 <= i['utilization'] for i in stats.values())
+
+def test_worker_stats() -> None:
+    stats = WorkerStats()
+    stats.add(1, 10.0, 12.0, 100)
+    stats.add(1, 12.0, 13.0, 50)
+    stats.add(2, 10.0, 10.5, 7)
+    stats.begin_time, stats.end_time = 10.0, 14.0
+    result = stats.as_dict()
+    assert result[1] == {'tasks': 2, 'bytes': 150, 'busy': 3.0, 'utilization': 0.75}
+    assert result[2]['tasks'] == 1 and result[2]['utilization'] == 0.125
+    report = stats.report().split('\n')
+    assert report[0] == 'pid\ttasks\tbytes\tbusy\tutilization' and report[1] == '1\t2\t150\t3.000\t75.0%'
+    assert report[-1] == 'wall time: 4.000'
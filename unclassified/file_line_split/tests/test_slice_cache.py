@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+'''
+    SliceCache: a repeat run loads the pointers from disk, a changed file or other slicer options never use the old entry,
+    broken entries are ignored and the least recently used entries are evicted.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import os
+import time
+import pytest
+
+from ..file_split import FileSlicer, MultiFileSlicer
+from ..slice_cache import SliceCache
+from ..slice_engine import CsvBoundary, SliceEngine
+from ..pointer_table import PointerTable
+
+def text_file(tmp_path, name:str = 'input.csv', line_num:int = 2000) -> str:
+    text_path = tmp_path / name
+    text_path.write_text('id,value\n' + ''.join('%d,"v\n%d"\n' % (i, i) for i in range(line_num)))
+    return str(text_path)
+
+def no_seek(*args, **kwargs) -> None:
+    raise AssertionError("the file is sliced again, the cache is not used")
+
+def test_repeat_run_loads_pointers_and_header(tmp_path, monkeypatch) -> None:
+    input_file, cache_dir = text_file(tmp_path), str(tmp_path / 'cache')
+    first = MultiFileSlicer([input_file], 2, 1000, header = [1], cache_dir = cache_dir, backend = 'serial')
+    monkeypatch.setattr(SliceEngine, 'seek_file', no_seek)
+    second = MultiFileSlicer([input_file], 2, 1000, header = [1], cache_dir = cache_dir, backend = 'serial')
+    assert second.pointers.to_list() == first.pointers.to_list()
+    assert second.header == first.header == [['id,value']]
+
+def test_stale_entry_is_removed(tmp_path) -> None:
+    input_file, cache_dir = text_file(tmp_path), str(tmp_path / 'cache')
+    first = FileSlicer([input_file], 1000, cache_dir = cache_dir)
+    entries = os.listdir(cache_dir)
+    assert len(entries) == 1
+    with open(input_file, 'a') as output_handle:
+        output_handle.write('9999,"new"\n')
+    second = FileSlicer([input_file], 1000, cache_dir = cache_dir)
+    assert second.pointers.to_list()[-1][2] == os.path.getsize(input_file) != first.pointers.to_list()[-1][2]
+    #the stale entry is replaced by the new one
+    cache = SliceCache(cache_dir)
+    options = second.engine.cache_options(1000, 0, 0)
+    assert cache.load(input_file, options)[0].to_list() == second.pointers.to_list()
+
+def test_options_and_boundary_are_in_the_key(tmp_path) -> None:
+    input_file, cache_dir = text_file(tmp_path), str(tmp_path / 'cache')
+    newline = FileSlicer([input_file], 1000, cache_dir = cache_dir).pointers.to_list()
+    csv = FileSlicer([input_file], 1000, cache_dir = cache_dir, boundary = CsvBoundary()).pointers.to_list()
+    other_size = FileSlicer([input_file], 3000, cache_dir = cache_dir).pointers.to_list()
+    assert newline != csv and newline != other_size
+    #a quoted line end is never a chunk end of CsvBoundary
+    data = open(input_file, 'rb').read()
+    assert all(data[:i[2]].count(b'"') % 2 == 0 for i in csv)
+    assert len(os.listdir(cache_dir)) == 3
+
+def test_broken_entry_is_ignored(tmp_path) -> None:
+    input_file, cache_dir = text_file(tmp_path), str(tmp_path / 'cache')
+    expected = FileSlicer([input_file], 1000, cache_dir = cache_dir).pointers.to_list()
+    entry_file = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    with open(entry_file, 'r+b') as output_handle:
+        output_handle.truncate(10)
+    assert FileSlicer([input_file], 1000, cache_dir = cache_dir).pointers.to_list() == expected
+
+def test_least_recently_used_entries_are_evicted(tmp_path) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    files = [text_file(tmp_path, '%d.csv' % i, 100) for i in range(3)]
+    pointers = PointerTable.from_list([(files[0], 0, 10)])
+    cache = SliceCache(cache_dir)
+    cache.save(files[0], {'chunk_size': 1}, pointers, [])
+    entry_size = os.path.getsize(cache.entry(files[0], {'chunk_size': 1}))
+    cache = SliceCache(cache_dir, entry_size * 2)
+    cache.save(files[1], {'chunk_size': 1}, pointers, [])
+    time.sleep(0.01)
+    #files[0] is used again, so files[1] is the least recently used one
+    assert cache.load(files[0], {'chunk_size': 1}) is not None
+    time.sleep(0.01)
+    cache.save(files[2], {'chunk_size': 1}, pointers, [])
+    assert [os.path.exists(cache.entry(i, {'chunk_size': 1})) for i in files] == [True, False, True]
+
+def test_invalid_max_size(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        SliceCache(str(tmp_path), 0)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+'''
+    Header lines are read by SliceEngine in both split modes, also when the boundary slices the file in its own pass (scan_file).
+    Every backend gives the same pointers, CsvBoundary never cuts inside quotes and LengthPrefixedBoundary cuts at record starts.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/file_line_split/tests
+'''
+
+import random
+import pytest
+
+from ..fasta_split import FastaBoundary
+from ..slice_engine import Boundary, CsvBoundary, LengthPrefixedBoundary, NewlineBoundary, SliceEngine
+
+def fasta_with_header(tmp_path) -> str:
+    lines = ['#source test', '#date today']
+    for index in range(40):
+        lines += ['>seq_%d' % index, 'ACGT' * (index + 1), 'AC']
+    fasta_file = tmp_path / 'header.fa'
+    fasta_file.write_text('\n'.join(lines) + '\n')
+    return str(fasta_file)
+
+def joined(pointers) -> tuple:
+    '''
+        (first begin, last end) of contiguous pointers
+    '''
+    pointers = list(pointers)
+    for (_, _, end), (_, next_begin, _) in zip(pointers, pointers[1:]):
+        assert end == next_begin
+    return pointers[0][1], pointers[-1][2]
+
+@pytest.mark.parametrize('boundary, split_mode', [(NewlineBoundary(), 'file'), (NewlineBoundary(), 'offset'),
+    (FastaBoundary(), 'file'), (FastaBoundary(), 'offset'), (FastaBoundary(fai = True), 'file')])
+def test_header_is_read_in_every_split_mode(tmp_path, boundary:Boundary, split_mode:str) -> None:
+    fasta_file = fasta_with_header(tmp_path)
+    header_size = len('#source test\n#date today\n')
+    pointers, header = SliceEngine(boundary, 'serial', 1, split_mode).slice([fasta_file], 200, header = [2])
+    assert header == [['#source test', '#date today']]
+    assert joined(pointers) == (header_size, len(open(fasta_file, 'rb').read()))
+
+def test_scan_file_chunks_start_at_records_after_header(tmp_path) -> None:
+    fasta_file = fasta_with_header(tmp_path)
+    data = open(fasta_file, 'rb').read()
+    for _ in range(2):
+        #the second run uses the .fai written by the first one
+        pointers, _ = SliceEngine(FastaBoundary(fai = True), 'serial', 1).slice([fasta_file], 200, header = [2])
+        assert all(data[i[1]:i[1] + 1] == b'>' for i in pointers)
+
+def test_boundary_without_find_names_the_class() -> None:
+    class EmptyBoundary(Boundary):
+        pass
+    with pytest.raises(NotImplementedError, match = 'EmptyBoundary'):
+        EmptyBoundary().find(None, 0, 0)
+
+def csv_file(tmp_path) -> str:
+    rng = random.Random(5)
+    rows = []
+    for index in range(2000):
+        #quoted fields with line ends and doubled quotes
+        note = rng.choice(['plain', '"a\nb"', '"say ""hi""\n"', '"""\n"""', '""'])
+        rows.append('%d,%s,%s\n' % (index, note, 'x' * rng.randint(0, 50)))
+    csv_path = tmp_path / 'input.csv'
+    csv_path.write_text(''.join(rows))
+    return str(csv_path)
+
+def records_file(tmp_path, prefix_size:int, byteorder:str, inclusive:bool) -> tuple:
+    rng = random.Random(prefix_size)
+    records = []
+    for index in range(1500):
+        payload = bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 200)))
+        size = len(payload) + (prefix_size if inclusive else 0)
+        records.append(size.to_bytes(prefix_size, byteorder) + payload)
+    record_path = tmp_path / 'records.bin'
+    record_path.write_bytes(b''.join(records))
+    return str(record_path), records
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_backends_are_same_as_serial(tmp_path, backend:str) -> None:
+    files = [fasta_with_header(tmp_path), csv_file(tmp_path)]
+    for boundary in [NewlineBoundary(), CsvBoundary(), FastaBoundary()]:
+        expected = SliceEngine(boundary, 'serial', 1).slice(files, 300, header = [2])
+        assert SliceEngine(boundary, backend, 3).slice(files, 300, header = [2]) == expected
+    #an iterator of files is sliced as they come
+    assert SliceEngine(NewlineBoundary(), backend, 3).slice(iter(files), 300)[0] == SliceEngine(NewlineBoundary(), 'serial').slice(files, 300)[0]
+
+@pytest.mark.parametrize('chunk_size', [1, 500, 100000])
+def test_csv_boundary_cuts_outside_quotes(tmp_path, chunk_size:int) -> None:
+    csv_path = csv_file(tmp_path)
+    data = open(csv_path, 'rb').read()
+    pointers, _ = SliceEngine(CsvBoundary(block_size = 97), 'serial').slice([csv_path], chunk_size)
+    assert joined(pointers) == (0, len(data))
+    #every chunk is whole rows
+    assert all(data[:i[2]].count(b'"') % 2 == 0 and data[i[2] - 1:i[2]] == b'\n' for i in pointers)
+    assert all(data[i[1]:i[2]].split(b',', 1)[0].isdigit() for i in pointers)
+    with pytest.raises(ValueError):
+        SliceEngine(CsvBoundary(), 'serial', 1, 'offset')
+    with pytest.raises(ValueError):
+        CsvBoundary(b'""')
+
+@pytest.mark.parametrize('prefix_size, byteorder, inclusive', [(4, 'little', False), (2, 'big', True), (1, 'little', False)])
+def test_length_prefixed_boundary_cuts_at_records(tmp_path, prefix_size:int, byteorder:str, inclusive:bool) -> None:
+    record_path, records = records_file(tmp_path, prefix_size, byteorder, inclusive)
+    boundary = LengthPrefixedBoundary(prefix_size, byteorder, inclusive, block_size = 64)
+    pointers, _ = SliceEngine(boundary, 'thread', 2).slice([record_path], 1000)
+    starts = set([0])
+    for every_record in records:
+        starts.add(max(starts) + len(every_record))
+    assert joined(pointers) == (0, max(starts))
+    assert all(i[1] in starts for i in pointers)
+    assert all(i[2] - i[1] >= 1000 for i in list(pointers)[:-1])
+
+def test_invalid_engine_options(tmp_path) -> None:
+    with pytest.raises(TypeError):
+        SliceEngine(object())
+    with pytest.raises(ValueError):
+        SliceEngine(NewlineBoundary(), 'gpu')
+    with pytest.raises(ValueError):
+        SliceEngine(NewlineBoundary(), 'serial', 1, 'line')
+    with pytest.raises(ValueError):
+        LengthPrefixedBoundary(0)
+    #length of an inclusive record is lt its prefix
+    record_path = tmp_path / 'broken.bin'
+    record_path.write_bytes((1).to_bytes(4, 'little') + b'x' * 100)
+    with pytest.raises(ValueError):
+        SliceEngine(LengthPrefixedBoundary(inclusive = True), 'serial').slice([str(record_path)], 10)
+    with pytest.raises(FileNotFoundError):
+        SliceEngine(NewlineBoundary(), 'serial').slice([str(tmp_path / 'missing.txt')])
@@ -1,7 +1,7 @@
 #!/usr/bin/env perl
 
 package read_complex_fasta;
-require Exorter;
+require Exporter;
 
 use strict;
 use warnings;
@@ -1,7 +1,7 @@
 #!/usr/bin/env perl
 
 package recursive_find_file;
-require Exorter;
+require Exporter;
 
 use strict;
 use warnings;
@@ -69,13 +69,14 @@ sub recursive_find_file {
                 #filter . ..
                 @cycle_read_file = grep { $_ !~ /^\./ } @cycle_read_file;
                 #abs_path
-                @cycle_read_file = map { abs_path($file_path.'/'.$_) } @cycle_read_file;
+                @cycle_read_file = map { abs_path($now_cycle_folder.'/'.$_) } @cycle_read_file;
                 #split file type
                 my @cycle_file = grep { -f $_ } @cycle_read_file;
                 my @cycle_folder = grep { -d $_ } @cycle_read_file;
                 if (scalar @cycle_folder == 0){
                     push @all_file,@cycle_file if scalar @cycle_file != 0;
-                    last;
+                    #a leaf folder, the sibling folders in @cycle_all_folder are still scanned
+                    next;
                 }else{
                     push @all_file,@cycle_file if scalar @cycle_file != 0;
                     push @cycle_all_folder,@cycle_folder;
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+'''
+    ASYNCIO UDP SOCKET SERVER (Host Verify and ARGV Record)
+        1. verify 请求在事件循环中直接应答，不访问数据库。
+        2. record 请求只做检查后放入有界队列，队列满时丢弃并计数，不阻塞接收。
+        3. writers 个写入协程各持有一个数据库长连接，批量（batch_size条或flush_interval秒）用executemany写入并提交一次，
+           同一次运行的begin和end记录进入同一个写入队列，保证按顺序写入。
+        4. stats 属性记录接收、丢弃、队列深度、批大小和写入延迟，stats_interval秒输出一次到日志。
+        5. allowlist 文件（JSON）修改后reload_interval秒内重新加载，SIGHUP立即重新加载，不需要重启。
+        多进程（SO_REUSEPORT）见 fleet.py。
+    Usage:
+        from udp_server.database import MysqlDatabase, SqliteDatabase
+        from udp_server.async_server import AsyncRecordServer
+        AsyncRecordServer(('0.0.0.0', 9999), MysqlDatabase('127.0.0.1', 3306, 'ipgs_record'), logger).run()
+        #SIGINT or SIGTERM stop receiving, the queued records are written before exit
+'''
+
+__all__ = ['AsyncRecordServer', 'ServerStats']
+
+import os
+import time
+import pickle
+import socket
+import signal
+import asyncio
+import logging
+
+from typing import Any, Dict, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from .server import info_handle
+from .database import Database
+
+class ServerStats:
+    '''
+        Counters of the async server, queue_depth is the records waiting in the queues now
+    '''
+    def __init__(self) -> None:
+        self.received = 0
+        self.verified = 0
+        self.records = 0
+        self.dropped = 0
+        self.errors = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.max_batch_size = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.last_flush_time = 0.0
+
+    def add_batch(self, size:int, flush_time:float, failed:bool = False) -> None:
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.flush_time += flush_time
+        self.max_flush_time = max(self.max_flush_time, flush_time)
+        self.last_flush_time = flush_time
+        if failed:
+            self.failed += size
+        else:
+            self.written += size
+
+    def as_dict(self) -> Dict[str, float]:
+        batches = max(self.batches, 1)
+        return {'received': self.received, 'verified': self.verified, 'records': self.records, 'dropped': self.dropped, 'errors': self.errors,
+            'queue_depth': self.queue_depth, 'max_queue_depth': self.max_queue_depth, 'batches': self.batches, 'written': self.written,
+            'failed': self.failed, 'mean_batch_size': (self.written + self.failed) / batches, 'max_batch_size': self.max_batch_size,
+            'mean_flush_time': self.flush_time / batches, 'max_flush_time': self.max_flush_time, 'last_flush_time': self.last_flush_time}
+
+    def report(self) -> str:
+        stats = self.as_dict()
+        return ('received: %d, verified: %d, records: %d, dropped: %d, errors: %d, queue depth: %d (max %d), batches: %d, written: %d, failed: %d, '
+            'batch size: %.1f (max %d), flush time: %.4fs (max %.4fs)') % (stats['received'], stats['verified'], stats['records'],
+            stats['dropped'], stats['errors'], stats['queue_depth'], stats['max_queue_depth'], stats['batches'], stats['written'],
+            stats['failed'], stats['mean_batch_size'], stats['max_batch_size'], stats['mean_flush_time'], stats['max_flush_time'])
+
+class RecordProtocol(asyncio.DatagramProtocol):
+    '''
+        Datagram handle of AsyncRecordServer, same messages as server.info_handle
+    '''
+    def __init__(self, server:'AsyncRecordServer') -> None:
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport:asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, bytes_content:bytes, address:Tuple[str, int]) -> None:
+        server = self.server
+        server.stats.received += 1
+        try:
+            #0 deserialize and check
+            content = pickle.loads(bytes_content)
+            if not isinstance(content, dict):
+                raise TypeError("Recv no suppect information, type: %s, content is %s" % (type(content), str(content)))
+            if content.get('version') != info_handle.version:
+                raise ValueError("Version of the server and the client is inconsistent! server version is %s, client version is %s" % (
+                    info_handle.version, content.get('version')))
+            #1 process request
+            if content.get('action') == 'verify':
+                failed = info_handle.check_host(content)
+                if failed != '':
+                    server.logger.info("Verify Failed, %s, content is %s" % (failed, str(content)))
+                self.transport.sendto(pickle.dumps(failed == ''), address)
+                server.stats.verified += 1
+            elif content.get('action') == 'record':
+                if server.put_record(info_handle.record_row(content)) and content.get('ack'):
+                    #the record is queued, a dropped record is not acked, the background client spool it
+                    self.transport.sendto(pickle.dumps({'ack': content.get('packet_id')}), address)
+            else:
+                raise ValueError("Unknown Action: '%s'" % content.get('action'))
+        except Exception as error:
+            #a bad datagram never stops the server
+            server.stats.errors += 1
+            server.logger.error("Request from %s failed: %s" % (str(address), repr(error)))
+
+    def error_received(self, error:Exception) -> None:
+        self.server.stats.errors += 1
+        self.server.logger.error("Socket error: %s" % repr(error))
+
+class AsyncRecordServer:
+    '''
+        address: (ip, port) of the server.
+        database: a database.Database object (MysqlDatabase, SqliteDatabase ...).
+        queue_size: max records waiting to be written (all queues), more records are dropped.
+        batch_size and flush_interval: a batch is written when it has batch_size records or flush_interval seconds after its first record.
+        writers: number of writer coroutines, every one has a persistent connection (the connection pool) and a queue.
+        rcvbuf: SO_RCVBUF of the socket, a large buffer takes the burst of datagrams at the start of a job array.
+        reuse_port: bind with SO_REUSEPORT, so the processes of a fleet (see fleet.py) share the port.
+        id_counter: a multiprocessing.Value shared by the processes of a fleet, ids of begin records are allocated from it,
+            the server allocate ids from max id of program_stat if it is None.
+        allowlist: JSON file of allow_hosts and allow_machine_id (see server.info_handle.load_allowlist), it is checked every reload_interval seconds.
+        stats_queue: a multiprocessing.Queue, stats.as_dict() is put to it when the server stops (see udp_bench.py).
+    '''
+    def __init__(self, address:Tuple[str, int], database:Database, logger:Union[logging.Logger, None] = None, queue_size:int = 100000,
+        batch_size:int = 500, flush_interval:float = 0.5, writers:int = 2, rcvbuf:int = 8388608, stats_interval:float = 60, reuse_port:bool = False,
+        id_counter:Any = None, allowlist:str = '', reload_interval:float = 2, stats_queue:Any = None) -> None:
+        if not isinstance(database, Database):
+            raise TypeError("database is Database, but now is %s" % type(database))
+        if queue_size < writers or writers < 1:
+            raise ValueError("writers is must be ge 1 and queue_size is must be ge writers, but now are %d and %d" % (writers, queue_size))
+        if batch_size < 1:
+            raise ValueError("batch_size is must be ge 1, but now is %d" % batch_size)
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError("reuse_port is not supported on this system")
+        if allowlist != '' and not os.path.exists(allowlist):
+            raise FileNotFoundError("%s is not found!" % allowlist)
+        self.address = address
+        self.database = database
+        self.logger = logger if logger is not None else logging.getLogger('udp_server')
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writers = writers
+        self.rcvbuf = rcvbuf
+        self.stats_interval = stats_interval
+        self.reuse_port = reuse_port
+        self.id_counter = id_counter
+        self.allowlist = allowlist
+        self.reload_interval = reload_interval
+        self.allowlist_mtime = None
+        self.stats_queue = stats_queue
+        self.stats = ServerStats()
+        self.rows = 0
+        self.queues = []
+        self.connections = [None for _ in range(writers)]
+        self.loop = None
+        self.stop_event = None
+        self.socket = None
+        self.executor = None
+
+    def put_record(self, row:Dict[str, Any]) -> bool:
+        '''
+            Put a record to the queue of its run, drop it if the queue is full, return True if it is queued
+        '''
+        #begin and end records of a run go to the same writer, so the end record is written after the begin record
+        run_key = row.get('run_id') or tuple(str(row.get(i)) for i in ['sdate', 'stime', 'host_ip', 'pname', 'user'])
+        work_queue = self.queues[hash(run_key) % self.writers]
+        if work_queue.full():
+            self.stats.dropped += 1
+            return False
+        if 'etime' not in row or row.get('run_id'):
+            #an end record with run_id is inserted if its begin record is lost, so it needs an id too
+            row = dict(row, id = self.next_id())
+        work_queue.put_nowait(row)
+        self.stats.records += 1
+        self.stats.queue_depth += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+        return True
+
+    def next_id(self) -> int:
+        if self.id_counter is None:
+            #id is given in the event loop, no other coroutine change it at the same time
+            self.rows += 1
+            return self.rows - 1
+        #the lock of the shared value is held for an increment only
+        with self.id_counter.get_lock():
+            self.id_counter.value += 1
+            return self.id_counter.value - 1
+
+    def reload_allowlist(self, force:bool = False) -> None:
+        '''
+            Load the allowlist file if it is changed, a bad file is logged and the old lists are kept
+        '''
+        if self.allowlist == '':
+            return None
+        try:
+            mtime = os.stat(self.allowlist).st_mtime_ns
+            if not force and mtime == self.allowlist_mtime:
+                return None
+            info_handle.load_allowlist(self.allowlist)
+            self.allowlist_mtime = mtime
+            self.logger.info("Allowlist loaded, %d hosts, %d machine ids." % (len(info_handle.allow_hosts), len(info_handle.allow_machine_id)))
+        except Exception as error:
+            self.allowlist_mtime = None
+            self.logger.error("Allowlist %s is not loaded, the old lists are used: %s" % (self.allowlist, repr(error)))
+
+    async def watch_allowlist(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload_allowlist()
+
+    async def writer(self, index:int) -> None:
+        '''
+            Collect a batch from the queue and write it, None in the queue stop the writer after the records before it
+        '''
+        work_queue = self.queues[index]
+        while True:
+            row = await work_queue.get()
+            if row is None:
+                break
+            batch, stop = [row], False
+            deadline = self.loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if work_queue.empty():
+                    timeout = deadline - self.loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(work_queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    row = work_queue.get_nowait()
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            self.stats.queue_depth -= len(batch)
+            await self.flush(index, batch)
+            if stop:
+                break
+
+    async def flush(self, index:int, batch:List[Dict[str, Any]]) -> None:
+        try:
+            flush_time = await self.loop.run_in_executor(self.executor, self.write, index, batch)
+            self.stats.add_batch(len(batch), flush_time)
+        except Exception as error:
+            self.stats.add_batch(len(batch), 0, failed = True)
+            self.logger.error("Record failed, %d records are lost: %s" % (len(batch), repr(error)))
+
+    def write(self, index:int, batch:List[Dict[str, Any]]) -> float:
+        '''
+            Write a batch by the connection of the writer in a thread, reconnect and retry once if it fails, return the time
+        '''
+        begin_time = time.time()
+        for retry in range(2):
+            try:
+                if self.connections[index] is None:
+                    self.connections[index] = self.database.connect()
+                self.database.write_batch(self.connections[index], batch)
+                return time.time() - begin_time
+            except Exception as error:
+                #the connection may be closed by the database (wait_timeout ...)
+                self.close_connection(index)
+                if retry == 1:
+                    raise error
+                self.logger.warning("Record failed, reconnect: %s" % repr(error))
+
+    def close_connection(self, index:int) -> None:
+        if self.connections[index] is not None:
+            try:
+                self.connections[index].close()
+            except Exception:
+                pass
+            self.connections[index] = None
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.reuse_port:
+            #the kernel spread datagrams to the sockets bound to the port by the hash of the client address
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except OSError:
+            #the kernel limit (net.core.rmem_max) is used
+            pass
+        sock.bind(self.address)
+        sock.setblocking(False)
+        return sock
+
+    async def report(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.logger.info("Server stats, %s" % self.stats.report())
+
+    async def serve(self) -> None:
+        '''
+            Serve until stop() is called, then write the queued records and return
+        '''
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.stats = ServerStats()
+        self.queues = [asyncio.Queue(maxsize = self.queue_size // self.writers) for _ in range(self.writers)]
+        self.executor = ThreadPoolExecutor(max_workers = self.writers)
+        try:
+            self.reload_allowlist(force = True)
+            if self.id_counter is None:
+                self.rows = await self.loop.run_in_executor(self.executor, self.database.next_id)
+            else:
+                self.rows = self.id_counter.value
+            self.socket = self.bind()
+            transport, _ = await self.loop.create_datagram_endpoint(lambda: RecordProtocol(self), sock = self.socket)
+            self.address = self.socket.getsockname()
+            self.logger.info("Server init.")
+            self.logger.info("Next id of program_stat is %d, listen on %s:%d." % (self.rows, self.address[0], self.address[1]))
+            writer_tasks = [asyncio.create_task(self.writer(i)) for i in range(self.writers)]
+            report_task = asyncio.create_task(self.report()) if self.stats_interval > 0 else None
+            watch_task = asyncio.create_task(self.watch_allowlist()) if self.allowlist != '' else None
+            await self.stop_event.wait()
+            #drain: no new datagram, write the queued records
+            transport.close()
+            for work_queue in self.queues:
+                await work_queue.put(None)
+            await asyncio.gather(*writer_tasks)
+            for every_task in (report_task, watch_task):
+                if every_task is not None:
+                    every_task.cancel()
+            self.logger.info("Server stop, %s" % self.stats.report())
+            if self.stats_queue is not None:
+                self.stats_queue.put(self.stats.as_dict())
+        finally:
+            await self.loop.run_in_executor(self.executor, lambda: [self.close_connection(i) for i in range(self.writers)])
+            self.executor.shutdown()
+
+    def stop(self) -> None:
+        '''
+            Stop the server, it can be called from other threads and signal handlers
+        '''
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    def run(self, stop_signals:Tuple[int, ...] = (signal.SIGINT, signal.SIGTERM)) -> None:
+        '''
+            Serve in this thread until one of stop_signals, SIGHUP reload the allowlist,
+            a signal which is not in stop_signals keeps its handler (fleet workers ignore SIGINT)
+        '''
+        async def main() -> None:
+            loop = asyncio.get_running_loop()
+            for every_signal in stop_signals:
+                loop.add_signal_handler(every_signal, self.stop)
+            loop.add_signal_handler(signal.SIGHUP, self.reload_allowlist, True)
+            await self.serve()
+        asyncio.run(main())
@@ -6,16 +6,26 @@ __all__ = ['udp_client']
     1. 发送验证信息
     2. 记录运行信息
         2.1. 记录开始和结束时间，开始时间先发送给服务器，程序结束时增加结束时间再发送给服务器。
+    3. background = True 模式（启动开销小于1毫秒，服务器停机时不丢失记录）：
+        3.1. 主机信息（user、host_ip、machine_id）缓存在 cache_dir 中（每个节点一个文件），cache_ttl 秒内不再调用psutil、id和读取machine-id，
+             psutil、subprocess和日志模块都在用到时才导入。
+        3.2. verify 通过的结果缓存 verify_ttl 秒，期间 verify 直接返回，不等待服务器。
+        3.3. record 只把记录放入队列，由后台线程发送并等待服务器确认（ack），未确认的记录追加到 cache_dir 中的 spool 文件，
+             以后的运行启动时在后台线程中重新发送；记录按 run_id upsert，重复发送不会产生重复的行。
+        3.4. 程序退出时最多等待 flush_timeout 秒发送队列中的记录，剩余的记录（包括正在重新发送的 spool 中未确认的记录）写入 spool 文件；
+             被杀死的运行留下的 .replay 文件由同一节点以后的运行写回 spool 文件。
 '''
 
 import os
 import sys
 import time
+import queue
+import fcntl
 import pickle
 import socket
-import psutil
+import atexit
 import logging
-import subprocess as sp
+import threading
 
 '''
     统一信息格式，使用dumps(dict)发送
@@ -27,30 +37,98 @@ class udp_client:
     __slot__ = ['server_ip', 'server_port', 'encoding', 'logger', 'sock', 'all_informations', 'version', 'timeout_second']
     version = 1.0
 
-    def __init__(self, server_ip:str, server_port:int, logger_name:str = '', encoding:str = 'utf8', timeout_second:int = 10) -> None:
+    def __init__(self, server_ip:str, server_port:int, logger_name:str = '', encoding:str = 'utf8', timeout_second:int = 10,
+        background:bool = False, cache_dir:str = '', cache_ttl:float = 86400, verify_ttl:float = 86400, ack_timeout:float = 0.5,
+        retries:int = 2, flush_timeout:float = 2) -> None:
         self.server_ip = server_ip
         self.server_port = server_port
         self.encoding = encoding
         self.timeout_second = timeout_second
-        if logger_name == '':
-            from ..colors_logging.colors_logging import colors_logging
-            self.logger = colors_logging().create_logger(name = 'client', level = 'INFO')
-        else:
-            self.logger = logging.getLogger(logger_name + '.client')
+        #the logger is created when it is used first
+        self.logger_name = logger_name
+        self.client_logger = None
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        #background mode
+        self.background = background
+        self.cache_dir = cache_dir if cache_dir != '' else os.path.join(os.path.expanduser('~'), '.cache', 'ipgs')
+        self.cache_ttl = cache_ttl
+        self.verify_ttl = verify_ttl
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.flush_timeout = flush_timeout
+        self.cache_file = os.path.join(self.cache_dir, 'client_%s.pkl' % os.uname().nodename)
+        self.spool_file = os.path.join(self.cache_dir, 'spool.pkl')
+        self.cache = {}
+        self.sender = None
+        self.send_queue = None
+        self.sending = None
+        self.server_down = False
+        #records of the replay file being sent, close() spools the rest if the sender does not finish in time
+        self.replay_lock = threading.Lock()
+        self.replay_file = ''
+        self.replay_records = []
+        self.replay_index = 0
         '''
             父进程名、脚本名
         '''
         self.all_informations = {}
         self.all_informations['version'] = self.version
-        self.all_informations['user'] = self.get_user()
-        self.all_informations['host_name'] = os.uname().nodename
-        self.all_informations['host_ip'] = self.get_ip()
-        self.all_informations['machine_id'] = self.get_machine_id()
+        #unique key of this run (random 128 bits like uuid4, without importing uuid), the server upsert the begin and end records by it
+        self.all_informations['run_id'] = os.urandom(16).hex()
+        self.all_informations.update(self.fingerprint())
         self.all_informations['argv'] = " ".join(sys.argv)
         self.all_informations['pname'] = os.path.basename(sys.argv[0])
         self.all_informations['pwd'] = os.getcwd()
         self.all_informations['sdate'], self.all_informations['stime'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()).split(" ")
+        #records spooled by the runs before are sent again in the background
+        if self.background and os.path.exists(self.spool_file) and os.path.getsize(self.spool_file) > 0:
+            self.start_sender()
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self.client_logger is None:
+            if self.logger_name == '':
+                from ..colors_logging.colors_logging import colors_logging
+                self.client_logger = colors_logging().create_logger(name = 'client', level = 'INFO')
+            else:
+                self.client_logger = logging.getLogger(self.logger_name + '.client')
+        return self.client_logger
+
+    def fingerprint(self) -> dict:
+        '''
+            user, host_name, host_ip and machine_id of this host, from the cache file in background mode
+        '''
+        if self.background:
+            self.cache = self.load_cache()
+            if self.cache.get('time', 0) + self.cache_ttl > time.time() and 'machine_id' in self.cache:
+                return {i: self.cache[i] for i in ('user', 'host_name', 'host_ip', 'machine_id')}
+        host_informations = {'user': self.get_user(), 'host_name': os.uname().nodename, 'host_ip': self.get_ip(), 'machine_id': self.get_machine_id()}
+        if self.background:
+            self.cache = dict(host_informations, time = time.time())
+            self.save_cache()
+        return host_informations
+
+    def load_cache(self) -> dict:
+        try:
+            with open(self.cache_file, mode = 'rb') as ihandle:
+                cache = pickle.load(ihandle)
+            return cache if isinstance(cache, dict) else {}
+        except Exception:
+            #no cache or a broken one, it is created again
+            return {}
+
+    def save_cache(self) -> None:
+        '''
+            Write the cache file by rename, a reader never see a half written file, a failure only costs the next start
+        '''
+        try:
+            os.makedirs(self.cache_dir, exist_ok = True)
+            temp_file = '%s.%d.tmp' % (self.cache_file, os.getpid())
+            with open(temp_file, mode = 'wb') as ohandle:
+                pickle.dump(self.cache, ohandle)
+            os.replace(temp_file, self.cache_file)
+        except OSError as error:
+            self.logger.warning("Cache file %s is not written: %s" % (self.cache_file, repr(error)))
 
     def record(self, opportunity:str = 'begin') -> None:
         '''
@@ -68,12 +146,213 @@ class udp_client:
         ## use record_dict not self.all_informations
         record_dict = {'action': 'record'}
         record_dict.update(self.all_informations)
-        self.sock.sendto(pickle.dumps(record_dict), (self.server_ip, self.server_port))
+        if not self.background:
+            self.sock.sendto(pickle.dumps(record_dict), (self.server_ip, self.server_port))
+            return None
+        #the server answer a record with ack and packet_id
+        record_dict['ack'] = True
+        record_dict['packet_id'] = os.urandom(16).hex()
+        self.start_sender()
+        self.send_queue.put(record_dict)
+
+    def start_sender(self) -> None:
+        if self.sender is not None:
+            return None
+        self.send_queue = queue.Queue()
+        self.sender = threading.Thread(target = self.send_loop, daemon = True)
+        self.sender.start()
+        atexit.register(self.close)
+
+    def send_loop(self) -> None:
+        '''
+            Background thread: send the spooled records of runs before, then the records of this run, records not acked are spooled
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.replay(sock)
+            while True:
+                record_dict = self.send_queue.get()
+                if record_dict is None:
+                    break
+                self.sending = record_dict
+                if not self.deliver(sock, record_dict):
+                    self.spool([record_dict])
+                self.sending = None
+        except Exception as error:
+            self.logger.warning("Record sender failed: %s" % repr(error))
+        finally:
+            sock.close()
+
+    def deliver(self, sock:socket.socket, record_dict:dict) -> bool:
+        '''
+            Send a record and wait for its ack, retry retries times, return False if it is not acked
+        '''
+        #the server did not answer a record before, every record is still sent once (no retry), so the sender does not wait
+        #retries * ack_timeout for every record while it is down, and the records after it comes back are delivered
+        for _ in range(1 if self.server_down else self.retries + 1):
+            sock.sendto(pickle.dumps(record_dict), (self.server_ip, self.server_port))
+            deadline = time.time() + self.ack_timeout
+            while time.time() < deadline:
+                sock.settimeout(max(deadline - time.time(), 0.001))
+                try:
+                    server_return = pickle.loads(sock.recv(1024))
+                except (socket.timeout, OSError):
+                    #ConnectionRefusedError of a closed port is an OSError
+                    break
+                except Exception:
+                    continue
+                if isinstance(server_return, dict) and server_return.get('ack') == record_dict['packet_id']:
+                    self.server_down = False
+                    return True
+        self.server_down = True
+        return False
+
+    def spool(self, records:list) -> bool:
+        '''
+            Append records to the spool file under flock, every record is one pickle, return False if it is not written
+        '''
+        if len(records) == 0:
+            return True
+        try:
+            os.makedirs(self.cache_dir, exist_ok = True)
+            while True:
+                with open(self.spool_file, mode = 'ab') as ohandle:
+                    fcntl.flock(ohandle, fcntl.LOCK_EX)
+                    #the file may be taken by replay while waiting for the lock, open the new one
+                    if not os.path.exists(self.spool_file) or not os.path.samestat(os.fstat(ohandle.fileno()), os.stat(self.spool_file)):
+                        continue
+                    for record_dict in records:
+                        ohandle.write(pickle.dumps(record_dict))
+                    ohandle.flush()
+                    os.fsync(ohandle.fileno())
+                    break
+        except OSError as error:
+            self.logger.warning("%d records are lost, spool file %s is not written: %s" % (len(records), self.spool_file, repr(error)))
+            return False
+        return True
+
+    def read_records(self, file:str) -> list:
+        records = []
+        with open(file, mode = 'rb') as ihandle:
+            while True:
+                try:
+                    records.append(pickle.load(ihandle))
+                except EOFError:
+                    break
+                except Exception:
+                    #a record cut by a crash, the records before it are kept
+                    break
+        return records
+
+    def recover_replays(self) -> None:
+        '''
+            Spool again the replay files of this node left by runs which exited (killed, or the interpreter exited while replaying)
+        '''
+        prefix = '%s.%s.' % (os.path.basename(self.spool_file), os.uname().nodename)
+        try:
+            file_names = os.listdir(self.cache_dir)
+        except OSError:
+            return None
+        for file_name in file_names:
+            if not file_name.startswith(prefix) or not file_name.endswith('.replay'):
+                continue
+            try:
+                pid = int(file_name[len(prefix):-len('.replay')])
+                os.kill(pid, 0)
+                #the run is still replaying it
+                continue
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                pass
+            except OSError:
+                #PermissionError, the pid is used by a process of another user
+                continue
+            replay_file = os.path.join(self.cache_dir, file_name)
+            try:
+                with open(replay_file, mode = 'rb') as ihandle:
+                    #another run is recovering it
+                    fcntl.flock(ihandle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if not os.path.exists(replay_file) or not os.path.samestat(os.fstat(ihandle.fileno()), os.stat(replay_file)):
+                        continue
+                    if self.spool(self.read_records(replay_file)):
+                        os.remove(replay_file)
+            except OSError:
+                continue
+
+    def replay(self, sock:socket.socket) -> None:
+        '''
+            Take the spool file (rename, so two runs never send the same file) and send its records, records not acked are spooled again
+        '''
+        self.recover_replays()
+        if not os.path.exists(self.spool_file):
+            return None
+        replay_file = '%s.%s.%d.replay' % (self.spool_file, os.uname().nodename, os.getpid())
+        try:
+            with open(self.spool_file, mode = 'rb') as ihandle:
+                #wait for the writer which holds the lock
+                fcntl.flock(ihandle, fcntl.LOCK_EX)
+                os.rename(self.spool_file, replay_file)
+        except OSError:
+            #taken by another run
+            return None
+        with self.replay_lock:
+            self.replay_file, self.replay_records, self.replay_index = replay_file, self.read_records(replay_file), 0
+        while True:
+            with self.replay_lock:
+                if self.replay_index >= len(self.replay_records):
+                    break
+                record_dict = self.replay_records[self.replay_index]
+            if not self.deliver(sock, record_dict):
+                break
+            with self.replay_lock:
+                self.replay_index += 1
+        self.end_replay()
+
+    def end_replay(self) -> None:
+        '''
+            Spool the records of the replay which are not delivered and remove the replay file,
+            by the sender, or by close() if the sender does not finish in flush_timeout seconds
+        '''
+        with self.replay_lock:
+            if self.replay_file == '':
+                return None
+            #a record acked just now may be spooled too, it is upserted by run_id, so it is not a duplicate row
+            if self.spool(self.replay_records[self.replay_index:]):
+                os.remove(self.replay_file)
+            #if the spool is not written, the replay file is kept and recovered by a later run
+            self.replay_file, self.replay_records, self.replay_index = '', [], 0
+
+    def close(self) -> None:
+        '''
+            Wait up to flush_timeout seconds for the queued records, spool the records which are not sent
+        '''
+        if self.sender is None:
+            return None
+        self.send_queue.put(None)
+        self.sender.join(self.flush_timeout)
+        if self.sender.is_alive():
+            pending = [] if self.sending is None else [self.sending]
+            while True:
+                try:
+                    record_dict = self.send_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record_dict is not None:
+                    pending.append(record_dict)
+            #a record may be spooled and acked both, it is upserted by run_id, so it is not a duplicate row
+            self.spool(pending)
+            self.end_replay()
+        self.sender = None
+        atexit.unregister(self.close)
 
     def verify(self) -> None:
         '''
             Function for Host Verify
         '''
+        #a pass in verify_ttl seconds is used in background mode, the server is not asked
+        if self.background and self.cache.get('verify_time', 0) + self.verify_ttl > time.time():
+            return None
         bytes_str = pickle.dumps({'action': 'verify', 'host_ip': self.all_informations['host_ip'],
             'machine_id': self.all_informations['machine_id'], 'version': self.version})
         self.sock.sendto(bytes_str, (self.server_ip, self.server_port))
@@ -89,6 +368,9 @@ class udp_client:
             raise(exp_obj)
         if pickle.loads(server_return) == True:
             self.logger.info("Verify, pass.")
+            if self.background:
+                self.cache['verify_time'] = time.time()
+                self.save_cache()
         else:
             self.logger.error("Verify, fail.")
             raise SystemError("Host verify is fail, exit.")
@@ -97,6 +379,8 @@ class udp_client:
         '''
             Sub Function for Obtain Host IP Address
         '''
+        #psutil is slow to import, it is imported when the cache is not used
+        import psutil
         if_dict:dict = psutil.net_if_addrs()
         ip_list = []
         for every_network in if_dict:
@@ -119,6 +403,7 @@ class udp_client:
             if every_word in os.environ and len(os.environ[every_word]) > 0:
                 return os.environ[every_word]
         #1 from subprocess
+        import subprocess as sp
         sp_process = sp.run(['id', '-u', '-n'], stdout = sp.PIPE, stderr = sp.PIPE, timeout = 10)
         if sp_process.returncode != 0:
             raise sp.CalledProcessError(returncode = sp_process.returncode, cmd = 'id -u -n',
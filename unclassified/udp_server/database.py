@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+'''
+    DATABASE BACKENDS OF THE RECORD SERVER
+        1. MysqlDatabase 连接MySQL（生产环境），pymysql在第一次连接时才导入。
+        2. SqliteDatabase 使用SQLite文件或内存数据库代替MySQL，用于本地测试和压力测试。
+    每个写入协程持有一个长连接，write_batch把一批记录用executemany写入并提交一次。
+    run_id：客户端为每次运行生成唯一的run_id，begin和end记录按run_id（唯一索引）upsert，end记录的匹配与表的大小无关；
+    没有run_id的旧客户端仍按(sdate, stime, host_ip, pname, user)匹配，migrate()为这五列增加组合索引idx_legacy_match，匹配不扫描全表。
+    已有的表用migrate()增加run_id列、唯一索引和组合索引。
+'''
+
+__all__ = ['Database', 'MysqlDatabase', 'SqliteDatabase', 'RECORD_COLUMNS']
+
+import sqlite3
+import threading
+
+from typing import Any, Dict, List
+
+# COLUMNS OF program_stat
+RECORD_COLUMNS = ['id', 'run_id', 'version', 'user', 'host_name', 'host_ip', 'argv', 'pname', 'pwd', 'sdate', 'stime', 'edate', 'etime']
+# END RECORD WITHOUT run_id (OLD CLIENTS) MATCH THE BEGIN RECORD BY THESE COLUMNS
+MATCH_COLUMNS = ['sdate', 'stime', 'host_ip', 'pname', 'user']
+
+class Database:
+    '''
+        Base class of database backends, a backend implement connect()
+    '''
+    # PARAMETER STYLE OF DB-API MODULE
+    placeholder = '%s'
+    table = 'program_stat'
+    # id IS AUTO_INCREMENT, ids allocated by the server are not written, so the only unique key a record can conflict on is run_id
+    auto_id = False
+
+    def connect(self) -> Any:
+        raise NotImplementedError("%s does not implement connect()" % type(self).__name__)
+
+    def query(self, sql:str) -> list:
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql)
+            result = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        return result
+
+    def rows(self) -> int:
+        return self.query('SELECT count(*) FROM %s' % self.table)[0][0]
+
+    def next_id(self) -> int:
+        '''
+            Max id + 1, ids of a restarted server do not collide with the rows written before (count(*) does after rows are deleted)
+        '''
+        max_id = self.query('SELECT max(id) FROM %s' % self.table)[0][0]
+        return 0 if max_id is None else int(max_id) + 1
+
+    def columns(self) -> List[str]:
+        raise NotImplementedError("%s does not implement columns()" % type(self).__name__)
+
+    def migration_sql(self, columns:List[str]) -> List[str]:
+        raise NotImplementedError("%s does not implement migration_sql()" % type(self).__name__)
+
+    def migrate(self) -> List[str]:
+        '''
+            Add run_id column and its unique index to program_stat if they do not exist, return the statements executed.
+            Old rows have NULL run_id, NULL is not a duplicate of a unique index, so no data is changed.
+            A backend with auto_id (MySQL) also makes id AUTO_INCREMENT, the upsert expects it.
+        '''
+        statements = self.migration_sql(self.columns())
+        if len(statements) > 0:
+            connection = self.connect()
+            try:
+                cursor = connection.cursor()
+                for every_sql in statements:
+                    cursor.execute(every_sql)
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+        return statements
+
+    def record_columns(self, record:Dict[str, Any]) -> tuple:
+        '''
+            Columns of a record, they are identifiers of the SQL (only values are parameters), so a key not in RECORD_COLUMNS is rejected.
+            id is left out if auto_id.
+        '''
+        unknown = set(record).difference(RECORD_COLUMNS)
+        if len(unknown) > 0:
+            raise ValueError("Record has unknown columns of %s: %s" % (self.table, ','.join(sorted(map(str, unknown)))))
+        return tuple(i for i in record if not (self.auto_id and i == 'id'))
+
+    def insert_sql(self, columns:tuple) -> str:
+        return 'INSERT INTO %s (%s) VALUES (%s)' % (self.table, ','.join(columns), ','.join([self.placeholder] * len(columns)))
+
+    def update_sql(self) -> str:
+        where_strings = ' AND '.join(['%s=%s' % (i, self.placeholder) for i in MATCH_COLUMNS])
+        return 'UPDATE %s SET edate=%s,etime=%s WHERE %s' % (self.table, self.placeholder, self.placeholder, where_strings)
+
+    def upsert_sql(self, columns:tuple, end:bool) -> str:
+        '''
+            Insert a record, a record with the same run_id is kept (begin) or gets edate and etime (end).
+            An end record has all columns of its begin record, so it is inserted if the begin record is lost or late.
+        '''
+        raise NotImplementedError("%s does not implement upsert_sql()" % type(self).__name__)
+
+    def write_batch(self, connection:Any, records:List[Dict[str, Any]]) -> int:
+        '''
+            Upsert records with run_id, insert begin records and update end records without run_id (old clients),
+            in one transaction, return number of records.
+            Begin records are written first, so an end record in the same batch find its begin record.
+        '''
+        upserts, inserts, updates = {}, {}, []
+        for every_record in records:
+            columns = self.record_columns(every_record)
+            if every_record.get('run_id'):
+                upserts.setdefault((columns, 'etime' in every_record), []).append([every_record[i] for i in columns])
+            elif 'etime' in every_record:
+                updates.append([every_record['edate'], every_record['etime']] + [every_record[i] for i in MATCH_COLUMNS])
+            else:
+                #records of different clients may have different keys, one statement for every set of columns
+                inserts.setdefault(columns, []).append([every_record[i] for i in columns])
+        cursor = connection.cursor()
+        try:
+            for (columns, end), values in sorted(upserts.items(), key = lambda x:x[0][1]):
+                cursor.executemany(self.upsert_sql(columns, end), values)
+            for columns, values in inserts.items():
+                cursor.executemany(self.insert_sql(columns), values)
+            if len(updates) > 0:
+                cursor.executemany(self.update_sql(), updates)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        return len(records)
+
+class MysqlDatabase(Database):
+    '''
+        database = MysqlDatabase('127.0.0.1', 3306, 'ipgs_record')
+    '''
+    placeholder = '%s'
+    #ON DUPLICATE KEY UPDATE fires on any unique key, an id of two servers or of a reseeded counter must not hit another run's row
+    auto_id = True
+
+    def __init__(self, host:str, port:int, name:str, user:str = 'ipgs', password:str = '', charset:str = 'utf8') -> None:
+        self.host = host
+        self.port = port
+        self.name = name
+        self.user = user
+        self.password = password
+        self.charset = charset
+
+    def connect(self) -> Any:
+        #pymysql is only needed by the server connected to MySQL
+        import pymysql as pm
+        database_conf = {"host": self.host, "port": self.port, "user": self.user, "password": self.password, "charset": self.charset,
+            "cursorclass": pm.cursors.Cursor}
+        return pm.connect(**database_conf, db = self.name)
+
+    def upsert_sql(self, columns:tuple, end:bool) -> str:
+        #VALUES() in ON DUPLICATE KEY UPDATE is supported by MySQL 5.x, 8.x and MariaDB
+        update_strings = 'edate=VALUES(edate),etime=VALUES(etime)' if end else 'run_id=run_id'
+        return '%s ON DUPLICATE KEY UPDATE %s' % (self.insert_sql(columns), update_strings)
+
+    def columns(self) -> List[str]:
+        return [i[0] for i in self.query('SHOW COLUMNS FROM %s' % self.table)]
+
+    @staticmethod
+    def index_part(column:str, column_type:str, prefix:int = 64) -> str:
+        '''
+            Key part of a column in an index, text, blob and char columns longer than prefix are indexed by their first prefix chars
+        '''
+        if 'text' in column_type or 'blob' in column_type:
+            return '%s(%d)' % (column, prefix)
+        if 'char' in column_type and '(' in column_type and int(column_type.split('(')[1].split(')')[0]) > prefix:
+            return '%s(%d)' % (column, prefix)
+        return column
+
+    def migration_sql(self, columns:List[str]) -> List[str]:
+        statements = []
+        if 'run_id' not in columns:
+            statements.append('ALTER TABLE %s ADD COLUMN run_id CHAR(32) NULL DEFAULT NULL' % self.table)
+        if len(self.query("SHOW INDEX FROM %s WHERE Key_name = 'uniq_run_id'" % self.table)) == 0:
+            statements.append('ALTER TABLE %s ADD UNIQUE INDEX uniq_run_id (run_id)' % self.table)
+        #Field, Type, Null, Key, Default, Extra
+        #Type of MySQL 8 is a blob, pymysql returns bytes
+        column_types = {i[0]: i for i in [[j.decode() if isinstance(j, bytes) else j for j in k] for k in self.query('SHOW COLUMNS FROM %s' % self.table)]}
+        if len(self.query("SHOW INDEX FROM %s WHERE Key_name = 'idx_legacy_match'" % self.table)) == 0:
+            #end records of old clients are matched by MATCH_COLUMNS, TEXT columns (argv like) need a prefix length in an index,
+            #long VARCHAR columns get one too so the key stays under the length limit of InnoDB
+            statements.append('ALTER TABLE %s ADD INDEX idx_legacy_match (%s)' % (self.table,
+                ', '.join([self.index_part(i, column_types[i][1].lower()) for i in MATCH_COLUMNS])))
+        id_column = column_types['id']
+        if 'auto_increment' not in id_column[5].lower():
+            if id_column[3] == '':
+                #AUTO_INCREMENT column must be a key, it fails if old rows have duplicate ids
+                statements.append('ALTER TABLE %s ADD PRIMARY KEY (id)' % self.table)
+            #the next id is max(id) + 1
+            statements.append('ALTER TABLE %s MODIFY COLUMN id %s NOT NULL AUTO_INCREMENT' % (self.table, id_column[1]))
+        return statements
+
+class SqliteDatabase(Database):
+    '''
+        database = SqliteDatabase('record.db') #or SqliteDatabase(':memory:'), shared by all connections of the process
+        database.create_table()
+    '''
+    placeholder = '?'
+
+    def __init__(self, file:str = ':memory:', timeout:float = 30) -> None:
+        self.file = file
+        self.timeout = timeout
+        self.keeper = None
+        #SQLite has one writer, a shared cache memory database does not wait for the lock (SQLITE_LOCKED), so writers take turns
+        self.lock = threading.Lock()
+        if file == ':memory:':
+            #every connection to ':memory:' is a new database, a named shared cache is one database for all connections,
+            #it lives while one connection is open, so keep one
+            self.file = 'file:udp_record_%d?mode=memory&cache=shared' % id(self)
+            self.keeper = self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        #connections are used by the writer threads of the server
+        return sqlite3.connect(self.file, timeout = self.timeout, check_same_thread = False, uri = self.file.startswith('file:'))
+
+    def write_batch(self, connection:sqlite3.Connection, records:List[Dict[str, Any]]) -> int:
+        with self.lock:
+            return super().write_batch(connection, records)
+
+    def upsert_sql(self, columns:tuple, end:bool) -> str:
+        #ON CONFLICT needs SQLite 3.24
+        update_strings = 'DO UPDATE SET edate=excluded.edate,etime=excluded.etime' if end else 'DO NOTHING'
+        return '%s ON CONFLICT(run_id) %s' % (self.insert_sql(columns), update_strings)
+
+    def columns(self) -> List[str]:
+        return [i[1] for i in self.query('PRAGMA table_info(%s)' % self.table)]
+
+    def migration_sql(self, columns:List[str]) -> List[str]:
+        statements = []
+        if 'run_id' not in columns:
+            statements.append('ALTER TABLE %s ADD COLUMN run_id TEXT' % self.table)
+        if 'uniq_run_id' not in [i[1] for i in self.query('PRAGMA index_list(%s)' % self.table)]:
+            statements.append('CREATE UNIQUE INDEX uniq_run_id ON %s (run_id)' % self.table)
+        if 'idx_legacy_match' not in [i[1] for i in self.query('PRAGMA index_list(%s)' % self.table)]:
+            #end records of old clients are matched by MATCH_COLUMNS
+            statements.append('CREATE INDEX idx_legacy_match ON %s (%s)' % (self.table, ', '.join(MATCH_COLUMNS)))
+        return statements
+
+    def create_table(self) -> None:
+        '''
+            Create program_stat if it does not exist, same columns as the MySQL table, with the index of run_id
+        '''
+        connection = self.connect()
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (self.table,
+                ','.join(['id INTEGER'] + ['%s TEXT' % i for i in RECORD_COLUMNS[1:]])))
+            connection.commit()
+        finally:
+            connection.close()
+        self.migrate()
+
+    def __getstate__(self) -> dict:
+        #the connection which keeps a memory database and the lock are not passed to a child process
+        return dict(self.__dict__, keeper = None, lock = None)
+
+    def __setstate__(self, state:dict) -> None:
+        self.__dict__.update(state, lock = threading.Lock())
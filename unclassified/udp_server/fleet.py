@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+'''
+    MULTI-PROCESS UDP SERVER FLEET (SO_REUSEPORT)
+        1. workers 个进程各运行一个 AsyncRecordServer，用SO_REUSEPORT绑定同一端口，内核按客户端地址的哈希把数据报分给各进程，
+           verify 和 record 的处理分布到多个核，verify 延迟不随客户端数量增加。
+        2. 记录的 id 从共享的 multiprocessing.Value 分配（加锁自增，从 max(id) + 1 开始），多个进程的 id 不会重复。
+        3. SIGTERM/SIGINT 转发给所有进程，每个进程停止接收并写完队列中的记录后退出（drain），超过 drain_timeout 秒的进程被杀死。
+        4. allowlist 文件修改后各进程自动重新加载，SIGHUP 转发给所有进程立即重新加载；意外退出的进程自动重启。
+    数据库：每个进程有自己的写入连接，SqliteDatabase 需要使用文件（内存数据库不能跨进程共享）。
+    Usage:
+        from udp_server.database import MysqlDatabase
+        from udp_server.fleet import ServerFleet
+        ServerFleet(('0.0.0.0', 9999), MysqlDatabase('127.0.0.1', 3306, 'ipgs_record'), workers = 8, logger = logger,
+            allowlist = '/etc/ipgs/allowlist.json').run()
+'''
+
+__all__ = ['ServerFleet']
+
+import os
+import time
+import signal
+import socket
+import logging
+import multiprocessing as mp
+
+from typing import Tuple, Union
+from .database import Database
+from .async_server import AsyncRecordServer
+
+def run_worker(address:Tuple[str, int], database:Database, logger:logging.Logger, id_counter:mp.Value, options:dict) -> None:
+    '''
+        Run an AsyncRecordServer in a worker process until SIGTERM
+    '''
+    #the parent handles SIGINT by SIGTERM to the workers, so a Ctrl-C to the process group drains once,
+    #run() does not register SIGINT, so the ignore is kept
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    AsyncRecordServer(address, database, logger, reuse_port = True, id_counter = id_counter, **options).run(stop_signals = (signal.SIGTERM,))
+
+class ServerFleet:
+    '''
+        address: (ip, port), port 0 pick a free port before the workers start (the address attr).
+        workers: number of server processes, the number of CPUs by default.
+        drain_timeout: seconds a worker has to write its queued records after SIGTERM.
+        options: other parameters of AsyncRecordServer (batch_size, writers, allowlist ...).
+    '''
+    def __init__(self, address:Tuple[str, int], database:Database, workers:int = 0, logger:Union[logging.Logger, None] = None,
+        drain_timeout:float = 30, **options) -> None:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError("SO_REUSEPORT is not supported on this system, use AsyncRecordServer")
+        if not isinstance(database, Database):
+            raise TypeError("database is Database, but now is %s" % type(database))
+        self.address = address
+        self.database = database
+        self.workers = workers if workers > 0 else os.cpu_count()
+        self.logger = logger if logger is not None else logging.getLogger('udp_server')
+        self.drain_timeout = drain_timeout
+        self.options = options
+        self.processes = []
+        self.id_counter = None
+        self.stopping = False
+
+    def free_port(self) -> Tuple[str, int]:
+        #the probe socket is closed before the workers bind, it never takes datagrams of the workers
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(self.address)
+            return sock.getsockname()
+
+    def start_worker(self) -> mp.Process:
+        process = mp.Process(target = run_worker, args = (self.address, self.database, self.logger, self.id_counter, self.options))
+        process.start()
+        return process
+
+    def start(self) -> None:
+        '''
+            Seed the shared id counter from max id of program_stat and start the workers
+        '''
+        if self.address[1] == 0:
+            self.address = self.free_port()
+        self.id_counter = mp.Value('q', self.database.next_id())
+        self.stopping = False
+        self.processes = [self.start_worker() for _ in range(self.workers)]
+        self.logger.info("Fleet start, %d workers listen on %s:%d, next id is %d." % (self.workers, self.address[0], self.address[1],
+            self.id_counter.value))
+
+    def signal_workers(self, signal_number:int) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                try:
+                    os.kill(process.pid, signal_number)
+                except ProcessLookupError:
+                    pass
+
+    def reload(self) -> None:
+        '''
+            All workers reload the allowlist now
+        '''
+        self.signal_workers(signal.SIGHUP)
+
+    def stop(self) -> None:
+        '''
+            SIGTERM to the workers, wait drain_timeout seconds for them to write the queued records, kill the rest
+        '''
+        self.stopping = True
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.time() + self.drain_timeout
+        for process in self.processes:
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                self.logger.error("Worker %d does not stop in %d seconds, kill it, its queued records are lost." % (process.pid, self.drain_timeout))
+                process.kill()
+                process.join()
+        self.logger.info("Fleet stop.")
+
+    def run(self) -> None:
+        '''
+            Start the workers and restart the dead ones until SIGINT or SIGTERM, SIGHUP reload the allowlist of all workers
+        '''
+        received = []
+        handlers = {i: signal.signal(i, lambda number, frame: received.append(number)) for i in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)}
+        try:
+            self.start()
+            while True:
+                while received:
+                    if received.pop(0) == signal.SIGHUP:
+                        self.reload()
+                    else:
+                        return None
+                for index, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        self.logger.error("Worker %d exit with code %s, restart it." % (process.pid, process.exitcode))
+                        self.processes[index] = self.start_worker()
+                time.sleep(0.5)
+        finally:
+            if self.processes:
+                self.stop()
+            for signal_number, handler in handlers.items():
+                signal.signal(signal_number, handler)
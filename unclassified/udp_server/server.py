@@ -6,13 +6,14 @@
 
 __all__ = ['udp_server', 'info_handle']
 
+import json
 import socket
 import pickle
 import logging
-import pymysql as pm
 
-from typing import List
+from typing import Any, List
 from socketserver import UDPServer, BaseRequestHandler
+from .database import MysqlDatabase, RECORD_COLUMNS
 
 '''
     信息格式，使用loads(recv_bytes)读取信息
@@ -27,6 +28,9 @@ logger = logging.getLogger('logging name')
 class udp_server(UDPServer):
     '''
         IPGS VERIFY AND RECORD UDP SERVER
+        Legacy synchronous server: one request at a time, every record is written as it comes (no batching) on one persistent
+        database connection, which is opened again after an error. Batched writes, the write queue and the connection pool are
+        in the asyncio server (see async_server.py), use it for large job arrays.
     '''
     def __init__(self, address, handle_class, database_ip:str, database_port:int, database_name:str, logger:logging.Logger) -> None:
         '''
@@ -38,28 +42,42 @@ class udp_server(UDPServer):
         self.database_port = database_port
         self.database_name = database_name
         self.logger = logger
+        self.database = MysqlDatabase(database_ip, database_port, database_name)
+        #persistent connection of the handlers, see conn()
+        self.connection = None
+        #next id to give, it is not rows of the table, ids do not collide after rows are deleted
         self.rows = self.rows()
         #1 init server
         UDPServer.__init__(self, address, handle_class)
         self.logger.info("Server init.")
-        self.logger.info("Program_stat table have %d rows in %s@%s." % (self.rows, self.database_ip, self.database_name))
+        self.logger.info("Next id of program_stat is %d in %s@%s." % (self.rows, self.database_ip, self.database_name))
     
-    def conn(self) -> pm.connections.Connection:
+    def conn(self) -> Any:
         '''
-            Database Connection
+            Database Connection, it is opened once and used by every request
         '''
-        db_passwd = ""
-        database_conf = {"host": self.database_ip, "port": self.database_port, "user": 'ipgs', "password": db_passwd, "charset": "utf8", "cursorclass": pm.cursors.Cursor}
-        return pm.connect(**database_conf, db = self.database_name)
+        #pymysql is imported in connect(), so the async server (see async_server.py) with SqliteDatabase does not need it
+        if self.connection is None:
+            self.connection = self.database.connect()
+        return self.connection
+
+    def close_conn(self) -> None:
+        '''
+            Close the connection (after an error or when the server closes), the next request opens a new one
+        '''
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def server_close(self) -> None:
+        UDPServer.server_close(self)
+        self.close_conn()
 
     def rows(self) -> int:
-        pm_conn = self.conn()
-        pm_cursor = pm_conn.cursor()
-        pm_cursor.execute('SELECT count(*) FROM program_stat')
-        rows_num = pm_cursor.fetchone()
-        pm_cursor.close()
-        pm_conn.close()
-        return rows_num[0]
+        return self.database.next_id()
 
 class info_handle(BaseRequestHandler):
     '''
@@ -68,7 +86,6 @@ class info_handle(BaseRequestHandler):
     version = 1.0
     allow_machine_id = set(['SYSTEM MACHINE ID'])
     allow_hosts = set(['SYSTEM IP ADDRESS'])
-    no_record = set(['action', 'machine_id'])
 
     def handle(self) -> None:
         #(b'aaaassssdddd\n', <socket.socket fd=3, family=AddressFamily.AF_INET, type=SocketKind.SOCK_DGRAM, proto=0, laddr=('127.0.0.1', 9999)>)
@@ -87,6 +104,9 @@ class info_handle(BaseRequestHandler):
             if 'action' in content:
                 if content['action'] == 'record':
                     self.record(content)
+                    if content.get('ack'):
+                        #background client (see client.py) spool the record if it is not acked
+                        sock.sendto(pickle.dumps({'ack': content.get('packet_id')}), self.client_address)
                 elif content['action'] == 'verify':
                     self.verify(content, sock)
                 else:
@@ -100,61 +120,77 @@ class info_handle(BaseRequestHandler):
             self.server.logger.error("Recv no suppect information, type: %s, content is %s" % (type(content), str(content)))
             raise TypeError("Recv no suppect information, type: %s, content is %s" % (type(content), str(content)))
 
-    def verify(self, content:dict, sock:socket.socket) -> None:
+    @classmethod
+    def check_host(cls, content:dict) -> str:
+        '''
+            Return '' if host pass, or the failed item ('host' or 'machine_id')
+        '''
         #0 check host
-        if len(self.allow_hosts.intersection(content['host_ip'])) == 0:
-            self.server.logger.info("Verify Failed, host, content is %s" % str(content))
-            sock.sendto(pickle.dumps(False), self.client_address)
-            return None
+        if len(cls.allow_hosts.intersection(content['host_ip'])) == 0:
+            return 'host'
         #1 check machine_id
-        if content['machine_id'] not in self.allow_machine_id:
-            self.server.logger.info("Verify Failed, machine_id, content is %s" % str(content))
-            sock.sendto(pickle.dumps(False), self.client_address)
-            return None
-        sock.sendto(pickle.dumps(True), self.client_address)
+        if content['machine_id'] not in cls.allow_machine_id:
+            return 'machine_id'
+        return ''
 
-    def record(self, content:dict) -> None:
+    @classmethod
+    def load_allowlist(cls, file:str) -> None:
         '''
-            UPDATE or INSERT DATA INTO DATABASE
+            Replace allow_hosts and allow_machine_id by a JSON file: {"allow_hosts": [...], "allow_machine_id": [...]}
+        '''
+        with open(file, mode = 'r') as ihandle:
+            allowlist = json.load(ihandle)
+        for every_key in ('allow_hosts', 'allow_machine_id'):
+            if not isinstance(allowlist.get(every_key), list):
+                raise TypeError("%s of %s is must be a list, but now is %s" % (every_key, file, type(allowlist.get(every_key))))
+        #new sets are assigned, a request being checked see the old or the new set, never a half updated one
+        cls.allow_hosts = set(allowlist['allow_hosts'])
+        cls.allow_machine_id = set(allowlist['allow_machine_id'])
+
+    @classmethod
+    def record_row(cls, content:dict) -> dict:
+        '''
+            Columns of program_stat from a record content
         '''
-        #0 filter somethings from content
-        content = dict(filter(lambda x:x[0] not in self.no_record, content.items()))
-        #1 build conn
-        pm_conn = self.server.conn()
-        pm_cursor = pm_conn.cursor()
-        #2 check quote
-        content['argv'] = content['argv'].replace('\'', '\\\'').replace('\"', '\\\"')
-        #3 process host_ip
+        #0 keys become SQL identifiers, so only the columns of program_stat are kept (action, machine_id, ack ... are dropped),
+        #id is allocated by the server
+        content = {i: content[i] for i in RECORD_COLUMNS[1:] if i in content}
+        #1 process host_ip
         if len(content['host_ip']) == 1:
             content['host_ip'] = content['host_ip'][0]
         else:
             #use sorted keep order
             content['host_ip'] = ';'.join(sorted(content['host_ip']))
-        #4 insert or update data
-        if 'etime' in content:
-            set_strings = 'edate=\'%s\',etime=\'%s\'' % (content['edate'], content['etime'])
-            where_strings = " AND ".join([ i + '=' + '\'' + content[i] + '\'' for i in ['sdate', 'stime', 'host_ip', 'pname', 'user']])
-            try:
-                pm_cursor.execute("UPDATE program_stat SET %s WHERE %s" % (set_strings, where_strings))
-                pm_conn.commit()
-            except Exception as error:
-                self.server.logger.error("Record failed, Failed to execute the following MySQL statement:")
-                self.server.logger.error("%s" % set_strings)
-                raise(error)
-        else:
-            set_strings = 'id=%d' % self.server.rows + ',' + ','.join([ i + '=' + '\'' + str(content[i]) + '\'' for i in content])
-            try:
-                #VALUES MOTHOD: 0.334s, SET MOTHOD: 0.203s
-                pm_cursor.execute("INSERT INTO program_stat SET %s" % set_strings)
-                pm_conn.commit()
-            except Exception as error:
-                self.server.logger.error("Record failed, Failed to execute the following MySQL statement:")
-                self.server.logger.error("%s" % set_strings)
-                raise(error)
+        return content
+
+    def verify(self, content:dict, sock:socket.socket) -> None:
+        failed = self.check_host(content)
+        if failed != '':
+            self.server.logger.info("Verify Failed, %s, content is %s" % (failed, str(content)))
+            sock.sendto(pickle.dumps(False), self.client_address)
+            return None
+        sock.sendto(pickle.dumps(True), self.client_address)
+
+    def record(self, content:dict) -> None:
+        '''
+            UPDATE or INSERT DATA INTO DATABASE
+        '''
+        #0 filter somethings from content and process host_ip
+        content = self.record_row(content)
+        #1 id of a begin record, and an end record with run_id (it is inserted if its begin record is lost), MySQL uses AUTO_INCREMENT instead
+        if 'etime' not in content or content.get('run_id'):
+            content['id'] = self.server.rows
             self.server.rows += 1
-        #5 close conn
-        pm_cursor.close()
-        pm_conn.close()
+        #2 upsert by run_id, or insert and update by (sdate, stime, host_ip, pname, user) for old clients,
+        #statements are parameterized, so quotes in argv need no escape
+        try:
+            self.server.database.write_batch(self.server.conn(), [content])
+        except Exception as error:
+            #the connection may be broken (server gone away ...), the next record opens a new one
+            self.server.close_conn()
+            self.server.logger.error("Record failed, Failed to write the following record:")
+            self.server.logger.error("%s" % str(content))
+            raise(error)
 
     def argv_parser(self) -> List[str]:
         '''
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+'''
+    AsyncRecordServer on a SQLite file: records are acked and upserted by run_id (end records of old clients update their begin row),
+    verify follows the allowlist file and its reloads, bad datagrams and a full queue never stop the server,
+    stop() writes the queued records before it returns.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/udp_server/tests
+'''
+
+import json
+import time
+import pickle
+import socket
+import pytest
+import asyncio
+import threading
+
+from ..server import info_handle
+from ..database import SqliteDatabase
+from ..async_server import AsyncRecordServer, ServerStats
+
+def record_content(run_id:str = '', end:bool = False, index:int = 0) -> dict:
+    content = {'version': info_handle.version, 'action': 'record', 'user': 'tester', 'host_name': 'node', 'host_ip': ['10.0.0.1'],
+        'machine_id': 'm', 'argv': "run --name 'a b' %d" % index, 'pname': 'run', 'pwd': '/tmp', 'sdate': '2024-01-01', 'stime': '10:00:%02d' % index,
+        'ack': True, 'packet_id': '%s%d%s' % (run_id, index, 'end' if end else 'begin')}
+    if run_id:
+        content['run_id'] = run_id
+    if end:
+        content.update(edate = '2024-01-01', etime = '11:00:00')
+    return content
+
+class ServerThread:
+    '''
+        Serve in a thread, the sock sends datagrams to it
+    '''
+    def __init__(self, server:AsyncRecordServer) -> None:
+        self.server = server
+        self.error = None
+        self.thread = threading.Thread(target = self.serve, daemon = True)
+        self.thread.start()
+        deadline = time.time() + 10
+        while self.server.socket is None or self.server.address[1] == 0:
+            assert time.time() < deadline, "the server is not started"
+            time.sleep(0.01)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(2)
+
+    def serve(self) -> None:
+        try:
+            asyncio.run(self.server.serve())
+        except BaseException as e:
+            self.error = e
+
+    def request(self, content:object) -> object:
+        self.sock.sendto(pickle.dumps(content), self.server.address)
+        return pickle.loads(self.sock.recvfrom(65536)[0])
+
+    def stop(self) -> None:
+        self.server.stop()
+        self.thread.join(30)
+        self.sock.close()
+        assert not self.thread.is_alive() and self.error is None
+
+@pytest.fixture(autouse = True)
+def allowlist_of_test(monkeypatch):
+    #the lists are class attributes of info_handle, every test starts from its own
+    monkeypatch.setattr(info_handle, 'allow_hosts', set(['10.0.0.1']))
+    monkeypatch.setattr(info_handle, 'allow_machine_id', set(['m']))
+
+def database_of(tmp_path) -> SqliteDatabase:
+    database = SqliteDatabase(str(tmp_path / 'record.db'))
+    database.create_table()
+    return database
+
+def test_records_are_acked_and_upserted(tmp_path) -> None:
+    database = database_of(tmp_path)
+    connection = database.connect()
+    connection.execute("INSERT INTO program_stat (id, pname) VALUES (41, 'old')")
+    connection.commit()
+    connection.close()
+    running = ServerThread(AsyncRecordServer(('127.0.0.1', 0), database, batch_size = 3, flush_interval = 0.05, stats_interval = 0))
+    try:
+        for index in range(10):
+            content = record_content('run%02d' % index, index = index)
+            assert running.request(content) == {'ack': content['packet_id']}
+        #a resent begin record is not a new row, end records set edate and etime
+        running.request(record_content('run00'))
+        for index in range(10):
+            running.request(record_content('run%02d' % index, True, index))
+        #old clients without run_id
+        running.request(record_content(index = 50))
+        running.request(record_content(end = True, index = 50))
+    finally:
+        running.stop()
+    rows = database.query('SELECT id, run_id, argv, etime FROM program_stat WHERE id != 41 ORDER BY stime')
+    assert len(rows) == 11
+    #ids start after max id, the resent begin and the end records with run_id take ids too, they are not new rows
+    assert [i[0] for i in rows[:10]] == list(range(42, 52)) and rows[10][0] == 63
+    assert [i[1] for i in rows[:10]] == ['run%02d' % i for i in range(10)] and rows[10][1] is None
+    assert all(i[3] == '11:00:00' for i in rows) and rows[0][2] == "run --name 'a b' 0"
+    stats = running.server.stats.as_dict()
+    assert stats['records'] == stats['written'] == 23 and stats['errors'] == stats['dropped'] == 0
+
+def test_verify_follows_the_allowlist_file(tmp_path) -> None:
+    allowlist = tmp_path / 'allowlist.json'
+    allowlist.write_text(json.dumps({'allow_hosts': ['10.0.0.2'], 'allow_machine_id': ['m']}))
+    running = ServerThread(AsyncRecordServer(('127.0.0.1', 0), database_of(tmp_path), allowlist = str(allowlist), reload_interval = 0.05,
+        stats_interval = 0))
+    try:
+        verify = {'version': info_handle.version, 'action': 'verify', 'host_ip': ['10.0.0.1', '10.0.0.2'], 'machine_id': 'm'}
+        assert running.request(verify) is True
+        assert running.request(dict(verify, machine_id = 'other')) is False
+        allowlist.write_text(json.dumps({'allow_hosts': ['10.0.0.3'], 'allow_machine_id': ['m']}))
+        deadline = time.time() + 5
+        while running.request(verify) is not False:
+            assert time.time() < deadline, "the allowlist is not reloaded"
+            time.sleep(0.05)
+        #a bad file is logged, the old lists are kept
+        allowlist.write_text('{"allow_hosts": "10.0.0.1"}')
+        time.sleep(0.2)
+        assert running.request(dict(verify, host_ip = ['10.0.0.3'])) is True
+    finally:
+        running.stop()
+
+def test_bad_datagrams_do_not_stop_the_server(tmp_path) -> None:
+    running = ServerThread(AsyncRecordServer(('127.0.0.1', 0), database_of(tmp_path), stats_interval = 0))
+    try:
+        for bad in [b'not a pickle', pickle.dumps(['list']), pickle.dumps({'version': 0.1, 'action': 'verify'}),
+            pickle.dumps({'version': info_handle.version, 'action': 'delete'}), pickle.dumps(dict(record_content('bad'), ack = False, secret = 'x'))]:
+            running.sock.sendto(bad, running.server.address)
+        assert running.request({'version': info_handle.version, 'action': 'verify', 'host_ip': ['10.0.0.1'], 'machine_id': 'm'}) is True
+    finally:
+        running.stop()
+    #the unknown key is dropped by record_row, the record is written
+    assert running.server.stats.errors == 4 and running.server.stats.written == 1
+
+def test_full_queue_drops_records(tmp_path) -> None:
+    server = AsyncRecordServer(('127.0.0.1', 0), database_of(tmp_path), queue_size = 2, writers = 1)
+    server.queues = [asyncio.Queue(maxsize = 2)]
+    rows = [info_handle.record_row(record_content('run%d' % i, index = i)) for i in range(3)]
+    assert [server.put_record(i) for i in rows] == [True, True, False]
+    assert server.stats.dropped == 1 and server.stats.max_queue_depth == 2
+    #ids are given to the queued records only
+    assert [server.queues[0].get_nowait()['id'] for _ in range(2)] == [0, 1]
+    with pytest.raises(ValueError):
+        AsyncRecordServer(('127.0.0.1', 0), database_of(tmp_path), queue_size = 1, writers = 2)
+    with pytest.raises(FileNotFoundError):
+        AsyncRecordServer(('127.0.0.1', 0), database_of(tmp_path), allowlist = str(tmp_path / 'missing.json'))
+
+class FlakyDatabase(SqliteDatabase):
+    '''
+        The first write fails like a connection closed by the database
+    '''
+    failures = 1
+
+    def write_batch(self, connection, records:list) -> int:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("server has gone away")
+        return super().write_batch(connection, records)
+
+def test_stop_drains_the_queue_and_reconnects(tmp_path) -> None:
+    database = FlakyDatabase(str(tmp_path / 'record.db'))
+    database.create_table()
+    running = ServerThread(AsyncRecordServer(('127.0.0.1', 0), database, batch_size = 1000, flush_interval = 60, stats_interval = 0))
+    for index in range(20):
+        running.request(record_content('run%02d' % index, index = index))
+    begin_time = time.time()
+    running.stop()
+    assert time.time() - begin_time < 10
+    assert database.rows() == 20
+    stats = running.server.stats
+    assert stats.written == 20 and stats.failed == 0 and stats.queue_depth == 0
+    assert 'written: 20' in stats.report()
+    assert ServerStats().as_dict()['mean_batch_size'] == 0
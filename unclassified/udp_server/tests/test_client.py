@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+'''
+    Background mode of udp_client: records which are not acked are spooled, replayed by a later run, and the .replay files
+    of killed runs are recovered; the sender gets out of the server_down state after the server comes back.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/udp_server/tests
+'''
+
+import os
+import pickle
+import socket
+import threading
+import subprocess
+
+from ..client import udp_client
+
+class AckServer:
+    '''
+        UDP socket in a thread, it acks the records while answer is True and keeps them
+    '''
+    def __init__(self) -> None:
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.05)
+        self.address = self.sock.getsockname()
+        self.answer = True
+        self.records = []
+        self.running = True
+        self.thread = threading.Thread(target = self.loop, daemon = True)
+        self.thread.start()
+
+    def loop(self) -> None:
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            content = pickle.loads(data)
+            if self.answer:
+                self.records.append(content)
+                self.sock.sendto(pickle.dumps({'ack': content['packet_id']}), address)
+
+    def close(self) -> None:
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+def background_client(cache_dir:str, port:int) -> udp_client:
+    #a fresh host cache, so psutil, id and machine-id are not used
+    with open(os.path.join(cache_dir, 'client_%s.pkl' % os.uname().nodename), mode = 'wb') as ohandle:
+        pickle.dump({'user': 'tester', 'host_name': 'node', 'host_ip': ['127.0.0.1'], 'machine_id': 'm', 'time': 4e9}, ohandle)
+    return udp_client('127.0.0.1', port, logger_name = 'test', background = True, cache_dir = cache_dir, ack_timeout = 0.1,
+        retries = 1, flush_timeout = 5)
+
+def closed_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_unacked_records_are_spooled_and_replayed(tmp_path) -> None:
+    client = background_client(str(tmp_path), closed_port())
+    client.record('begin')
+    client.record('end')
+    client.close()
+    spooled = client.read_records(client.spool_file)
+    assert [i['run_id'] for i in spooled] == [client.all_informations['run_id']] * 2
+    assert 'etime' in spooled[1]
+    server = AckServer()
+    try:
+        #a later run on this node sends the spool before its own records
+        later = background_client(str(tmp_path), server.address[1])
+        later.record('begin')
+        later.close()
+        assert [i['packet_id'] for i in server.records[:2]] == [i['packet_id'] for i in spooled]
+        assert server.records[2]['run_id'] == later.all_informations['run_id']
+        assert not os.path.exists(later.spool_file)
+        assert [i for i in os.listdir(str(tmp_path)) if i.endswith('.replay')] == []
+    finally:
+        server.close()
+
+def test_sender_recovers_after_server_comes_back(tmp_path) -> None:
+    server = AckServer()
+    try:
+        client = background_client(str(tmp_path), server.address[1])
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.answer = False
+        assert not client.deliver(sock, {'packet_id': 'a'})
+        assert client.server_down
+        server.answer = True
+        #one more try while it is down, the ack resets the state
+        assert client.deliver(sock, {'packet_id': 'b'})
+        assert not client.server_down
+        sock.close()
+    finally:
+        server.close()
+
+def test_replay_files_of_dead_runs_are_recovered(tmp_path) -> None:
+    client = background_client(str(tmp_path), closed_port())
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    prefix = '%s.%s.' % (client.spool_file, os.uname().nodename)
+    records = [{'packet_id': str(i), 'run_id': 'r'} for i in range(3)]
+    for pid in (dead.pid, os.getpid()):
+        with open('%s%d.replay' % (prefix, pid), mode = 'wb') as ohandle:
+            for every_record in records:
+                ohandle.write(pickle.dumps(every_record))
+            if pid == dead.pid:
+                #the run was killed while this record was written
+                ohandle.write(pickle.dumps({'packet_id': 'cut'})[:5])
+    client.recover_replays()
+    assert client.read_records(client.spool_file) == records
+    assert not os.path.exists('%s%d.replay' % (prefix, dead.pid))
+    #a run which is alive is still replaying its file
+    assert os.path.exists('%s%d.replay' % (prefix, os.getpid()))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+'''
+    Records of program_stat: begin and end records are upserted by run_id in any order and resent records are not new rows,
+    end records of old clients update their begin row by the legacy index, migrate() upgrades an old table once and keeps its rows,
+    the MySQL statements of the migration are built from SHOW COLUMNS.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/udp_server/tests
+'''
+
+import pickle
+import sqlite3
+import pytest
+
+from ..database import MATCH_COLUMNS, MysqlDatabase, SqliteDatabase
+
+def begin_record(index:int, run_id:str = '') -> dict:
+    record = {'id': index, 'version': 1.0, 'user': 'tester', 'host_name': 'node', 'host_ip': '10.0.0.1', 'argv': "run 'quoted' %d" % index,
+        'pname': 'run', 'pwd': '/tmp', 'sdate': '2024-01-01', 'stime': '10:00:%02d' % index}
+    if run_id:
+        record['run_id'] = run_id
+    return record
+
+def end_record(index:int, run_id:str = '') -> dict:
+    record = begin_record(index, run_id)
+    if not run_id:
+        record = {i: record[i] for i in MATCH_COLUMNS}
+    record.update(edate = '2024-01-01', etime = '11:00:%02d' % index)
+    return record
+
+@pytest.fixture
+def database(tmp_path) -> SqliteDatabase:
+    database = SqliteDatabase(str(tmp_path / 'record.db'))
+    database.create_table()
+    return database
+
+def write(database:SqliteDatabase, records:list) -> int:
+    connection = database.connect()
+    try:
+        return database.write_batch(connection, records)
+    finally:
+        connection.close()
+
+def test_upsert_by_run_id(database:SqliteDatabase) -> None:
+    #an end record in the same batch as its begin, an end record before its begin (the begin is late), a resent begin
+    write(database, [begin_record(0, 'run0'), end_record(0, 'run0'), end_record(1, 'run1')])
+    write(database, [begin_record(1, 'run1'), begin_record(0, 'run0'), end_record(2, 'run2'), end_record(2, 'run2')])
+    rows = database.query('SELECT run_id, argv, etime FROM program_stat ORDER BY run_id')
+    assert rows == [('run0', "run 'quoted' 0", '11:00:00'), ('run1', "run 'quoted' 1", '11:00:01'), ('run2', "run 'quoted' 2", '11:00:02')]
+    assert database.next_id() == 3
+
+def test_legacy_end_records(database:SqliteDatabase) -> None:
+    write(database, [begin_record(i) for i in range(5)])
+    write(database, [end_record(1), end_record(3), begin_record(5), end_record(5)])
+    assert database.query('SELECT id, etime FROM program_stat ORDER BY id') == [(0, None), (1, '11:00:01'), (2, None), (3, '11:00:03'),
+        (4, None), (5, '11:00:05')]
+    #the match does not scan the table
+    plan = database.query('EXPLAIN QUERY PLAN %s' % database.update_sql().replace('?', "'x'"))
+    assert any('idx_legacy_match' in i[-1] for i in plan)
+
+def test_bad_batch_is_rolled_back(database:SqliteDatabase) -> None:
+    with pytest.raises(ValueError, match = 'secret'):
+        write(database, [begin_record(0, 'run0'), dict(begin_record(1, 'run1'), secret = 'x')])
+    connection = database.connect()
+    connection.execute('DROP INDEX uniq_run_id')
+    connection.execute('CREATE UNIQUE INDEX uniq_id ON program_stat (id)')
+    connection.commit()
+    connection.close()
+    #the second record fails, the first one of the batch is not kept
+    with pytest.raises(sqlite3.Error):
+        write(database, [begin_record(7), begin_record(7)])
+    assert database.rows() == 0
+
+def test_migrate_an_old_table(tmp_path) -> None:
+    file = str(tmp_path / 'old.db')
+    connection = sqlite3.connect(file)
+    connection.execute('CREATE TABLE program_stat (id INTEGER, version TEXT, user TEXT, host_name TEXT, host_ip TEXT, argv TEXT, pname TEXT, '
+        'pwd TEXT, sdate TEXT, stime TEXT, edate TEXT, etime TEXT)')
+    connection.execute("INSERT INTO program_stat (id, pname, sdate, stime, host_ip, user) VALUES (7, 'run', '2024-01-01', '10:00:00', "
+        "'10.0.0.1', 'tester')")
+    connection.commit()
+    connection.close()
+    database = SqliteDatabase(file)
+    statements = database.migrate()
+    assert [i.split(' ')[0:3] for i in statements] == [['ALTER', 'TABLE', 'program_stat'], ['CREATE', 'UNIQUE', 'INDEX'], ['CREATE', 'INDEX', 'idx_legacy_match']]
+    assert database.migrate() == []
+    assert 'run_id' in database.columns() and database.rows() == 1
+    #old rows have NULL run_id, new clients and old clients both work on the migrated table
+    write(database, [begin_record(8, 'run8'), end_record(8, 'run8'), end_record(0)])
+    assert database.query('SELECT id, run_id, etime FROM program_stat ORDER BY id') == [(7, None, '11:00:00'), (8, 'run8', '11:00:08')]
+
+def test_memory_database_is_shared_and_pickled() -> None:
+    database = SqliteDatabase()
+    database.create_table()
+    write(database, [begin_record(0, 'run0')])
+    assert database.rows() == 1
+    copied = pickle.loads(pickle.dumps(database))
+    assert copied.keeper is None and copied.file == database.file
+    write(copied, [begin_record(1, 'run1')])
+    assert database.rows() == 2
+
+class ShowMysql(MysqlDatabase):
+    '''
+        Answers of SHOW COLUMNS and SHOW INDEX of an old MySQL table, no server is needed
+    '''
+    def __init__(self, columns:list, indexes:list) -> None:
+        super().__init__('127.0.0.1', 3306, 'ipgs_record')
+        self.show_columns = columns
+        self.indexes = indexes
+
+    def query(self, sql:str) -> list:
+        if sql.startswith('SHOW COLUMNS'):
+            return self.show_columns
+        return [('program_stat', 0, i) for i in self.indexes if "'%s'" % i in sql]
+
+def test_mysql_migration_sql() -> None:
+    columns = [('id', 'int(11)', 'YES', '', None, ''), ('user', 'varchar(32)', 'YES', '', None, ''), ('host_ip', b'text', 'YES', '', None, ''),
+        ('pname', 'varchar(255)', 'YES', '', None, ''), ('sdate', 'date', 'YES', '', None, ''), ('stime', 'time', 'YES', '', None, '')]
+    statements = ShowMysql(columns, []).migration_sql([i[0] for i in columns])
+    assert statements == ['ALTER TABLE program_stat ADD COLUMN run_id CHAR(32) NULL DEFAULT NULL',
+        'ALTER TABLE program_stat ADD UNIQUE INDEX uniq_run_id (run_id)',
+        'ALTER TABLE program_stat ADD INDEX idx_legacy_match (sdate, stime, host_ip(64), pname(64), user)',
+        'ALTER TABLE program_stat ADD PRIMARY KEY (id)',
+        'ALTER TABLE program_stat MODIFY COLUMN id int(11) NOT NULL AUTO_INCREMENT']
+    migrated = [('id', 'int(11)', 'NO', 'PRI', None, 'auto_increment')] + columns[1:] + [('run_id', 'char(32)', 'YES', 'UNI', None, '')]
+    assert ShowMysql(migrated, ['uniq_run_id', 'idx_legacy_match']).migration_sql([i[0] for i in migrated]) == []
+    #id is not written with AUTO_INCREMENT, an end record with run_id only set edate and etime of its row
+    assert MysqlDatabase('127.0.0.1', 3306, 'x').record_columns(begin_record(0, 'run0'))[0] == 'version'
+    assert MysqlDatabase('127.0.0.1', 3306, 'x').upsert_sql(('run_id', 'edate', 'etime'), True).endswith(
+        'ON DUPLICATE KEY UPDATE edate=VALUES(edate),etime=VALUES(etime)')
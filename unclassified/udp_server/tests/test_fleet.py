@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''
+    ServerFleet: the workers share one port and one id counter, every record is written once with a unique id,
+    a worker ignores SIGINT and drains on SIGTERM, run() restarts a dead worker and stops on SIGTERM.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/udp_server/tests
+'''
+
+import os
+import time
+import pickle
+import signal
+import socket
+import threading
+
+from ..server import info_handle
+from ..database import SqliteDatabase
+from ..fleet import ServerFleet
+
+OPTIONS = {'batch_size': 1000, 'flush_interval': 60, 'stats_interval': 0}
+
+def database_of(tmp_path) -> SqliteDatabase:
+    database = SqliteDatabase(str(tmp_path / 'record.db'))
+    database.create_table()
+    connection = database.connect()
+    connection.execute("INSERT INTO program_stat (id, pname) VALUES (99, 'old')")
+    connection.commit()
+    connection.close()
+    return database
+
+def wait_ready(address:tuple, timeout:float = 20) -> None:
+    deadline = time.time() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.2)
+        while True:
+            #every worker answer False, the host is not in the allowlist of the worker
+            sock.sendto(pickle.dumps({'version': info_handle.version, 'action': 'verify', 'host_ip': ['none'], 'machine_id': 'none'}), address)
+            try:
+                if sock.recvfrom(1024)[0]:
+                    return None
+            except socket.timeout:
+                assert time.time() < deadline, "the fleet is not started"
+
+def send_records(address:tuple, run_ids:list) -> None:
+    #a socket of every client, the kernel spread the clients to the workers by the address
+    for run_id in run_ids:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(2)
+            content = {'version': info_handle.version, 'action': 'record', 'run_id': run_id, 'user': 'tester', 'host_name': 'node',
+                'host_ip': ['10.0.0.1'], 'argv': 'run', 'pname': 'run', 'pwd': '/tmp', 'sdate': '2024-01-01', 'stime': '10:00:00',
+                'ack': True, 'packet_id': run_id}
+            sock.sendto(pickle.dumps(content), address)
+            assert pickle.loads(sock.recvfrom(1024)[0]) == {'ack': run_id}
+
+def test_workers_share_port_and_ids(tmp_path) -> None:
+    database = database_of(tmp_path)
+    fleet = ServerFleet(('127.0.0.1', 0), database, 3, drain_timeout = 20, **OPTIONS)
+    fleet.start()
+    try:
+        assert fleet.address[1] != 0 and fleet.id_counter.value == 100
+        wait_ready(fleet.address)
+        send_records(fleet.address, ['run%03d' % i for i in range(60)])
+        #Ctrl-C of the process group does not stop a worker, SIGTERM from the parent does
+        for process in fleet.processes:
+            os.kill(process.pid, signal.SIGINT)
+        time.sleep(0.3)
+        assert all(i.is_alive() for i in fleet.processes)
+    finally:
+        fleet.stop()
+    assert all(i.exitcode == 0 for i in fleet.processes)
+    #the queued records are written when the workers stop, ids of the workers do not collide
+    rows = database.query("SELECT id, run_id FROM program_stat WHERE id != 99")
+    assert sorted(i[1] for i in rows) == ['run%03d' % i for i in range(60)]
+    assert len(set(i[0] for i in rows)) == 60 and min(i[0] for i in rows) >= 100
+
+def test_run_restarts_dead_workers(tmp_path) -> None:
+    database = database_of(tmp_path)
+    fleet = ServerFleet(('127.0.0.1', 0), database, 2, drain_timeout = 20, **OPTIONS)
+    restarted = []
+    def supervise() -> None:
+        deadline = time.time() + 30
+        while len(fleet.processes) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        wait_ready(fleet.address)
+        killed = fleet.processes[0]
+        killed.kill()
+        while fleet.processes[0] is killed and time.time() < deadline:
+            time.sleep(0.05)
+        restarted.append(fleet.processes[0] is not killed)
+        wait_ready(fleet.address)
+        send_records(fleet.address, ['run%03d' % i for i in range(10)])
+        os.kill(os.getpid(), signal.SIGTERM)
+    handler = signal.getsignal(signal.SIGTERM)
+    thread = threading.Thread(target = supervise, daemon = True)
+    thread.start()
+    fleet.run()
+    thread.join()
+    assert restarted == [True]
+    assert signal.getsignal(signal.SIGTERM) is handler
+    assert all(not i.is_alive() for i in fleet.processes)
+    assert database.rows() == 11
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+'''
+    udp_bench: a small run writes every record and answers every verify, the stats of workers are merged,
+    compare() report only the changes beyond the tolerance.
+    Run from the folder which has unclassified: python -m pytest -q unclassified/udp_server/tests
+'''
+
+import copy
+import pytest
+
+from ..udp_bench import compare, merge_stats, percentile, run_bench
+
+@pytest.mark.parametrize('workers, ack', [(1, True), (2, False)])
+def test_small_run(tmp_path, workers:int, ack:bool) -> None:
+    result = run_bench(clients = 60, rate = 300, concurrency = 8, workers = workers, ack = ack, work_dir = str(tmp_path),
+        server_options = {'batch_size': 16, 'flush_interval': 0.05})
+    assert result['db']['rows'] == result['db']['begin_rows'] == result['db']['end_rows'] == 60
+    assert result['drop_rate']['records'] == 0 and result['drop_rate']['verify'] == 0
+    assert result['verify_rtt_ms']['answered'] == 60 and result['verify_rtt_ms']['failed'] == 0
+    assert result['throughput']['datagrams_sent'] == 180
+    assert result['server']['written'] == 120 and result['server']['dropped'] == 0
+    if ack:
+        assert result['drop_rate']['acks'] == 120
+    #the temp folder of the run is removed
+    assert list(tmp_path.iterdir()) == []
+    assert compare(result, result) == []
+
+def test_compare_and_merge() -> None:
+    baseline = {'throughput': {'received_per_second': 1000.0}, 'verify_rtt_ms': {'p50': 1.0, 'p99': 10.0},
+        'drop_rate': {'datagrams': 0.0, 'verify': 0.0, 'records': 0.01}}
+    result = copy.deepcopy(baseline)
+    result['throughput']['received_per_second'] = 950.0
+    result['verify_rtt_ms']['p99'] = 12.0
+    result['drop_rate']['datagrams'] = 0.0005
+    result['drop_rate']['records'] = 0.02
+    assert compare(result, baseline) == ['verify_rtt_ms.p99: 10.0000 -> 12.0000', 'drop_rate.records: 0.0100 -> 0.0200']
+    assert compare(result, baseline, 0.3) == ['drop_rate.records: 0.0100 -> 0.0200']
+    merged = merge_stats([{'received': 10, 'batches': 1, 'max_batch_size': 5, 'mean_flush_time': 1.0},
+        {'received': 20, 'batches': 3, 'max_batch_size': 7, 'mean_flush_time': 3.0}])
+    assert merged == {'received': 30, 'batches': 4, 'max_batch_size': 7, 'mean_flush_time': 2.5}
+    assert merge_stats([]) == {}
+    assert percentile([], 0.5) == 0.0 and percentile([3, 1, 2], 0.99) == 3
+    with pytest.raises(ValueError):
+        run_bench(clients = 0)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+'''
+    LOAD TEST OF THE UDP VERIFY AND RECORD SERVER
+        1. 在子进程中启动 AsyncRecordServer（workers > 1 时为 ServerFleet），数据库是临时目录中的 SQLite 文件。
+        2. 模拟 clients 个 udp_client，按 rate（每秒开始的客户端数）发送 begin record、verify、end record，
+           同时最多 concurrency 个客户端（每个占用一个socket）。
+        3. 输出JSON：吞吐量、verify 往返时间（p50/p99）、丢包率、数据库写入延迟和服务器计数器；
+           baseline 指定上一个版本的结果时，吞吐量下降、p99 或丢包率上升超过 tolerance 则退出码为1，用于发现性能回退。
+    Usage:
+        cd unclassified
+        python3 -m udp_server.udp_bench --clients 5000 --rate 1000 --concurrency 256 --output bench.json
+        python3 -m udp_server.udp_bench --clients 5000 --rate 1000 --workers 4 --baseline bench.json
+'''
+
+__all__ = ['run_bench', 'compare']
+
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import multiprocessing as mp
+
+from typing import Any, Dict, List, Tuple
+from .server import info_handle
+from .database import SqliteDatabase
+
+# HOST OF THE SIMULATED CLIENTS, IT IS IN THE ALLOWLIST OF THE SERVER
+BENCH_HOST = '10.255.255.1'
+BENCH_MACHINE_ID = 'udp_bench'
+
+def run_server(address:Tuple[str, int], database_file:str, allowlist:str, workers:int, stats_queue:mp.Queue, options:dict) -> None:
+    '''
+        Server process, it stops on SIGTERM and put the stats of every worker to stats_queue
+    '''
+    from .async_server import AsyncRecordServer
+    from .fleet import ServerFleet
+    database = SqliteDatabase(database_file)
+    options = dict(options, allowlist = allowlist, stats_interval = 0, stats_queue = stats_queue)
+    if workers > 1:
+        ServerFleet(address, database, workers, **options).run()
+    else:
+        AsyncRecordServer(address, database, **options).run()
+
+def percentile(values:List[float], ratio:float) -> float:
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(ratio * len(values)), len(values) - 1)]
+
+class BenchEndpoint(asyncio.DatagramProtocol):
+    '''
+        Socket of a simulated client, verify answer (bool) is passed to waiter, acks (dict) are counted
+    '''
+    def __init__(self) -> None:
+        self.transport = None
+        self.waiter = None
+        self.acks = 0
+
+    def connection_made(self, transport:asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data:bytes, address:Tuple[str, int]) -> None:
+        reply = pickle.loads(data)
+        if isinstance(reply, dict):
+            self.acks += 1
+        elif self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(reply)
+
+class LoadGenerator:
+    '''
+        Start a client every 1 / rate seconds (open loop), a client send begin record, verify and wait for the answer, end record
+    '''
+    def __init__(self, address:Tuple[str, int], clients:int, rate:float, concurrency:int, verify_timeout:float, ack:bool) -> None:
+        self.address = address
+        self.clients = clients
+        self.rate = rate
+        self.concurrency = concurrency
+        self.verify_timeout = verify_timeout
+        self.ack = ack
+        self.rtts = []
+        self.verify_lost = 0
+        self.verify_failed = 0
+        self.sent = 0
+        self.lag = 0.0
+        self.acks = 0
+        self.run_tag = os.urandom(4).hex()
+
+    def content(self, index:int) -> Dict[str, Any]:
+        #pwd tells which record created the row, an end record only set edate and etime of an existing row
+        sdate, stime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()).split(' ')
+        return {'version': info_handle.version, 'run_id': '%s%024x' % (self.run_tag, index), 'user': 'bench', 'host_name': 'bench_%d' % index,
+            'host_ip': [BENCH_HOST], 'machine_id': BENCH_MACHINE_ID, 'argv': 'bench --client %d' % index, 'pname': 'bench', 'pwd': 'begin',
+            'sdate': sdate, 'stime': stime}
+
+    def send(self, endpoint:BenchEndpoint, content:dict) -> None:
+        if self.ack:
+            content = dict(content, ack = True, packet_id = os.urandom(16).hex())
+        endpoint.transport.sendto(pickle.dumps(content))
+        self.sent += 1
+
+    async def client(self, index:int, endpoints:asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        endpoint = await endpoints.get()
+        try:
+            content = self.content(index)
+            self.send(endpoint, dict(content, action = 'record'))
+            endpoint.waiter = loop.create_future()
+            begin_time = loop.time()
+            self.send(endpoint, {'action': 'verify', 'host_ip': content['host_ip'], 'machine_id': content['machine_id'], 'version': content['version']})
+            try:
+                if await asyncio.wait_for(endpoint.waiter, self.verify_timeout) is not True:
+                    self.verify_failed += 1
+                self.rtts.append(loop.time() - begin_time)
+            except asyncio.TimeoutError:
+                self.verify_lost += 1
+            finally:
+                endpoint.waiter = None
+            edate, etime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()).split(' ')
+            self.send(endpoint, dict(content, action = 'record', pwd = 'end', edate = edate, etime = etime))
+        finally:
+            endpoints.put_nowait(endpoint)
+
+    async def run(self) -> float:
+        '''
+            Run all clients, return the seconds from the first to the last client
+        '''
+        loop = asyncio.get_running_loop()
+        endpoints, protocols = asyncio.Queue(), []
+        for _ in range(self.concurrency):
+            transport, protocol = await loop.create_datagram_endpoint(BenchEndpoint, remote_addr = self.address)
+            endpoints.put_nowait(protocol)
+            protocols.append(protocol)
+        begin_time = loop.time()
+        tasks = []
+        for index in range(self.clients):
+            delay = begin_time + index / self.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                #the generator is behind the schedule, the rate is not reached
+                self.lag = max(self.lag, -delay)
+            tasks.append(asyncio.create_task(self.client(index, endpoints)))
+        await asyncio.gather(*tasks)
+        duration = loop.time() - begin_time
+        #acks of the last records
+        await asyncio.sleep(min(self.verify_timeout, 0.5))
+        self.acks = sum(i.acks for i in protocols)
+        for protocol in protocols:
+            protocol.transport.close()
+        return duration
+
+def wait_ready(address:Tuple[str, int], timeout:float) -> int:
+    '''
+        Send verify until the server answer, return the number of requests sent (they are received by the server too)
+    '''
+    deadline, probes = time.time() + timeout, 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        #a connected socket get ConnectionRefusedError of a request sent before the port is bound
+        sock.connect(address)
+        sock.settimeout(0.2)
+        request = pickle.dumps({'action': 'verify', 'host_ip': [BENCH_HOST], 'machine_id': BENCH_MACHINE_ID, 'version': info_handle.version})
+        while time.time() < deadline:
+            try:
+                sock.send(request)
+                probes += 1
+                sock.recv(1024)
+                return probes
+            except ConnectionRefusedError:
+                #the port is not bound yet, the request is not received
+                probes -= 1
+                time.sleep(0.1)
+            except OSError:
+                time.sleep(0.1)
+    raise TimeoutError("The server did not answer within %d seconds!" % timeout)
+
+def merge_stats(worker_stats:List[dict]) -> dict:
+    '''
+        Stats of all workers: counters are summed, max values are max, mean values are weighted by batches
+    '''
+    if len(worker_stats) == 0:
+        return {}
+    merged = {}
+    for key in worker_stats[0]:
+        values = [i[key] for i in worker_stats]
+        if key.startswith('max_'):
+            merged[key] = max(values)
+        elif key.startswith('mean_') or key.startswith('last_'):
+            batches = sum(i['batches'] for i in worker_stats)
+            merged[key] = sum(i[key] * i['batches'] for i in worker_stats) / batches if batches > 0 else 0.0
+        else:
+            merged[key] = sum(values)
+    return merged
+
+def run_bench(clients:int = 1000, rate:float = 500, concurrency:int = 128, workers:int = 1, ack:bool = False, verify_timeout:float = 1,
+    port:int = 0, work_dir:str = '', server_options:dict = {}) -> dict:
+    '''
+        Run the server and the clients, return the result dict
+    '''
+    if clients < 1 or rate <= 0 or concurrency < 1 or workers < 1:
+        raise ValueError("clients, concurrency and workers are must be ge 1 and rate is must be gt 0, but now are %d, %d, %d and %s" % (
+            clients, concurrency, workers, rate))
+    temp_dir = tempfile.mkdtemp(prefix = 'udp_bench.', dir = work_dir or None)
+    try:
+        #0 database and allowlist of the server
+        database_file = os.path.join(temp_dir, 'record.db')
+        database = SqliteDatabase(database_file)
+        database.create_table()
+        allowlist = os.path.join(temp_dir, 'allowlist.json')
+        with open(allowlist, mode = 'w') as ohandle:
+            json.dump({'allow_hosts': [BENCH_HOST], 'allow_machine_id': [BENCH_MACHINE_ID]}, ohandle)
+        if port == 0:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+        address = ('127.0.0.1', port)
+        #1 server process
+        stats_queue = mp.Queue()
+        server = mp.Process(target = run_server, args = (address, database_file, allowlist, workers, stats_queue, server_options))
+        server.start()
+        try:
+            probes = wait_ready(address, 30)
+            #2 clients
+            generator = LoadGenerator(address, clients, rate, concurrency, verify_timeout, ack)
+            duration = asyncio.run(generator.run())
+        finally:
+            #3 stop the server, it writes the queued records
+            os.kill(server.pid, signal.SIGTERM)
+            worker_stats = []
+            for _ in range(workers):
+                try:
+                    worker_stats.append(stats_queue.get(timeout = 60))
+                except Exception:
+                    break
+            server.join()
+        #4 rows written
+        begin_rows, end_rows, rows = database.query("SELECT sum(pwd = 'begin'), sum(etime IS NOT NULL), count(*) FROM program_stat "
+            "WHERE run_id LIKE '%s%%'" % generator.run_tag)[0]
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors = True)
+    stats = merge_stats(worker_stats)
+    #a probe whose answer is lost is received but counted as not, so the count is not lt 0
+    received = max(stats.get('received', 0) - probes, 0)
+    records_sent = clients * 2
+    records_written = (begin_rows or 0) + (end_rows or 0)
+    rtts = [i * 1000 for i in generator.rtts]
+    return {
+        'config': {'clients': clients, 'rate': rate, 'concurrency': concurrency, 'workers': workers, 'ack': ack, 'verify_timeout': verify_timeout,
+            'server_options': server_options},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(), 'time': time.time()},
+        'throughput': {'duration': duration, 'datagrams_sent': generator.sent, 'sent_per_second': generator.sent / duration,
+            'clients_per_second': clients / duration, 'received_per_second': received / duration, 'max_lag': generator.lag},
+        'verify_rtt_ms': {'p50': percentile(rtts, 0.5), 'p99': percentile(rtts, 0.99), 'mean': sum(rtts) / len(rtts) if rtts else 0.0,
+            'max': max(rtts) if rtts else 0.0, 'answered': len(rtts), 'lost': generator.verify_lost, 'failed': generator.verify_failed},
+        'drop_rate': {'datagrams': max(1 - received / generator.sent, 0.0),
+            'verify': generator.verify_lost / clients, 'records': 1 - records_written / records_sent, 'queue_dropped': stats.get('dropped', 0),
+            'db_failed': stats.get('failed', 0), 'acks': generator.acks if ack else None},
+        'db': {'rows': rows, 'begin_rows': begin_rows, 'end_rows': end_rows, 'batches': stats.get('batches', 0),
+            'mean_batch_size': stats.get('mean_batch_size', 0.0), 'mean_flush_ms': stats.get('mean_flush_time', 0.0) * 1000,
+            'max_flush_ms': stats.get('max_flush_time', 0.0) * 1000,
+            'mean_record_ms': stats.get('mean_flush_time', 0.0) * stats.get('batches', 0) * 1000 / max(stats.get('written', 0), 1)},
+        'server': stats,
+    }
+
+def compare(result:dict, baseline:dict, tolerance:float = 0.1) -> List[str]:
+    '''
+        Regressions of result against baseline, relative changes gt tolerance
+    '''
+    regressions = []
+    checks = [('throughput', 'received_per_second', -1), ('verify_rtt_ms', 'p50', 1), ('verify_rtt_ms', 'p99', 1)]
+    for group, key, direction in checks:
+        old, new = baseline[group][key], result[group][key]
+        if old > 0 and (new - old) / old * direction > tolerance:
+            regressions.append('%s.%s: %.4f -> %.4f' % (group, key, old, new))
+    for key in ('datagrams', 'verify', 'records'):
+        old, new = baseline['drop_rate'][key], result['drop_rate'][key]
+        #drop rates are near 0, an absolute tolerance of 0.1% is used
+        if new - old > max(old * tolerance, 0.001):
+            regressions.append('drop_rate.%s: %.4f -> %.4f' % (key, old, new))
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = 'Load test of the UDP verify and record server, the result is JSON.')
+    parser.add_argument('--clients', type = int, default = 1000, help = 'number of simulated clients')
+    parser.add_argument('--rate', type = float, default = 500, help = 'clients started per second')
+    parser.add_argument('--concurrency', type = int, default = 128, help = 'max clients running at the same time (sockets)')
+    parser.add_argument('--workers', type = int, default = 1, help = 'server processes, gt 1 runs a SO_REUSEPORT fleet')
+    parser.add_argument('--writers', type = int, default = 2, help = 'writer connections of every server process')
+    parser.add_argument('--batch-size', type = int, default = 500, help = 'records of a batch')
+    parser.add_argument('--flush-interval', type = float, default = 0.5, help = 'seconds before a batch is written')
+    parser.add_argument('--ack', action = 'store_true', help = 'ask acks like the background client')
+    parser.add_argument('--verify-timeout', type = float, default = 1, help = 'seconds to wait for a verify answer')
+    parser.add_argument('--port', type = int, default = 0, help = 'server port, a free port by default')
+    parser.add_argument('--work-dir', default = '', help = 'folder of the temporary database, /dev/shm removes the disk from the test')
+    parser.add_argument('--output', default = '', help = 'write the result to this file, stdout by default')
+    parser.add_argument('--baseline', default = '', help = 'result of an older release, exit 1 if this one is worse')
+    parser.add_argument('--tolerance', type = float, default = 0.1, help = 'relative change allowed against the baseline')
+    args = parser.parse_args()
+    result = run_bench(args.clients, args.rate, args.concurrency, args.workers, args.ack, args.verify_timeout, args.port, args.work_dir,
+        {'writers': args.writers, 'batch_size': args.batch_size, 'flush_interval': args.flush_interval})
+    regressions = []
+    if args.baseline != '':
+        with open(args.baseline, mode = 'r') as ihandle:
+            baseline = json.load(ihandle)
+        if baseline['config'] != result['config']:
+            sys.stderr.write('WARNING config of the baseline is different, the results may not be comparable\n')
+        regressions = compare(result, baseline, args.tolerance)
+        result['regressions'] = regressions
+    if args.output != '':
+        with open(args.output, mode = 'w') as ohandle:
+            json.dump(result, ohandle, indent = 2)
+    else:
+        json.dump(result, sys.stdout, indent = 2)
+        sys.stdout.write('\n')
+    for every_regression in regressions:
+        sys.stderr.write('REGRESSION %s\n' % every_regression)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()